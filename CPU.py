@@ -1,6 +1,90 @@
+from collections import namedtuple
+import time
 from myhdl import intbv, bin
-from mem import Memory
+from mem import Memory, MemoryFault, WatchpointHit
+from decoder import IllegalInstruction
+import decoder
 import syscalls
+import tracing
+
+# Text section bounds, from memory-layout.txt. Only instructions in this range are kept in the decode cache.
+_add_text_base = 0x0000
+_add_text_limit = 0x1000
+
+"""
+    Decoded form of one instruction, as kept in the decode cache.
+        name: mnemonic of the instruction
+        rd, rs1, rs2: register indices (None if the format does not have them)
+        imm: sign-extended immediate as an int (None if the format does not have one)
+        execute: callable taking no arguments, runs the instruction on the CPU it was decoded for
+"""
+DecodedInstruction = namedtuple('DecodedInstruction', ['name', 'rd', 'rs1', 'rs2', 'imm', 'execute'])
+
+# Reasons for CPU.run() to stop
+STOP_EXIT = 'exit'                        # exit syscall, exit_code is set
+STOP_HALT = 'halt'                        # halt syscall
+STOP_EBREAK = 'ebreak'                    # ebreak instruction, pc is left after it
+STOP_STEP_LIMIT = 'step_limit'            # max_steps instructions retired
+STOP_UNTIL_PC = 'until_pc'                # pc reached until_pc
+STOP_PC_OUT_OF_RANGE = 'pc_out_of_range'  # pc left the text section
+STOP_MEMORY_FAULT = 'memory_fault'        # load or store outside the memory, fault_address is set
+STOP_ILLEGAL_INSTRUCTION = 'illegal_instruction'  # pc is on a word that is not an instruction, see decoder.py
+STOP_WAIT = 'wait'                        # wait syscall blocked the hart, pc is left after the ecall (harts.py)
+STOP_BREAKPOINT = 'breakpoint'            # pc reached one of the breakpoints of the CPU
+STOP_WATCHPOINT = 'watchpoint'            # the instruction at pc accesses a watched address, fault_address is set
+
+"""
+    Result of CPU.run()
+        reason: one of the STOP_ values above
+        exit_code: code passed to the exit syscall, None for other reasons
+        retired: number of instructions retired by this run
+        time: wall time of the run in seconds
+        pc: pc when the run stopped
+        fault_address: address of the faulting access for STOP_MEMORY_FAULT (the watched one for STOP_WATCHPOINT),
+                       None otherwise
+"""
+RunResult = namedtuple('RunResult', ['reason', 'exit_code', 'retired', 'time', 'pc', 'fault_address'])
+
+
+class Breakpoint(Exception):
+    """
+    Raised by ebreak to stop CPU.run()
+    """
+
+
+def stopReason(cpu, signal: Exception):
+    """
+    Map an exception raised while executing an instruction to the reason the run stops.
+    Anything that is not a signal from the guest is raised again.
+    Returns: (reason, exit code, fault address, whether the raising instruction retired)
+    """
+    if isinstance(signal, syscalls.SyscallExit):
+        return STOP_EXIT, signal.code, None, True
+    if isinstance(signal, syscalls.SyscallHalt):
+        return STOP_HALT, None, None, True
+    if isinstance(signal, syscalls.SyscallWait):
+        cpu.pc += 4  # so the hart resumes after the ecall once it is woken
+        return STOP_WAIT, None, None, True
+    if isinstance(signal, Breakpoint):
+        cpu.pc += 4  # so a new run continues after the ebreak
+        return STOP_EBREAK, None, None, True
+    if isinstance(signal, MemoryFault):
+        return STOP_MEMORY_FAULT, None, signal.address, False
+    if isinstance(signal, WatchpointHit):
+        return STOP_WATCHPOINT, None, signal.address, False
+    if isinstance(signal, IllegalInstruction):
+        return STOP_ILLEGAL_INSTRUCTION, None, None, False
+    raise signal
+
+
+def illegalInstruction(illegal: IllegalInstruction) -> DecodedInstruction:
+    """
+    Decoded form of an illegal instruction: it traps when it is executed, not when it is decoded,
+    so a word that is never reached (e.g. data after the last instruction of a block) does no harm.
+    """
+    def execute():
+        raise illegal
+    return DecodedInstruction('illegal', None, None, None, None, execute)
 
 
 class CPU:
@@ -12,316 +96,120 @@ class CPU:
             4- Execute instructions
     """
     # Constructor of CPU
-    def __init__(self, ram: Memory):
+    def __init__(self, ram: Memory, trace: int = tracing.TRACE_OFF):
         """
             CPU constructor
             This initializes the registers
-            Input: instance of the memory
+            Input: instance of the memory, trace level (see tracing.py)
         """
         self.regs = [intbv(0)[32:0] for i in range(32)]  # The Registers. Just a typical list
         self.pc = 0
         self.ram = ram
         self.jump_flag = False
+        self.breakpoints = set()  # run() stops before executing the instruction at these pcs, see debugger.py
+        # Decode cache, one slot per word of the text section. None means not decoded yet.
+        self.decode_cache = [None] * ((_add_text_limit - _add_text_base) >> 2)
+        self.trace = trace
+        if trace != tracing.TRACE_OFF:
+            # Decided once here, so the untraced fetch() does not test the trace level on every instruction
+            self.fetch = tracing.traced(self, self.fetch, trace)
 
     # =========== Fetching Area =========== #
     """
         Fetch the next instruction from the memory.
+        Instructions in the text section are decoded once and then served from the decode cache.
     """
 
     def fetch(self):
         self.jump_flag = False
         self.regs[0] = intbv(0)
-        inst = self.ram.readWord(self.pc)
-        inst = int.from_bytes(inst, byteorder='little')
-        self.decode(intbv(inst)[32:])
+        self.lookup(int(self.pc)).execute()
+
+    def lookup(self, pc: int) -> DecodedInstruction:
+        """
+        Returns the decoded instruction at pc, from the decode cache if it was decoded before.
+        """
+        if _add_text_base <= pc < _add_text_limit:
+            index = (pc - _add_text_base) >> 2
+            decoded = self.decode_cache[index]
+            if decoded is None:
+                decoded = self.decode(self._readInstruction(pc))
+                self.decode_cache[index] = decoded
+            return decoded
+        return self.decode(self._readInstruction(pc))
+
+    def run(self, max_steps: int = None, until_pc: int = None) -> RunResult:
+        """
+        Run the fetch/execute loop until the guest or one of the limits stops it.
+        Args:
+            max_steps: stop after retiring this many instructions. None for no limit
+            until_pc: stop when pc reaches this address, before executing the instruction there
+        Returns: RunResult
+        """
+        fetch = self.fetch
+        # One set lookup per instruction covers until_pc and the breakpoints, whether there are any or not
+        stops = self.breakpoints if until_pc is None else self.breakpoints | {until_pc}
+        retired = 0
+        exit_code = None
+        fault_address = None
+        start = time.perf_counter()
+        try:
+            while True:
+                pc = self.pc
+                if pc in stops:
+                    reason = STOP_UNTIL_PC if pc == until_pc else STOP_BREAKPOINT
+                    break
+                if not _add_text_base <= pc < _add_text_limit:
+                    reason = STOP_PC_OUT_OF_RANGE
+                    break
+                if retired == max_steps:
+                    reason = STOP_STEP_LIMIT
+                    break
+                fetch()
+                retired += 1
+                if not self.jump_flag:
+                    self.pc += 4
+        except Exception as signal:
+            reason, exit_code, fault_address, completed = stopReason(self, signal)
+            retired += completed
+        return RunResult(reason, exit_code, retired, time.perf_counter() - start, int(self.pc), fault_address)
+
+    def _readInstruction(self, address: int) -> intbv:
+        return intbv(self.ram.fetchWordAsInt(address))[32:]
+
+    def invalidate(self, address: int, width: int = 1):
+        """
+        Drop the decode cache entries covering address .. address+width-1.
+        Called on stores, so code that writes over the text section is decoded again.
+        """
+        first = max(address, _add_text_base)
+        last = min(address + width - 1, _add_text_limit - 1)
+        for index in range((first - _add_text_base) >> 2, ((last - _add_text_base) >> 2) + 1):
+            self.decode_cache[index] = None
 
     # =========== Decoding Area =========== #
     """
-        Get the following:
-            Opcode
-            Rs1
-            Rs2
-            Rd
-            func7
-            func3
-            imm if available ... etc
-        and pass the suitable arguments to the appropriate execution function, based on opcode, func3 and func7.
+        The fields, mnemonic and immediate come from the dispatch tables of decoder.py.
+        decode() returns a DecodedInstruction whose execute() calls the appropriate execution function
+        with the fields, see _executors at the end of this file.
+        Register values are read when the instruction is executed, not when it is decoded,
+        so the result can be cached and executed many times.
     """
 
-    def decode(self, passed_instruction):
-        data_holder = passed_instruction
-
-        # opcode for R I S B U J types.
-        # _____________[R inst]___[I inst]___[I(LOAD)]__[I(JALR)]___[I(sys calls)]
-        key_opcodes = [0b0110011, 0b0010011, 0b0000011, 0b1100111, 0b1110011,
-                       0b0100011, 0b1100011, 0b0110111, 0b0010111, 0b1101111]
-        # _____________[S inst]___[B inst]___[U(LUI)]___[U(AUIPC)]__[J(JAL)]
-
-        # Identify the opcode:
-        for i in range(len(key_opcodes)):
-            if data_holder[7:0] == key_opcodes[i]:
-                if i == 0:
-                    print('Type is: ', 'R')
-                    type_t = 'R'
-                if i == 1:
-                    print('Type is: ', 'I')
-                    type_t = 'I1'
-                if i == 2:
-                    print('Type is: ', 'I')
-                    type_t = 'I2'
-                if i == 3:
-                    print('Type is: ', 'I')
-                    type_t = 'I3'
-                if i == 4:
-                    print('Type is: ', 'I')
-                    type_t = 'I4'
-                if i == 5:
-                    print('Type is: ', 'S')
-                    type_t = 'S'
-                if i == 6:
-                    print('Type is: ', 'B')
-                    type_t = 'B'
-                if i == 7:
-                    print('Type is: ', 'U')
-                    type_t = 'U1'
-                if i == 8:
-                    print('Type is: ', 'U')
-                    type_t = 'U2'
-                if i == 9:
-                    print('Type is: ', 'J')
-                    type_t = 'J'
-
-        # ------------ R type decoding section ------------#
-        if type_t == 'R':
-            rd = data_holder[12:7]
-            rs1 = data_holder[20:15]
-            rs2 = data_holder[25:20]
-            funct3 = data_holder[15:12]
-            funct7 = data_holder[32:25]
-            """
-            Important note: the numbers printed below of rs1 rs2 and rd are hex. don't get confused.
-            """
-            # Show the data for debugging
-            print("Type R: func7: " + str(funct7) +
-                  "\t func3: " + str(funct3) +
-                  "\t rs1: " + str(rs1) +
-                  "\t rs2: " + str(rs2) +
-                  "\t rd: " + str(rd))
-
-            # look for the correct instruction via func3 and func7
-            if funct3 == 0b000:
-                if funct7 == 0x0:  # ADD
-                    self.ADD(self.regs[rs1], self.regs[rs2], rd)
-                if funct7 == 0x20:  # SUB
-                    self.SUB(self.regs[rs1], self.regs[rs2], rd)
-
-            if funct3 == 0x4 and funct7 == 0x0:  # XOR
-                self.XOR(self.regs[rs1], self.regs[rs2], rd)
-            if funct3 == 0x6 and funct7 == 0x0:  # OR
-                self.OR(self.regs[rs1], self.regs[rs2], rd)
-            if funct3 == 0x7 and funct7 == 0x0:  # AND
-                self.AND(self.regs[rs1], self.regs[rs2], rd)
-            if funct3 == 0x1 and funct7 == 0x0:  # sll
-                self.SHIFT(self.regs[rs1], self.regs[rs2], rd, 'l')
-            if funct3 == 0x5 and funct7 == 0x0:  # srl
-                self.SHIFT(self.regs[rs1], self.regs[rs2], rd)
-            if funct3 == 0x5 and funct7 == 0x20:  # sra
-                self.SHIFT(self.regs[rs1], self.regs[rs2], rd, 'r', True)
-
-            if funct3 == 0x2 and funct7 == 0x0:  # slt
-                self.COMPARE(rs1, rs2, rd, signed=True, cond='l')
-            if funct3 == 0x3 and funct7 == 0x0:  # sltu
-                self.COMPARE(rs1, rs2, rd, signed=False, cond='l')
-
-            # RV32M extension
-            if funct3 == 0x0 and funct7 == 0x01:
-                self.MUL(self.regs[rs1], self.regs[rs2], rd)
-            if funct3 == 0x1 and funct7 == 0x01:
-                self.MUL(self.regs[rs1], self.regs[rs2], rd)
-            if funct3 == 0x2 and funct7 == 0x01:
-                self.MUL(self.regs[rs1], self.regs[rs2], 'SU')
-            if funct3 == 0x3 and funct7 == 0x01:
-                self.MUL(self.regs[rs1], self.regs[rs2], 'U')
-            if funct3 == 0x4 and funct7 == 0x01:
-                self.DIV(self.regs[rs1], self.regs[rs2], rd)
-            if funct3 == 0x5 and funct7 == 0x01:
-                self.DIV(self.regs[rs1], self.regs[rs2], rd, False)
-            if funct3 == 0x6 and funct7 == 0x01:
-                self.REM(self.regs[rs1], self.regs[rs2], rd)
-            if funct3 == 0x7 and funct7 == 0x01:
-                self.REM(self.regs[rs1], self.regs[rs2], rd, False)
-
-        # ------------ I type decoding section ------------#
-        if type_t == 'I1':  # Normal I type (Arithmetic and logic)
-            rd = data_holder[12:7]
-            funct3 = data_holder[15:12]
-            rs1 = data_holder[20:15]
-            imm = data_holder[32:20]
-
-            # print for debugging
-            print("Type I1: imm: " + str(imm) +
-                  "\t func3: " + str(funct3) +
-                  "\t rs1: " + str(rs1) +
-                  "\t rd: " + str(rd))
-
-            if funct3 == 0x0:
-                self.ADD(self.regs[rs1], imm, rd)
-            if funct3 == 0x4:
-                self.XOR(self.regs[rs1], imm, rd)
-            if funct3 == 0x6:
-                self.OR(self.regs[rs1], imm, rd)
-            if funct3 == 0x7:
-                self.AND(self.regs[rs1], imm, rd)
-            if funct3 == 0x1 and imm == 0x0:
-                self.SHIFT(self.regs[rs1], imm, rd)
-            if funct3 == 0x5 and imm == 0x0:
-                self.SHIFT(self.regs[rs1], imm, rd)
-            if funct3 == 0x5 and imm == 0x20:
-                self.SHIFT(self.regs[rs1], imm, rd)
-            if funct3 == 0x2:
-                self.COMPARE(self.regs[rs1], imm, rd, 'le', signed=True)
-            if funct3 == 0x3:
-                self.COMPARE(self.regs[rs1], imm, rd, 'le', signed=False)
-
-        if type_t == 'I2':  # Load instructions
-            rd = data_holder[12:7]
-            funct3 = data_holder[15:12]
-            rs1 = data_holder[20:15]
-            imm = data_holder[32:20]
-            print("Type I2: imm: " + str(imm) +
-                  "\t func3: " + str(funct3) +
-                  "\t rs1: " + str(rs1) +
-                  "\t rd: " + str(rd))
-
-            if funct3 == 0x0:
-                self.LOAD(rd, rs1, imm)
-            if funct3 == 0x1:
-                self.LOAD(rd, rs1, imm, 2)
-            if funct3 == 0x2:
-                self.LOAD(rd, rs1, imm, 4)
-            if funct3 == 0x4:
-                self.LOAD(rd, rs1, imm, False)
-            if funct3 == 0x5:
-                self.LOAD(rd, rs1, imm, 2, False)
-
-        if type_t == 'I3':  # Jump instructions (JALR)
-            rd = data_holder[12:7]
-            funct3 = data_holder[15:12]
-            rs1 = data_holder[20:15]
-            imm = data_holder[32:20]
-            imm = intbv(imm.signed())[32:0]  # Sign extend imm to 32 bits to prepare for addition with register rs1
-            print("Type I3: imm: " + str(imm) +
-                  "\t func3: " + str(funct3) +
-                  "\t rs1: " + str(rs1) +
-                  "\t rd: " + str(rd))
-            self.JALR(rd, rs1, imm)
-
-        if type_t == 'I4':  # System calls
-            rd = data_holder[12:7]
-            funct3 = data_holder[15:12]
-            rs1 = data_holder[20:15]
-            imm = data_holder[32:20]
-
-            print("Type I4: imm: " + str(imm) +
-                  "\t func3: " + str(funct3) +
-                  "\t rs1: " + str(rs1) +
-                  "\t rd: " + str(rd))
-
-            if imm == 0x0:
-                self.ecall()
-            if imm == 0x1:
-                self.ebreak()
-            # ------------ I type decoding section ------------#
-
-            # ------------ S type decoding section ------------#
-        if type_t == 'S':
-            rs1 = data_holder[20:15]
-            rs2 = data_holder[25:20]
-            funct3 = data_holder[15:12]
-
-            imm = intbv(0)[12:]  # empty 12 bits
-            # imm bits -> 0, 1, 2, 3,  4,  5,  6,  7,  8,  9,  10, 11
-            bits_order = [7, 8, 9, 10, 11, 25, 26, 27, 28, 29, 30, 31]  # mapping of immediate bits from the instruction
-            for i in range(12):
-                # shift each bit by the appropriate amount
-                # bit 0 (data_holder[7]) is shifted by 0 , bit 1 (data_holder[8]) shifted by 1 ... etc
-                imm += intbv(data_holder[bits_order[i]] << i)
-
-            print("Type S: imm: " + str(imm) +
-                  "\t func3: " + str(funct3) +
-                  "\t rs1: " + str(rs1) +
-                  "\t rs2: " + str(rs2))
-
-            # change the imm to intbv
-            if funct3 == 0x0:
-                self.STORE(rs1, rs2, imm, width=1)
-            if funct3 == 0x1:
-                self.STORE(rs1, rs2, imm, width=2)
-            if funct3 == 0x2:
-                self.STORE(rs1, rs2, imm, width=4)
-
-            # ------------ B type execution section ------------#
-        if type_t == 'B':
-            imm = intbv(0)[13:]
-            # imm bits -> 0, 1, 2,  3,  4,  5,  6,  7,  8,  9, 10, 11
-            bits_order = [8, 9, 10, 11, 25, 26, 27, 28, 29, 30, 7, 31]
-            for i in range(12):
-                # shift each bit by the appropriate amount
-                # bit 0 (data_holder[8]) is shifted by 0 , bit 1 (data_holder[9]) shifted by 1 ... etc
-                imm += intbv(data_holder[bits_order[i]] << i)
-
-            imm = int(intbv(imm)[12:].signed() << 1)  # shift immediate one to the left
-            imm = intbv(imm).signed()[32:]  # make immediate signed
-            funct3 = data_holder[15:12]
-            rs1 = data_holder[20:15]
-            rs2 = data_holder[25:20]
-            # print for debug
-            print("Type B: imm: " + str(imm) +
-                  "\t func3: " + str(funct3) +
-                  "\t rs1: " + str(rs1) +
-                  "\t rs2: " + str(rs2))
-
-            if funct3 == 0x0:
-                self.BRANCH(rs1, rs2, imm, 'e')
-            if funct3 == 0x1:
-                self.BRANCH(rs1, rs2, imm, 'ne')
-            if funct3 == 0x4:
-                self.BRANCH(rs1, rs2, imm, 'lt')
-            if funct3 == 0x5:
-                self.BRANCH(rs1, rs2, imm, 'ge')
-            if funct3 == 0x6:
-                self.BRANCH(rs1, rs2, imm, 'lt', False)
-            if funct3 == 0x7:
-                self.BRANCH(rs1, rs2, imm, 'ge', False)
-
-            # ------------ U type execution section ------------#
-        if type_t == 'U1':
-            rd = data_holder[12:7]
-            imm = data_holder[32:12]
-            print("Type LUI: imm: " + str(imm) + "\t rd: " + str(rd))
-            self.LUI(rd, imm)
-        if type_t == 'U2':
-            rd = data_holder[12:7]
-            imm = data_holder[32:12]
-            print("Type AUIPC: imm: " + str(imm) + "\t rd: " + str(rd))
-            self.AUIPC(rd, imm)
-
-        if type_t == 'J':
-            rd = data_holder[12:7]
-            imm = intbv(0)[21:]
-            # imm bits -> 0,  1,  2,   3,  4,  5,  6,  7,  8,  9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19
-            bits_order = [21, 22, 23, 24, 25, 26, 27, 28, 29, 30, 20, 12, 13, 14, 15, 16, 17, 18, 19, 31]
-            for i in range(20):
-                # shift each bit by appropriate amount
-                # imm[0]->data_holder[21]<<0. imm[1]->data_holder[22]<<1. etc.
-                imm += intbv(data_holder[bits_order[i]] << i)
-            imm = intbv(imm << 1)[21:]  # Shift left one bit
-            # Sign extend the immediate to 32 bits, since it will be added to pc(32 bits)
-            # and also make it signed
-            imm = intbv(imm.signed())[32:]
-            print("Type JAL: imm: " + str(imm) + "\t rd: " + str(rd))
-
-            self.JAL(rd, imm)
+    def decode(self, passed_instruction) -> DecodedInstruction:
+        try:
+            fields = decoder.decode(int(passed_instruction))
+        except IllegalInstruction as illegal:
+            return illegalInstruction(illegal)
+        return self.decodeFields(fields)
+
+    def decodeFields(self, fields) -> DecodedInstruction:
+        """
+        Build the DecodedInstruction of fields decoder.decode() returned, e.g. kept by codecache.py
+        """
+        name, rd, rs1, rs2, imm = fields
+        execute = _executors[name](self, rd, rs1, rs2, imm)
+        return DecodedInstruction(name, rd, rs1, rs2, imm, execute)
     # =============================== End of Decoding =============================== #
 
     # ================================= Execution Area ================================= #
@@ -341,15 +229,16 @@ class CPU:
     def AND(self, arg1, arg2, rd):
         self.regs[rd] = intbv(arg1 & arg2)[32:]
 
-    def SHIFT(self, arg1: intbv, arg2: intbv, rd, dir='r', signed=False):  # needs testing
+    def SHIFT(self, arg1: intbv, arg2, rd, dir='r', signed=False):
         """
         Shifts arg1 by amount of arg2
         Args:
             arg1: Number to be shifted
-            arg2: Shift amount
+            arg2: Shift amount, only its low 5 bits are used
             dir: direction of shift. By default is r. Set to l for shift left
             signed: Boolean flag for sign. By default is False. Set to True to enable sign extension
         """
+        arg2 = int(arg2) & 0x1f
         if dir == "r":
             if signed:
                 self.regs[rd] = intbv(arg1.signed() >> arg2)[32:]
@@ -385,51 +274,78 @@ class CPU:
         elif cond == "ge":
             self.regs[rd] = intbv(arg1 >= arg2)[32:]
 
-    def MUL(self, arg1: intbv, arg2: intbv, rd, sign='S'):
+    def MUL(self, arg1: intbv, arg2: intbv, rd, sign='S', high=False):
+        """
+        Multiply arg1 by arg2, keeping the low or the high 32 bits of the 64 bit product.
+        Args:
+            sign: S for signed * signed, SU for signed * unsigned, U for unsigned * unsigned
+            high: keep the high 32 bits (mulh, mulhsu, mulhu) instead of the low ones (mul)
+        """
         # I considered the notation (s)(u) to mean arg1 is signed, arg2 not signed
-        if sign.capitalize() == 'SU':
-            self.regs[rd] = intbv(arg1.signed() * arg2.unsigned())[32:]
-            return arg1.signed() * arg2.unsigned()
-        elif sign.capitalize() == 'U':
-            self.regs[rd] = intbv(arg1 * arg2)[32:]
-            return arg1 * arg2
-        elif sign.capitalize() == 'S':
-            self.regs[rd] = intbv(arg1.signed() * arg2.signed())[32:]
-            return arg1.signed() * arg2.signed()
+        if sign == 'SU':
+            product = arg1.signed() * int(arg2)
+        elif sign == 'U':
+            product = int(arg1) * int(arg2)
+        elif sign == 'S':
+            product = arg1.signed() * arg2.signed()
         else:
             print("Error: condition " + sign + " is not defined for MUL function")
+            return None
+        if high:
+            product >>= 32
+        self.regs[rd] = intbv(product & 0xFFFFFFFF)[32:]
+        return product
 
     def DIV(self, arg1: intbv, arg2: intbv, rd, signed=True):
+        """
+        Division rounding towards zero, as RISC-V defines it.
+        Division by zero gives -1 (all ones), INT_MIN / -1 overflows back to INT_MIN.
+        """
         if signed:
-            self.regs[rd] = intbv(arg1.signed() // arg2.signed())[32:]
-            return arg1.signed() // arg2.signed()
-        self.regs[rd] = intbv(arg1 // arg2)[32:]
-        return arg1 // arg2
+            arg1, arg2 = int(arg1.signed()), int(arg2.signed())
+        else:
+            arg1, arg2 = int(arg1), int(arg2)
+        if arg2 == 0:
+            result = -1
+        else:
+            result = abs(arg1) // abs(arg2)
+            if (arg1 < 0) != (arg2 < 0):
+                result = -result
+        self.regs[rd] = intbv(result)[32:]
+        return result
 
     def REM(self, arg1: intbv, arg2: intbv, rd, signed=True):
+        """
+        Remainder of DIV, takes the sign of the dividend.
+        Remainder by zero gives the dividend, INT_MIN % -1 gives 0.
+        """
         if signed:
-            self.regs[rd] = intbv(arg1.signed() % arg2.signed())[32:]
-            return arg1.signed() % arg2.signed()
-        self.regs[rd] = intbv(arg1 % arg2)[32:]
-        return arg1 % arg2
+            arg1, arg2 = int(arg1.signed()), int(arg2.signed())
+        else:
+            arg1, arg2 = int(arg1), int(arg2)
+        if arg2 == 0:
+            result = arg1
+        else:
+            result = abs(arg1) % abs(arg2)
+            if arg1 < 0:
+                result = -result
+        self.regs[rd] = intbv(result)[32:]
+        return result
 
     # -------------------------- instructions of load -------------------------- #
-    def LOAD(self, rd, rs1, imm: intbv, width=1, signed=True):
+    def LOAD(self, rd, rs1, imm: int, width=1, signed=True):
         """
         Executes load instructions.
         Load the value of memory address [ register rs1+imm value(offset) ] into register rd
         Args:
             rd: destination register
             rs1: source register
-            imm: immediate value, represents offset
+            imm: sign-extended immediate value, represents offset
             width: number of bytes. can be 1, 2, or 4 for byte, half word, or word
-            signed: boolean flag. Set to True by default. Set to False to enable unsigned immediate
+            signed: boolean flag. Set to True by default. Set to False to zero extend the loaded value
         """
         # These instructions take the form lb rd, imm(rs1)
-        if signed:
-            imm = imm.signed()
-        src = intbv(self.regs[rs1])[32:0]
-        target_address = src + imm
+        target_address = (int(self.regs[rs1]) + imm) & 0xFFFFFFFF
         loaded_bytes = None
         if width == 1:
             loaded_bytes = self.ram.read(target_address)
@@ -440,40 +356,43 @@ class CPU:
         else:
             print("Error: please enter valid load width")
             exit(0)
-        # Store the loaded byte as an integer in the destination reg
-        self.regs[rd] = intbv(int.from_bytes(loaded_bytes, 'little'))[32:]
+        # Store the loaded bytes as an integer in the destination reg, sign extended to 32 bits if signed
+        loaded = intbv(int.from_bytes(loaded_bytes, 'little'))[8 * width:]
+        self.regs[rd] = intbv(loaded.signed() if signed else loaded)[32:]
 
     # -------------------------- instructions of store -------------------------- #
-    def STORE(self, rs1, rs2, imm: intbv, width=1):
+    def STORE(self, rs1, rs2, imm: int, width=1):
         """
         Executes store instructions.
         Store the value found in rs2 into memory location stored in rs1+immediate(offset)
         Args:
             rs1: initial memory location
             rs2: register holding the value we want to store
-            imm: immediate value, represents offset
+            imm: sign-extended immediate value, represents offset
             width: number of bytes. Can be 1, 2, or 4
         Returns: None
         """
         if width > 4:
             print("Error, maximum width is 4")
 
-        src1 = intbv(self.regs[rs1])[32:0]
         src2 = int(intbv(self.regs[rs2])[8 * width:0]).to_bytes(width, 'little')
-        target_address = imm + src1
+        target_address = (int(self.regs[rs1]) + imm) & 0xFFFFFFFF
         # Loop, each time store one byte from src2 in the memory.
         for i in range(width):
             store_byte = src2[i].to_bytes(1, 'little')
             self.ram.write(target_address + i, store_byte)
+        # Self-modifying code: drop cached decodes of the overwritten instructions
+        if target_address < _add_text_limit:
+            self.invalidate(target_address, width)
 
     # -------------------------- Branch Instructions -------------------------- #
-    def BRANCH(self, rs1, rs2, imm: intbv, cond='e', signed=True):
+    def BRANCH(self, rs1, rs2, imm: int, cond='e', signed=True):
         """
         Execute branching instructions based on comparison conditions of two values
         Args:
             rs1: register source 1
             rs2: register source 2
-            imm: immediate value
+            imm: sign-extended immediate value, offset from pc
             cond: e for rs1==rs2, ne for !=, lt for <, ge for >=
             signed: boolean flag. True by default. Set to false to enable unsigned branch
         """
@@ -496,35 +415,33 @@ class CPU:
 
         if res:
             self.jump_flag = True
-            self.pc = self.pc + int(imm.signed())
+            self.pc = (self.pc + imm) & 0xFFFFFFFF
 
     # -------------------------- Jump instructions -------------------------- #
-    def JAL(self, rd, imm: intbv):
+    def JAL(self, rd, imm: int):
         """
         Jump by increasing pc by amount of imm. Save return address in rd
         Args:
             rd: saves return address
-            imm: immediate value. The pc will be incremented by this amount * 2
+            imm: sign-extended immediate value, offset from pc
         Returns:
         """
-        # make immediate a signed number
-        imm = imm.signed()
-
         self.regs[rd] = intbv(self.pc + 4)[32:0]  # Save return address in rd
         self.jump_flag = True  # update jump flag
-        self.pc = self.pc + imm  # jump
+        self.pc = (self.pc + imm) & 0xFFFFFFFF  # jump
 
-    def JALR(self, rd, rs1, imm: intbv):
+    def JALR(self, rd, rs1, imm: int):
         """
         Jump to address stored in rs1 + imm (immediate serves as offset, usually 0)
         Args:
             rd: saves return address
             rs1: contains the address to jump to
-            imm: immediate value, serves as offset. Usually 0
+            imm: sign-extended immediate value, serves as offset. Usually 0
         """
+        target = (int(self.regs[rs1]) + imm) & 0xFFFFFFFE  # read rs1 before rd is written, rd may be rs1
         self.regs[rd] = intbv(self.pc + 4)[32:0]
         self.jump_flag = True
-        self.pc = self.regs[rs1] + imm.signed()  # immediate is signed
+        self.pc = target
 
     # -------------------------- Instructions with large immediate -------------------------- #
     def LUI(self, rd, imm: intbv):
@@ -557,7 +474,109 @@ class CPU:
 
     # -------------------------- System calls -------------------------- #
     def ecall(self):
-        syscalls.handle(self.regs, self.ram)
+        syscalls.handle(self.regs, self.ram, self.invalidate)
 
     def ebreak(self):
-        pass
+        raise Breakpoint()
+
+
+# ------------------------------- Execution factories --------------------------------- #
+# Each one takes the CPU and the decoded fields and returns the closure that executes the instruction,
+# calling one of the execution functions above with the register values read when it runs.
+def _r_type(method, *args):
+    def factory(cpu: CPU, rd, rs1, rs2, imm):
+        regs = cpu.regs
+        return lambda: method(cpu, regs[rs1], regs[rs2], rd, *args)
+    return factory
+
+
+def _i_type(method, *args):
+    def factory(cpu: CPU, rd, rs1, rs2, imm):
+        regs = cpu.regs
+        operand = intbv(imm & 0xFFFFFFFF)[32:]  # Sign extended to 32 bits
+        return lambda: method(cpu, regs[rs1], operand, rd, *args)
+    return factory
+
+
+def _shift_immediate(*args):
+    def factory(cpu: CPU, rd, rs1, rs2, imm):
+        regs = cpu.regs
+        return lambda: cpu.SHIFT(regs[rs1], imm, rd, *args)
+    return factory
+
+
+def _load(width, signed):
+    return lambda cpu, rd, rs1, rs2, imm: lambda: cpu.LOAD(rd, rs1, imm, width, signed)
+
+
+def _store(width):
+    return lambda cpu, rd, rs1, rs2, imm: lambda: cpu.STORE(rs1, rs2, imm, width)
+
+
+def _branch(cond, signed=True):
+    return lambda cpu, rd, rs1, rs2, imm: lambda: cpu.BRANCH(rs1, rs2, imm, cond, signed)
+
+
+def _upper(method):
+    def factory(cpu: CPU, rd, rs1, rs2, imm):
+        upper = intbv((imm >> 12) & 0xFFFFF)[20:]
+        return lambda: method(cpu, rd, upper)
+    return factory
+
+
+_executors = {
+    # R type
+    'add': _r_type(CPU.ADD),
+    'sub': _r_type(CPU.SUB),
+    'sll': _r_type(CPU.SHIFT, 'l'),
+    'slt': _r_type(CPU.COMPARE, 'l', True),
+    'sltu': _r_type(CPU.COMPARE, 'l', False),
+    'xor': _r_type(CPU.XOR),
+    'srl': _r_type(CPU.SHIFT),
+    'sra': _r_type(CPU.SHIFT, 'r', True),
+    'or': _r_type(CPU.OR),
+    'and': _r_type(CPU.AND),
+    # RV32M extension
+    'mul': _r_type(CPU.MUL),
+    'mulh': _r_type(CPU.MUL, 'S', True),
+    'mulhsu': _r_type(CPU.MUL, 'SU', True),
+    'mulhu': _r_type(CPU.MUL, 'U', True),
+    'div': _r_type(CPU.DIV),
+    'divu': _r_type(CPU.DIV, False),
+    'rem': _r_type(CPU.REM),
+    'remu': _r_type(CPU.REM, False),
+    # I type (Arithmetic and logic)
+    'addi': _i_type(CPU.ADD),
+    'slti': _i_type(CPU.COMPARE, 'l', True),
+    'sltiu': _i_type(CPU.COMPARE, 'l', False),
+    'xori': _i_type(CPU.XOR),
+    'ori': _i_type(CPU.OR),
+    'andi': _i_type(CPU.AND),
+    'slli': _shift_immediate('l'),
+    'srli': _shift_immediate(),
+    'srai': _shift_immediate('r', True),
+    # Loads and stores
+    'lb': _load(1, True),
+    'lh': _load(2, True),
+    'lw': _load(4, False),
+    'lbu': _load(1, False),
+    'lhu': _load(2, False),
+    'sb': _store(1),
+    'sh': _store(2),
+    'sw': _store(4),
+    # Branches and jumps
+    'beq': _branch('e'),
+    'bne': _branch('ne'),
+    'blt': _branch('lt'),
+    'bge': _branch('ge'),
+    'bltu': _branch('lt', False),
+    'bgeu': _branch('ge', False),
+    'jal': lambda cpu, rd, rs1, rs2, imm: lambda: cpu.JAL(rd, imm),
+    'jalr': lambda cpu, rd, rs1, rs2, imm: lambda: cpu.JALR(rd, rs1, imm),
+    # Large immediates
+    'lui': _upper(CPU.LUI),
+    'auipc': _upper(CPU.AUIPC),
+    # System calls
+    'ecall': lambda cpu, rd, rs1, rs2, imm: cpu.ecall,
+    'ebreak': lambda cpu, rd, rs1, rs2, imm: cpu.ebreak,
+}
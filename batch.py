@@ -0,0 +1,150 @@
+# Batch runner: runs many guest programs across a pool of worker processes.
+# The workers are started once and reused, so myhdl and the emulator are imported once per worker.
+#
+# Usage: python batch.py manifest.jsonl [-o results.jsonl] [-j jobs] [--engine fast] [--max-steps N] [--timeout S]
+
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from CPU import STOP_EXIT, STOP_EBREAK, STOP_STEP_LIMIT
+from loader import engines, loadProgram, readMemFile
+import syscalls
+
+# Reasons a batch entry stops that CPU.run() does not have
+STOP_TIMEOUT = 'timeout'
+STOP_ERROR = 'error'
+
+_chunk_steps = 100000  # most instructions run between two checks of the timeout
+_first_chunk = 1000    # instructions of the first chunk, before the speed of the engine is known
+_check_interval = 0.02  # seconds between two checks of the timeout
+
+
+def readManifest(file_name: str) -> list:
+    """
+    Read a manifest, one JSON object per line:
+        text, data: paths of the text and data binaries, relative to the manifest
+        name: optional, defaults to the text path
+        max_steps: optional step limit for this program, overrides --max-steps
+        expected_exit: optional exit code the program has to return to pass
+    Returns: list of entries with the paths made absolute
+    """
+    base = os.path.dirname(os.path.abspath(file_name))
+    entries = list()
+    with open(file_name) as file:
+        for line in file:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            entry.setdefault('name', entry['text'])
+            entry['text'] = os.path.join(base, entry['text'])
+            entry['data'] = os.path.join(base, entry['data'])
+            entries.append(entry)
+    return entries
+
+
+def _initWorker():
+    # Workers share the directory, none of them may write mem-dump.bin
+    syscalls.dump_on_exit = False
+
+
+def runEntry(entry: dict, engine: str = 'fast', max_steps: int = None, timeout: float = None) -> dict:
+    """
+    Run one manifest entry and return its result record.
+    The guest runs in chunks of instructions, so a program that never exits is stopped by its step limit
+    or the timeout instead of holding the worker. With a timeout each chunk is sized from the speed of the
+    last one to take about _check_interval seconds, so the timeout is as close on intbv as on translate.
+    """
+    record = {'name': entry['name'], 'reason': None, 'exit_code': None, 'retired': 0, 'time': 0.0}
+    steps_left = entry.get('max_steps', max_steps)
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                cpu = loadProgram(readMemFile(entry['text']), readMemFile(entry['data']), engine)
+                chunk = _chunk_steps if timeout is None else _first_chunk
+                while True:
+                    result = cpu.run(chunk if steps_left is None else min(chunk, steps_left))
+                    if timeout is not None and result.time > 0:
+                        chunk = max(1, min(_chunk_steps, int(result.retired / result.time * _check_interval)))
+                    record['retired'] += result.retired
+                    if steps_left is not None:
+                        steps_left -= result.retired
+                    if result.reason == STOP_EBREAK:
+                        continue  # No debugger to stop for, carry on after the ebreak
+                    if result.reason == STOP_STEP_LIMIT and steps_left != 0:
+                        if timeout is not None and time.perf_counter() - start > timeout:
+                            record['reason'] = STOP_TIMEOUT
+                            break
+                        continue
+                    record['reason'] = result.reason
+                    record['exit_code'] = result.exit_code
+                    if result.fault_address is not None:
+                        record['fault_address'] = result.fault_address
+                    break
+            finally:
+                syscalls.flushOutput()  # Output of a guest that stopped without exit or halt
+    except Exception as error:
+        record['reason'] = STOP_ERROR
+        record['error'] = repr(error)
+    record['time'] = time.perf_counter() - start
+    record['stdout'] = stdout.getvalue()
+    record['stderr'] = stderr.getvalue()
+    if 'expected_exit' in entry:
+        record['expected_exit'] = entry['expected_exit']
+        record['passed'] = record['reason'] == STOP_EXIT and record['exit_code'] == entry['expected_exit']
+    return record
+
+
+def runBatch(entries: list, results_file, jobs: int = None, engine: str = 'fast',
+             max_steps: int = None, timeout: float = None) -> list:
+    """
+    Run the entries on a pool of jobs worker processes.
+    Each record is written to results_file as one JSON line as soon as its program finishes.
+    Returns: the records, in the order the programs finished
+    """
+    records = list()
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_initWorker) as pool:
+        futures = {pool.submit(runEntry, entry, engine, max_steps, timeout): entry for entry in entries}
+        for future in as_completed(futures):
+            try:
+                record = future.result()
+            except Exception as error:  # The worker itself died
+                record = {'name': futures[future]['name'], 'reason': STOP_ERROR, 'error': repr(error)}
+            results_file.write(json.dumps(record) + '\n')
+            results_file.flush()
+            records.append(record)
+    return records
+
+
+def parseArgs() -> dict:
+    parser = ArgumentParser(description='Run many guest programs in parallel')
+    parser.add_argument('manifest', type=str, help='JSON lines file of {"text", "data", "max_steps", "expected_exit"}')
+    parser.add_argument('-o', '--output', type=str, default='results.jsonl', help='JSON lines results file')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='worker processes, defaults to the CPU count')
+    parser.add_argument('--engine', choices=engines.keys(), default='fast')
+    parser.add_argument('--max-steps', type=int, default=None, help='default step limit of every program')
+    parser.add_argument('--timeout', type=float, default=None, help='wall time limit of every program, in seconds')
+    return vars(parser.parse_args())
+
+
+def main():
+    args = parseArgs()
+    entries = readManifest(args['manifest'])
+    start = time.perf_counter()
+    with open(args['output'], 'w') as results_file:
+        records = runBatch(entries, results_file, args['jobs'], args['engine'], args['max_steps'], args['timeout'])
+    failed = [record for record in records if record['reason'] == STOP_ERROR or record.get('passed') is False]
+    print('{} programs, {} failed, {:.2f} s'.format(len(records), len(failed), time.perf_counter() - start),
+          file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,114 @@
+# Benchmark runner: runs the guest programs of manifest.jsonl on each engine and reports
+# instructions retired, host time and MIPS, checks the exit codes and compares against a baseline.
+#
+# Usage: python benchmarks/bench.py [--engines fast,translate] [--only alu_loop,muldiv] [--repeat 3]
+#                                   [--output results.json] [--baseline baseline.json] [--save-baseline]
+#
+# The intbv engine runs about 15 thousand instructions per second, pass it in --engines only with --only.
+
+from argparse import ArgumentParser
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+
+_here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(_here))
+
+from batch import readManifest
+from loader import engines, loadProgram, readMemFile
+import syscalls
+
+
+def runBenchmark(entry: dict, engine: str, repeat: int) -> dict:
+    """
+    Run one benchmark repeat times on engine and keep the fastest run.
+    """
+    text = readMemFile(entry['text'])
+    data = readMemFile(entry['data'])
+    best = None
+    for i in range(repeat):
+        cpu = loadProgram(text, data, engine)
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = cpu.run()
+        if best is None or result.time < best.time:
+            best = result
+    return {'benchmark': entry['name'], 'engine': engine, 'retired': best.retired, 'time': best.time,
+            'mips': best.retired / best.time / 1e6, 'exit_code': best.exit_code,
+            'correct': best.exit_code == entry['expected_exit']}
+
+
+def compare(results: list, baseline: dict, tolerance: float) -> list:
+    """
+    Mark each result with its speed relative to the baseline.
+    Returns: the results that are more than tolerance slower than the baseline
+    """
+    reference = {(result['benchmark'], result['engine']): result['mips'] for result in baseline['results']}
+    regressions = list()
+    for result in results:
+        base = reference.get((result['benchmark'], result['engine']))
+        if base is None:
+            continue
+        result['baseline_mips'] = base
+        if result['mips'] < base * (1 - tolerance):
+            regressions.append(result)
+    return regressions
+
+
+def printTable(results: list, regressions: list):
+    print('{:<12} {:<10} {:>10} {:>9} {:>8} {:>12}'.format('benchmark', 'engine', 'retired', 'time (s)', 'MIPS',
+                                                          'vs baseline'))
+    for result in results:
+        change = ''
+        if 'baseline_mips' in result:
+            change = '{:+.1%}'.format(result['mips'] / result['baseline_mips'] - 1)
+        if result in regressions:
+            change += ' SLOWER'
+        if not result['correct']:
+            change += ' WRONG EXIT {}'.format(result['exit_code'])
+        print('{:<12} {:<10} {:>10} {:>9.3f} {:>8.2f} {:>12}'.format(
+            result['benchmark'], result['engine'], result['retired'], result['time'], result['mips'], change))
+
+
+def parseArgs() -> dict:
+    parser = ArgumentParser(description='Run the guest benchmarks')
+    parser.add_argument('--engines', type=str, default='fast,translate', help='comma separated engine names')
+    parser.add_argument('--only', type=str, default=None, help='comma separated benchmark names')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark, the fastest is kept')
+    parser.add_argument('--output', type=str, default=os.path.join(_here, 'results.json'))
+    parser.add_argument('--baseline', type=str, default=os.path.join(_here, 'baseline.json'))
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='slowdown flagged as a regression')
+    return vars(parser.parse_args())
+
+
+def main():
+    args = parseArgs()
+    syscalls.dump_on_exit = False
+    selected = args['engines'].split(',')
+    for engine in selected:
+        if engine not in engines:
+            print('Unknown engine ' + engine, file=sys.stderr)
+            return 2
+    entries = readManifest(os.path.join(_here, 'manifest.jsonl'))
+    if args['only']:
+        entries = [entry for entry in entries if entry['name'] in args['only'].split(',')]
+
+    results = [runBenchmark(entry, engine, args['repeat']) for entry in entries for engine in selected]
+    regressions = list()
+    if os.path.exists(args['baseline']) and not args['save_baseline']:
+        with open(args['baseline']) as file:
+            regressions = compare(results, json.load(file), args['tolerance'])
+    printTable(results, regressions)
+
+    report = {'python': platform.python_version(), 'machine': platform.machine(), 'results': results}
+    with open(args['baseline'] if args['save_baseline'] else args['output'], 'w') as file:
+        json.dump(report, file, indent=1)
+    wrong = [result for result in results if not result['correct']]
+    return 1 if regressions or wrong else 0
+
+
+if __name__ == '__main__':
+    exit(main())
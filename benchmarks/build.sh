@@ -0,0 +1,16 @@
+#!/bin/bash
+# Rebuild the benchmark binaries from src/. Only needed after editing a source,
+# the binaries are committed so running the benchmarks needs no cross toolchain.
+# Needs llvm-mc and llvm-objcopy with the RISCV target.
+cd "$(dirname "$0")"
+for source in src/*.s; do
+    name=$(basename "$source" .s)
+    llvm-mc -triple=riscv32 -mattr=+m,-relax -filetype=obj "$source" -o "$name.o" || exit 1
+    llvm-objcopy -O binary -j .text "$name.o" "$name.text" || exit 1
+    rm "$name.o"
+    if [ -f "src/$name.data" ]; then
+        cp "src/$name.data" "$name.data"
+    else
+        : > "$name.data"
+    fi
+done
@@ -0,0 +1,19 @@
+# Tight ALU loop: add/xor/shift/or/and/sub on registers only.
+# Exit code: the final value of a0.
+    li t0, 0
+    li t1, 100000
+    li a0, 0x12345
+loop:
+    add a0, a0, t0
+    xor a0, a0, t1
+    slli t2, a0, 3
+    srli t3, a0, 29
+    or a0, t2, t3
+    andi t4, a0, 0x7ff
+    add a0, a0, t4
+    sra t5, a0, t0
+    xor a0, a0, t5
+    addi t0, t0, 1
+    bne t0, t1, loop
+    li a7, 93
+    ecall
@@ -0,0 +1,26 @@
+# Branch heavy: total Collatz steps of 1 .. 600, data dependent branches in a tight loop.
+# Exit code: the total number of steps.
+    li s0, 1               # n
+    li s1, 600             # last n
+    li a0, 0               # total steps
+next:
+    mv t0, s0
+collatz:
+    li t1, 1
+    beq t0, t1, done
+    andi t2, t0, 1
+    bnez t2, odd
+    srli t0, t0, 1
+    addi a0, a0, 1
+    j collatz
+odd:
+    slli t3, t0, 1
+    add t0, t0, t3
+    addi t0, t0, 1
+    addi a0, a0, 1
+    j collatz
+done:
+    addi s0, s0, 1
+    bgeu s1, s0, next
+    li a7, 93
+    ecall
@@ -0,0 +1,53 @@
+# memset and memcpy loops over a 2 KiB buffer in the data section, word and byte wise.
+# Exit code: sum of the words of the destination buffer.
+    li s0, 0x2000          # source buffer
+    li s1, 0x2800          # destination buffer
+    li s2, 0x800           # buffer size in bytes
+    li s3, 40              # repetitions
+    li s4, 0               # repetition counter
+repeat:
+    # memset(source, repetition, size), word wise
+    mv t0, s0
+    add t1, s0, s2
+    slli t2, s4, 8
+    or t2, t2, s4
+    slli t3, t2, 16
+    or t2, t2, t3
+memset:
+    sw t2, 0(t0)
+    addi t0, t0, 4
+    bltu t0, t1, memset
+    # memcpy(destination, source, size), word wise
+    mv t0, s0
+    mv t1, s1
+    add t3, s0, s2
+memcpy_words:
+    lw t4, 0(t0)
+    sw t4, 0(t1)
+    addi t0, t0, 4
+    addi t1, t1, 4
+    bltu t0, t3, memcpy_words
+    # memcpy of the first 512 bytes again, byte wise
+    mv t0, s0
+    mv t1, s1
+    addi t3, s0, 512
+memcpy_bytes:
+    lbu t4, 0(t0)
+    addi t4, t4, 1
+    sb t4, 0(t1)
+    addi t0, t0, 1
+    addi t1, t1, 1
+    bltu t0, t3, memcpy_bytes
+    addi s4, s4, 1
+    bne s4, s3, repeat
+    # checksum of the destination
+    mv t0, s1
+    add t1, s1, s2
+    li a0, 0
+checksum:
+    lw t4, 0(t0)
+    add a0, a0, t4
+    addi t0, t0, 4
+    bltu t0, t1, checksum
+    li a7, 93
+    ecall
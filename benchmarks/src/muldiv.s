@@ -0,0 +1,30 @@
+# MUL/DIV heavy: linear congruential generator mixed with every RV32M instruction.
+# Exit code: the accumulated checksum.
+    li t0, 0
+    li t1, 60000
+    li s0, 12345           # generator state
+    li s1, 1103515245
+    li s2, 7
+    li s3, -13
+    li a0, 0
+loop:
+    mul s0, s0, s1
+    addi s0, s0, 1234
+    mulh t2, s0, s1
+    mulhu t3, s0, s1
+    mulhsu t4, s0, s1
+    div t5, s0, s2
+    rem t6, s0, s3
+    divu a1, s0, s3
+    remu a2, s0, s2
+    add a0, a0, t2
+    xor a0, a0, t3
+    add a0, a0, t4
+    xor a0, a0, t5
+    add a0, a0, t6
+    xor a0, a0, a1
+    add a0, a0, a2
+    addi t0, t0, 1
+    bne t0, t1, loop
+    li a7, 93
+    ecall
@@ -0,0 +1,15 @@
+# Syscall heavy: 20000 print syscalls of the 8 byte message at the start of the data section.
+# Exit code: the number of prints.
+    li s0, 0
+    li s1, 20000
+loop:
+    li a0, 1               # stdout
+    li a1, 0x2000          # message
+    li a2, 8               # length
+    li a7, 64
+    ecall
+    addi s0, s0, 1
+    bne s0, s1, loop
+    mv a0, s0
+    li a7, 93
+    ecall
@@ -0,0 +1,26 @@
+# Recursive calls through JAL/JALR: naive fib(21), with the stack frames in memory.
+# Exit code: fib(21) = 10946.
+    li a0, 21
+    jal ra, fib
+    li a7, 93
+    ecall
+fib:
+    li t0, 2
+    blt a0, t0, fib_end
+    addi sp, sp, -12
+    sw ra, 8(sp)
+    sw s0, 4(sp)
+    sw s1, 0(sp)
+    mv s0, a0
+    addi a0, s0, -1
+    jal ra, fib
+    mv s1, a0
+    addi a0, s0, -2
+    jal ra, fib
+    add a0, a0, s1
+    lw s1, 0(sp)
+    lw s0, 4(sp)
+    lw ra, 8(sp)
+    addi sp, sp, 12
+fib_end:
+    jalr zero, 0(ra)
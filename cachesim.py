@@ -0,0 +1,191 @@
+# L1 instruction and data cache simulator.
+# A CacheSimulator wraps fetch() of a CPU, like the profiler does: each fetch is an access to the I-cache, and each
+# load or store an access to the D-cache, at the address the instruction is about to use.
+# Memory is not changed and the guest runs as before, the caches only count hits, misses and evictions.
+# Nothing is attached, and nothing is paid, while no cache is simulated.
+#
+# A cache keeps the line number (address >> line bits) held by each way in one flat list of ints, set after set.
+# With LRU replacement the ways of a set are kept most recently used first, so a hit moves one slice of the list
+# and a miss evicts the last way. Both caches allocate on a write miss, write-back traffic is not modelled.
+# The bulk memory syscalls (MEMCPY, MEMSET, MEMCMP) and the write syscall run on the host and are not simulated.
+
+from functools import partial
+import random
+from fastcpu import FastCPU
+import tracing
+
+_access_widths = {'lb': 1, 'lh': 2, 'lw': 4, 'lbu': 1, 'lhu': 2, 'sb': 1, 'sh': 2, 'sw': 4}
+
+# Replacement policies
+LRU = 'lru'
+RANDOM = 'random'
+policies = (LRU, RANDOM)
+
+_invalid = -1  # Line number of an empty way
+
+
+class Cache:
+    """
+        One set associative cache.
+        Args:
+            size: capacity in bytes, a power of two
+            line_size: bytes per line, a power of two
+            ways: lines per set, size / line_size for a fully associative cache
+            policy: LRU or RANDOM
+            seed: of the random replacement, so runs are reproducible
+    """
+    def __init__(self, size: int, line_size: int = 32, ways: int = 1, policy: str = LRU, seed: int = 0):
+        if size <= 0 or size & (size - 1) or line_size <= 0 or line_size & (line_size - 1):
+            raise ValueError('cache size and line size must be powers of two')
+        if ways <= 0 or size % (line_size * ways):
+            raise ValueError('a {} byte cache can not have {} ways of {} byte lines'.format(size, ways, line_size))
+        if policy not in policies:
+            raise ValueError('replacement policy must be one of ' + ', '.join(policies))
+        self.size = size
+        self.line_size = line_size
+        self.ways = ways
+        self.policy = policy
+        self.sets = size // (line_size * ways)
+        self.line_bits = line_size.bit_length() - 1
+        self.tags = [_invalid] * (self.sets * ways)  # Line number in each way, set after set
+        self.random = random.Random(seed)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.miss_pcs = dict()  # pc -> {line address: misses}
+
+    def access(self, address: int, pc: int) -> bool:
+        """
+        Access the line of address for the instruction at pc, and allocate it on a miss.
+        Returns: True on a hit
+        """
+        line = address >> self.line_bits
+        ways = self.ways
+        base = (line % self.sets) * ways
+        end = base + ways
+        tags = self.tags
+        try:
+            way = tags.index(line, base, end)
+        except ValueError:
+            way = None
+        if way is not None:
+            self.hits += 1
+            if way != base and self.policy == LRU:
+                tags[base + 1:way + 1] = tags[base:way]
+                tags[base] = line
+            return True
+        self.misses += 1
+        lines = self.miss_pcs.setdefault(pc, dict())
+        line_address = line << self.line_bits
+        lines[line_address] = lines.get(line_address, 0) + 1
+        if self.policy == LRU:
+            if tags[end - 1] != _invalid:
+                self.evictions += 1
+            tags[base + 1:end] = tags[base:end - 1]
+            tags[base] = line
+        else:
+            try:
+                way = tags.index(_invalid, base, end)
+            except ValueError:
+                way = base + self.random.randrange(ways)
+                self.evictions += 1
+            tags[way] = line
+        return False
+
+    def accesses(self) -> int:
+        return self.hits + self.misses
+
+    def missRate(self) -> float:
+        return self.misses / self.accesses() if self.accesses() else 0.0
+
+    def describe(self) -> str:
+        return '{} bytes, {} byte lines, {} ways, {} sets, {}'.format(self.size, self.line_size, self.ways,
+                                                                     self.sets, self.policy)
+
+
+def parseCache(spec: str) -> Cache:
+    """
+    Build a cache from 'SIZE:LINE_SIZE:WAYS[:POLICY]', e.g. '4096:32:2:lru'. Sizes take a k suffix, 4k = 4096.
+    """
+    fields = spec.split(':')
+    if len(fields) not in (3, 4):
+        raise ValueError('cache spec {!r} is not SIZE:LINE_SIZE:WAYS[:POLICY]'.format(spec))
+
+    def number(text: str) -> int:
+        return int(text[:-1], 0) * 1024 if text.lower().endswith('k') else int(text, 0)
+    return Cache(number(fields[0]), number(fields[1]), number(fields[2]), *fields[3:])
+
+
+class CacheSimulator:
+    """
+        Runs the accesses of a CPU through an I-cache and a D-cache.
+        Creating the simulator attaches it to the CPU, it simulates from then on.
+        Args:
+            cpu: any engine. TranslatingCPU runs on its interpreter while simulated
+            icache: Cache for instruction fetches, None not to simulate one
+            dcache: Cache for loads and stores, None not to simulate one
+    """
+    def __init__(self, cpu, icache: Cache = None, dcache: Cache = None):
+        self.cpu = cpu
+        self.icache = icache
+        self.dcache = dcache
+        self.attach()
+
+    def attach(self):
+        cpu = self.cpu
+        fetch = cpu.fetch
+        lookup = cpu.lookup
+        regs = cpu.regs
+        icache = self.icache
+        dcache = self.dcache
+        if getattr(cpu, 'translate_enabled', False):
+            # Whole blocks do not stop between instructions, run them on the interpreter
+            cpu.translate_enabled = False
+            fetch = partial(FastCPU.fetch, cpu)
+        icache_access = icache.access if icache else None
+        dcache_access = dcache.access if dcache else None
+        line_bits = icache.line_bits if icache else 0
+        last_line = [None]  # Line of the previous fetch, fetching it again is a hit that changes nothing
+        widths = _access_widths
+
+        def cachedFetch():
+            pc = int(cpu.pc)
+            if icache_access:
+                line = pc >> line_bits
+                if line == last_line[0]:
+                    icache.hits += 1
+                else:
+                    icache_access(pc, pc)
+                    last_line[0] = line
+            if dcache_access:
+                decoded = lookup(pc)
+                width = widths.get(decoded.name)
+                if width:
+                    address = (int(regs[decoded.rs1]) + decoded.imm) & 0xFFFFFFFF
+                    dcache_access(address, pc)
+                    end = address + width - 1
+                    if end >> dcache.line_bits != address >> dcache.line_bits:
+                        dcache_access(end, pc)  # A misaligned access across two lines
+            fetch()
+        cpu.fetch = cachedFetch
+
+    # =========== Report Area =========== #
+    def report(self, top: int = 10) -> str:
+        lines = list()
+        for name, cache in (('I-cache', self.icache), ('D-cache', self.dcache)):
+            if cache is None:
+                continue
+            if lines:
+                lines.append('')
+            lines.append('{}: {}'.format(name, cache.describe()))
+            lines.append('  accesses {:>12}  hits {:>12}  misses {:>10} ({:.2%})  evictions {:>10}'.format(
+                cache.accesses(), cache.hits, cache.misses, cache.missRate(), cache.evictions))
+            lines.append('  Most missing pcs:')
+            worst = sorted(cache.miss_pcs.items(), key=lambda item: sum(item[1].values()), reverse=True)[:top]
+            for pc, missed in worst:
+                addresses = sorted(missed.items(), key=lambda item: item[1], reverse=True)
+                lines.append('  {:#06x}  {:<24} {:>10} misses, lines {}{}'.format(
+                    pc, tracing.formatInstruction(self.cpu.lookup(pc)), sum(missed.values()),
+                    ' '.join('{:#x}'.format(address) for address, count in addresses[:4]),
+                    ' ...' if len(addresses) > 4 else ''))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,139 @@
+# Persistent cache of decoded and translated programs, for jobs that run the same binaries many times.
+# One file per program in the cache directory, named by its key: a hash of the text section, the engine and
+# its translation settings, the Python version and the source of the modules that decode and translate.
+# Changing any of them, or _format, gives another key, so a stale file is never read, only evicted.
+# A file is one marshal dump, read with a single read:
+#   (b'RVCODE', _format, key, {text word index: decoder.Fields tuple}, {entry pc: (block length, code object)})
+# A file that does not load (another format, cut short) counts as a miss and is written again.
+# Once the directory holds more than max_bytes, the least recently used files are deleted, a hit touches its file.
+
+import hashlib
+from importlib.util import MAGIC_NUMBER
+import marshal
+import os
+import tempfile
+from CPU import _add_text_base, _add_text_limit
+import CPU
+import decoder
+import fastcpu
+import translator
+
+_magic = b'RVCODE'
+_format = 1
+_suffix = '.rvcode'
+# Modules whose code decides what a decoded instruction or a block does
+_sources = (decoder, CPU, fastcpu, translator)
+_version_hash = None
+
+
+def _emulatorVersion() -> bytes:
+    global _version_hash
+    if _version_hash is None:
+        digest = hashlib.sha256(MAGIC_NUMBER)
+        for module in _sources:
+            with open(module.__file__, 'rb') as file:
+                digest.update(file.read())
+        _version_hash = digest.digest()
+    return _version_hash
+
+
+def _textBytes(cpu) -> bytes:
+    return bytes(cpu.ram.read_bytes(_add_text_base, min(_add_text_limit, cpu.ram.getSize()) - _add_text_base))
+
+
+class CodeCache:
+    """
+        Keeps the decode cache, and the blocks of TranslatingCPU, of each program between runs.
+        Args:
+            directory: the cache directory, made if missing
+            max_bytes: size the directory is trimmed to after a save
+    """
+    def __init__(self, directory: str, max_bytes: int = 64 << 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.loaded = None  # (key, decoded words, blocks) of the last load
+
+    def key(self, cpu) -> str:
+        digest = hashlib.sha256(_emulatorVersion())
+        digest.update(repr((_format, type(cpu).__name__, getattr(cpu, 'fusion_enabled', None),
+                            getattr(cpu, 'count_fusions', None))).encode())
+        digest.update(_textBytes(cpu))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + _suffix)
+
+    def load(self, cpu) -> bool:
+        """
+        Fill the decode cache and the blocks of a loaded CPU from the cache, before it runs.
+        Returns: True on a hit
+        """
+        key = self.key(cpu)
+        self.loaded = (key, 0, 0)
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                magic, version, file_key, fields, blocks = marshal.loads(file.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return False
+        if magic != _magic or version != _format or file_key != key:
+            return False
+        for index, decoded in fields.items():
+            if cpu.decode_cache[index] is None:
+                cpu.decode_cache[index] = cpu.decodeFields(decoder.Fields(*decoded))
+        if hasattr(cpu, 'loadBlock'):
+            for entry, (length, code) in blocks.items():
+                if entry not in cpu.blocks:
+                    cpu.loadBlock(entry, length, code)
+        self.loaded = (key, len(fields), len(blocks))
+        os.utime(path)  # Recently used
+        return True
+
+    def save(self, cpu) -> bool:
+        """
+        Write what cpu decoded and translated, after it ran. Nothing is written when the cache already had
+        all of it, or when the program wrote over its text.
+        Returns: True if the file was written
+        """
+        key = self.key(cpu)
+        if self.loaded is not None and self.loaded[0] != key:
+            return False  # Self-modifying code, the decodes are not the ones of the program as loaded
+        fields = {index: tuple(decoded[:5]) for index, decoded in enumerate(cpu.decode_cache)
+                  if decoded is not None and decoded.name != 'illegal'}
+        blocks = dict()
+        if hasattr(cpu, 'block_code') and not cpu.split_pcs:  # Blocks split for breakpoints are not kept
+            blocks = {entry: (cpu.block_lengths[entry], code) for entry, code in cpu.block_code.items()
+                      if cpu.blocks.get(entry) is not None}
+        if self.loaded is not None and self.loaded[1] >= len(fields) and self.loaded[2] >= len(blocks):
+            return False
+        os.makedirs(self.directory, exist_ok=True)
+        # Written aside and renamed, so a job running at the same time never reads half a file
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as file:
+            file.write(marshal.dumps((_magic, _format, key, fields, blocks)))
+        os.replace(temporary, self._path(key))
+        self.loaded = (key, len(fields), len(blocks))
+        self.evict()
+        return True
+
+    def evict(self):
+        """
+        Delete the least recently used files until the directory holds at most max_bytes.
+        """
+        files = list()
+        for name in os.listdir(self.directory):
+            if name.endswith(_suffix):
+                try:
+                    status = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:  # Evicted by another job
+                    continue
+                files.append((status.st_mtime, status.st_size, name))
+        total = sum(size for mtime, size, name in files)
+        for mtime, size, name in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
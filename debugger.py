@@ -0,0 +1,339 @@
+# Breakpoints, watchpoints and single-step for any engine, and a GDB remote serial protocol stub on top of them.
+#
+# Breakpoints are the breakpoints set of the CPU: run() stops when pc is in it (TranslatingCPU starts a block at
+# each breakpoint, so it only compares block entry pcs). Watchpoints are kept by the memory, per 4 KiB page,
+# see mem.py. A CPU without either runs exactly as fast as without a debugger.
+#
+#   ./team-2-riscv-vm program.elf --engine fast --gdb 1234
+#   riscv32-unknown-elf-gdb program.elf -ex 'target remote localhost:1234'
+
+import select
+import socket
+from CPU import STOP_EXIT, STOP_HALT, STOP_EBREAK, STOP_BREAKPOINT, STOP_WATCHPOINT, STOP_STEP_LIMIT, \
+    STOP_ILLEGAL_INSTRUCTION, _add_text_base, _add_text_limit
+from mem import WATCH_WRITE, WATCH_READ, WATCH_ACCESS
+from loader import setReg
+import syscalls
+
+
+class Debugger:
+    """
+        Controls a CPU for a debugger: breakpoints, watchpoints, single-step and continue.
+        Args:
+            cpu: any engine, loaded with the program
+    """
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.watchpoints = set()  # (address, length, WATCH_ kind)
+
+    def addBreakpoint(self, pc: int):
+        self.cpu.breakpoints.add(pc)
+
+    def removeBreakpoint(self, pc: int):
+        self.cpu.breakpoints.discard(pc)
+
+    def addWatchpoint(self, address: int, length: int, kind: int = WATCH_WRITE):
+        if (address, length, kind) in self.watchpoints:
+            return
+        first = not self.watchpoints
+        self.watchpoints.add((address, length, kind))
+        self.cpu.ram.addWatchpoint(address, length, kind)
+        if first:
+            self._dropDecodes()
+
+    def removeWatchpoint(self, address: int, length: int, kind: int = WATCH_WRITE):
+        if (address, length, kind) not in self.watchpoints:
+            return
+        self.watchpoints.discard((address, length, kind))
+        self.cpu.ram.removeWatchpoint(address, length, kind)
+        if not self.watchpoints:
+            self._dropDecodes()
+
+    def _dropDecodes(self):
+        """
+        Decoded instructions and blocks hold the memory methods, which watchpoints replace
+        """
+        self.cpu.invalidate(_add_text_base, _add_text_limit - _add_text_base)
+
+    def _runOne(self):
+        """
+        Run the instruction at pc, even if it has a breakpoint
+        """
+        breakpoints = self.cpu.breakpoints
+        self.cpu.breakpoints = set()
+        try:
+            return self.cpu.run(1)
+        finally:
+            self.cpu.breakpoints = breakpoints
+
+    def _completeAccess(self, hit):
+        """
+        Run the instruction that hit a watchpoint with the watchpoints off,
+        so it stops after the access the way GDB expects.
+        Returns: the RunResult of the hit, now after the instruction, or why the instruction stopped the run
+        """
+        self.cpu.ram.watching = False
+        try:
+            result = self._runOne()
+        finally:
+            self.cpu.ram.watching = True
+        if result.reason != STOP_STEP_LIMIT:
+            return result._replace(retired=hit.retired + result.retired)
+        return hit._replace(retired=hit.retired + 1, pc=result.pc)
+
+    def step(self):
+        """
+        Run one instruction.
+        Returns: RunResult, reason STOP_STEP_LIMIT if nothing else stopped it
+        """
+        result = self._runOne()
+        if result.reason == STOP_WATCHPOINT:
+            return self._completeAccess(result)
+        return result
+
+    def cont(self, max_steps: int = None):
+        """
+        Run from pc until a breakpoint, a watchpoint, the guest or max_steps stop it.
+        The instruction at pc runs even if it has a breakpoint, so cont() goes on from the last stop.
+        Returns: RunResult
+        """
+        result = self.step()
+        if result.reason != STOP_STEP_LIMIT or max_steps == 1:
+            return result
+        rest = self.cpu.run(None if max_steps is None else max_steps - 1)
+        if rest.reason == STOP_WATCHPOINT:
+            rest = self._completeAccess(rest)
+        return rest._replace(retired=result.retired + rest.retired, time=result.time + rest.time)
+
+
+# =========== GDB Remote Serial Protocol =========== #
+_signal_trap = 5
+_signal_illegal = 4
+_signal_segv = 11
+_pc_register = 32  # GDB numbers x0..x31, then pc
+_run_chunk = 10000  # instructions between two checks for a GDB interrupt
+_watch_packets = {'2': WATCH_WRITE, '3': WATCH_READ, '4': WATCH_ACCESS}
+_watch_names = {WATCH_WRITE: 'watch', WATCH_READ: 'rwatch', WATCH_ACCESS: 'awatch'}
+_target_xml = ('<?xml version="1.0"?><!DOCTYPE target SYSTEM "gdb-target.dtd">'
+               '<target version="1.0"><architecture>riscv:rv32</architecture></target>')
+
+
+def _checksum(data: bytes) -> bytes:
+    return b'%02x' % (sum(data) & 0xff)
+
+
+class GdbServer:
+    """
+        Serves one GDB connection on localhost, debugging the CPU with a Debugger.
+        Args:
+            cpu: any engine, loaded with the program
+            port: TCP port on 127.0.0.1, 0 picks a free one (see self.port)
+    """
+    def __init__(self, cpu, port: int = 1234):
+        self.cpu = cpu
+        self.debugger = Debugger(cpu)
+        self.listener = socket.create_server(('127.0.0.1', port))
+        self.port = self.listener.getsockname()[1]
+        self.connection = None
+        self.acknowledge = True  # Until GDB asks for QStartNoAckMode
+        self.result = None  # RunResult of the last continue or step
+        self.killed = False  # GDB killed the guest, it must not run on
+        self._received = b''
+
+    def serve(self):
+        """
+        Wait for GDB and answer its packets until it detaches, kills the guest or the guest exits.
+        After a detach the guest can carry on without the debugger.
+        Returns: the RunResult of the last continue or step, None if the guest never ran
+        """
+        self.connection, address = self.listener.accept()
+        self.listener.close()
+        try:
+            while True:
+                packet = self._readPacket()
+                if packet is None:
+                    break
+                reply = self.handle(packet)
+                if reply is None:
+                    break
+                self._sendPacket(reply)
+                if packet == 'QStartNoAckMode':
+                    self.acknowledge = False
+                if packet == 'D' or (packet[:1] in ('c', 's') and reply[:1] in ('W', 'X')):
+                    break
+        except ConnectionError:
+            pass  # GDB went away
+        finally:
+            self.connection.close()
+        return self.result
+
+    # =========== Packet Area =========== #
+    def _readByte(self) -> int:
+        if not self._received:
+            self._received = self.connection.recv(4096)
+            if not self._received:
+                raise ConnectionError('GDB closed the connection')
+        byte = self._received[0]
+        self._received = self._received[1:]
+        return byte
+
+    def _readPacket(self) -> str:
+        """
+        Returns: the data of the next packet, None if GDB closed the connection
+        """
+        try:
+            while self._readByte() != ord('$'):
+                pass  # acks and interrupts outside a run are ignored
+            data = bytearray()
+            byte = self._readByte()
+            while byte != ord('#'):
+                data.append(byte)
+                byte = self._readByte()
+            checksum = bytes((self._readByte(), self._readByte()))
+        except ConnectionError:
+            return None
+        if self.acknowledge:
+            self.connection.sendall(b'+' if checksum.lower() == _checksum(data) else b'-')
+        return data.decode('latin-1')
+
+    def _sendPacket(self, data: str):
+        payload = data.encode('latin-1')
+        self.connection.sendall(b'$' + payload + b'#' + _checksum(payload))
+        if self.acknowledge:
+            while self._readByte() != ord('+'):
+                pass
+
+    def _interrupted(self) -> bool:
+        """
+        Returns: whether GDB sent an interrupt (ctrl-c) while the guest runs
+        """
+        if not self._received and select.select([self.connection], [], [], 0)[0]:
+            self._received = self.connection.recv(4096)
+        if b'\x03' in self._received:
+            self._received = self._received.replace(b'\x03', b'')
+            return True
+        return False
+
+    # =========== Command Area =========== #
+    def handle(self, packet: str) -> str:
+        """
+        Returns: the reply to one packet, '' for packets this stub does not support, None to end the session
+        """
+        command, arguments = packet[:1], packet[1:]
+        if packet.startswith('qSupported'):
+            return 'PacketSize=4000;qXfer:features:read+;QStartNoAckMode+'
+        if packet == 'QStartNoAckMode':
+            return 'OK'  # serve() stops the acks once this is sent
+        if packet.startswith('qXfer:features:read:target.xml:'):
+            offset, length = (int(field, 16) for field in packet.split(':')[-1].split(','))
+            chunk = _target_xml[offset:offset + length]
+            return ('m' if offset + length < len(_target_xml) else 'l') + chunk
+        if packet == 'qAttached':
+            return '1'
+        if packet == 'qC':
+            return 'QC1'
+        if packet == 'qfThreadInfo':
+            return 'm1'
+        if packet == 'qsThreadInfo':
+            return 'l'
+        if command == 'H' or packet.startswith('T'):
+            return 'OK'
+        if command == '?':
+            return 'S%02x' % _signal_trap
+        if command == 'g':
+            return ''.join(self._register(index) for index in range(_pc_register + 1))
+        if command == 'G':
+            for index in range(_pc_register + 1):
+                self._setRegister(index, arguments[8 * index:8 * index + 8])
+            return 'OK'
+        if command == 'p':
+            index = int(arguments, 16)
+            return self._register(index) if index <= _pc_register else 'E01'
+        if command == 'P':
+            index, value = arguments.split('=')
+            if int(index, 16) > _pc_register:
+                return 'E01'
+            self._setRegister(int(index, 16), value)
+            return 'OK'
+        if command == 'm':
+            address, length = (int(field, 16) for field in arguments.split(','))
+            try:
+                return bytes(type(self.cpu.ram).read_bytes(self.cpu.ram, address, length)).hex()
+            except IndexError:
+                return 'E01'
+        if command == 'M':
+            location, data = arguments.split(':')
+            address, length = (int(field, 16) for field in location.split(','))
+            try:
+                type(self.cpu.ram).write_bytes(self.cpu.ram, address, bytes.fromhex(data))
+            except IndexError:
+                return 'E01'
+            self.cpu.invalidate(address, length)
+            return 'OK'
+        if command in ('Z', 'z'):
+            return self._point(command == 'Z', *arguments.split(',')[:3])
+        if command in ('c', 's'):
+            if arguments:
+                self.cpu.pc = int(arguments, 16)
+            self.result = self._continue() if command == 'c' else self.debugger.step()
+            return self._stopReply(self.result)
+        if command == 'D':
+            return 'OK'
+        if command == 'k':
+            self.killed = True
+            return None  # GDB does not wait for a reply
+        return ''
+
+    def _register(self, index: int) -> str:
+        value = int(self.cpu.pc) if index == _pc_register else int(self.cpu.regs[index])
+        return value.to_bytes(4, 'little').hex()
+
+    def _setRegister(self, index: int, hex_value: str):
+        value = int.from_bytes(bytes.fromhex(hex_value), 'little')
+        if index == _pc_register:
+            self.cpu.pc = value
+        elif index:
+            setReg(self.cpu, index, value)
+
+    def _point(self, insert: bool, kind: str, address: str, length: str) -> str:
+        address, length = int(address, 16), int(length, 16)
+        if kind in ('0', '1'):  # Software and hardware breakpoints are the same here
+            if insert:
+                self.debugger.addBreakpoint(address)
+            else:
+                self.debugger.removeBreakpoint(address)
+            return 'OK'
+        if kind in _watch_packets:
+            if insert:
+                self.debugger.addWatchpoint(address, length, _watch_packets[kind])
+            else:
+                self.debugger.removeWatchpoint(address, length, _watch_packets[kind])
+            return 'OK'
+        return ''
+
+    def _continue(self):
+        """
+        Continue in chunks of _run_chunk instructions, so a GDB interrupt can stop the guest
+        """
+        result = self.debugger.cont(_run_chunk)
+        retired = result.retired
+        while result.reason == STOP_STEP_LIMIT and not self._interrupted():
+            result = self.debugger.cont(_run_chunk)
+            retired += result.retired
+        return result._replace(retired=retired)
+
+    def _stopReply(self, result) -> str:
+        syscalls.flushOutput()
+        if result.reason == STOP_EXIT:
+            return 'W%02x' % (result.exit_code & 0xff)
+        if result.reason == STOP_HALT:
+            return 'X%02x' % _signal_trap
+        if result.reason == STOP_WATCHPOINT:
+            kind = next((kind for address, length, kind in self.debugger.watchpoints
+                         if address <= result.fault_address < address + length), WATCH_WRITE)
+            return 'T%02x%s:%x;' % (_signal_trap, _watch_names[kind], result.fault_address)
+        if result.reason in (STOP_STEP_LIMIT, STOP_BREAKPOINT, STOP_EBREAK):
+            return 'S%02x' % _signal_trap
+        if result.reason == STOP_ILLEGAL_INSTRUCTION:
+            return 'S%02x' % _signal_illegal
+        return 'S%02x' % _signal_segv  # Memory fault, or pc left the text section
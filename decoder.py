@@ -0,0 +1,152 @@
+# Table driven RV32IM decoder, shared by the engines.
+# The opcode and funct3 of a word select a key mask, the word under that mask packs
+# (opcode, funct3, funct7) (or funct12 for system instructions) and indexes the instruction table.
+# Immediates are put together from the word with fixed shift and mask formulas, one per format.
+# A word decodes with two dict lookups and a handful of integer operations.
+
+from collections import namedtuple
+
+"""
+    Fields of one decoded instruction.
+        name: mnemonic of the instruction
+        rd, rs1, rs2: register indices (None if the format does not have them)
+        imm: sign-extended immediate as an int (None if the format does not have one).
+             The shift amount for slli, srli and srai, funct12 for ecall and ebreak.
+"""
+Fields = namedtuple('Fields', ['name', 'rd', 'rs1', 'rs2', 'imm'])
+
+
+class IllegalInstruction(Exception):
+    """
+    Raised for a word that is not a RV32IM instruction this VM implements.
+    Args:
+        word: the instruction word
+    """
+    def __init__(self, word: int):
+        Exception.__init__(self, '{:#010x}'.format(word))
+        self.word = word
+
+
+# ------------------------------- Immediate formulas --------------------------------- #
+def _imm_i(inst: int) -> int:
+    return ((inst >> 20) ^ 0x800) - 0x800
+
+
+def _imm_s(inst: int) -> int:
+    return ((((inst >> 20) & 0xfe0) | ((inst >> 7) & 0x1f)) ^ 0x800) - 0x800
+
+
+def _imm_b(inst: int) -> int:
+    return ((((inst >> 19) & 0x1000) | ((inst << 4) & 0x800) | ((inst >> 20) & 0x7e0) |
+             ((inst >> 7) & 0x1e)) ^ 0x1000) - 0x1000
+
+
+def _imm_u(inst: int) -> int:
+    return ((inst & 0xfffff000) ^ 0x80000000) - 0x80000000
+
+
+def _imm_j(inst: int) -> int:
+    return ((((inst >> 11) & 0x100000) | (inst & 0xff000) | ((inst >> 9) & 0x800) |
+             ((inst >> 20) & 0x7fe)) ^ 0x100000) - 0x100000
+
+
+def _shamt(inst: int) -> int:
+    return (inst >> 20) & 0x1f
+
+
+def _funct12(inst: int) -> int:
+    return inst >> 20
+
+
+# Format: (has rd, has rs1, has rs2, immediate formula or None, (shift, mask) of the bits above funct3 in the key)
+_formats = {
+    'R': (True, True, True, None, (25, 0x7f)),
+    'I': (True, True, False, _imm_i, None),
+    'shift': (True, True, False, _shamt, (25, 0x7f)),
+    'S': (False, True, True, _imm_s, None),
+    'B': (False, True, True, _imm_b, None),
+    'U': (True, False, False, _imm_u, None),
+    'J': (True, False, False, _imm_j, None),
+    'system': (False, False, False, _funct12, (20, 0xfff)),
+}
+
+# name, format, opcode, funct3 (None: any), funct7 or funct12 (None if the format does not key on it)
+_encodings = [
+    # R type
+    ('add', 'R', 0b0110011, 0x0, 0x00), ('sub', 'R', 0b0110011, 0x0, 0x20),
+    ('sll', 'R', 0b0110011, 0x1, 0x00), ('slt', 'R', 0b0110011, 0x2, 0x00),
+    ('sltu', 'R', 0b0110011, 0x3, 0x00), ('xor', 'R', 0b0110011, 0x4, 0x00),
+    ('srl', 'R', 0b0110011, 0x5, 0x00), ('sra', 'R', 0b0110011, 0x5, 0x20),
+    ('or', 'R', 0b0110011, 0x6, 0x00), ('and', 'R', 0b0110011, 0x7, 0x00),
+    # RV32M extension
+    ('mul', 'R', 0b0110011, 0x0, 0x01), ('mulh', 'R', 0b0110011, 0x1, 0x01),
+    ('mulhsu', 'R', 0b0110011, 0x2, 0x01), ('mulhu', 'R', 0b0110011, 0x3, 0x01),
+    ('div', 'R', 0b0110011, 0x4, 0x01), ('divu', 'R', 0b0110011, 0x5, 0x01),
+    ('rem', 'R', 0b0110011, 0x6, 0x01), ('remu', 'R', 0b0110011, 0x7, 0x01),
+    # I type (Arithmetic and logic)
+    ('addi', 'I', 0b0010011, 0x0, None), ('slti', 'I', 0b0010011, 0x2, None),
+    ('sltiu', 'I', 0b0010011, 0x3, None), ('xori', 'I', 0b0010011, 0x4, None),
+    ('ori', 'I', 0b0010011, 0x6, None), ('andi', 'I', 0b0010011, 0x7, None),
+    ('slli', 'shift', 0b0010011, 0x1, 0x00), ('srli', 'shift', 0b0010011, 0x5, 0x00),
+    ('srai', 'shift', 0b0010011, 0x5, 0x20),
+    # I type (LOAD)
+    ('lb', 'I', 0b0000011, 0x0, None), ('lh', 'I', 0b0000011, 0x1, None), ('lw', 'I', 0b0000011, 0x2, None),
+    ('lbu', 'I', 0b0000011, 0x4, None), ('lhu', 'I', 0b0000011, 0x5, None),
+    # I type (JALR)
+    ('jalr', 'I', 0b1100111, 0x0, None),
+    # System calls
+    ('ecall', 'system', 0b1110011, 0x0, 0x000), ('ebreak', 'system', 0b1110011, 0x0, 0x001),
+    # S type
+    ('sb', 'S', 0b0100011, 0x0, None), ('sh', 'S', 0b0100011, 0x1, None), ('sw', 'S', 0b0100011, 0x2, None),
+    # B type
+    ('beq', 'B', 0b1100011, 0x0, None), ('bne', 'B', 0b1100011, 0x1, None),
+    ('blt', 'B', 0b1100011, 0x4, None), ('bge', 'B', 0b1100011, 0x5, None),
+    ('bltu', 'B', 0b1100011, 0x6, None), ('bgeu', 'B', 0b1100011, 0x7, None),
+    # U type
+    ('lui', 'U', 0b0110111, None, None), ('auipc', 'U', 0b0010111, None, None),
+    # J type
+    ('jal', 'J', 0b1101111, None, None),
+]
+
+_opcode_funct3 = 0x707f  # bits of the opcode and funct3 fields
+
+# word & _opcode_funct3 -> key mask of the instructions with that opcode and funct3
+_key_masks = dict()
+# word & key mask -> (name, has rd, has rs1, has rs2, immediate formula)
+_instructions = dict()
+
+
+def _buildTables():
+    for name, format_name, opcode, funct3, upper in _encodings:
+        has_rd, has_rs1, has_rs2, immediate, upper_field = _formats[format_name]
+        key = opcode
+        mask = 0x7f
+        if funct3 is not None:
+            key |= funct3 << 12
+            mask |= 0x7000
+        if upper_field is not None:
+            shift, width = upper_field
+            key |= upper << shift
+            mask |= width << shift
+        for any_funct3 in (range(8) if funct3 is None else (funct3,)):
+            _key_masks[opcode | any_funct3 << 12] = mask
+        _instructions[key] = (name, has_rd, has_rs1, has_rs2, immediate)
+
+
+_buildTables()
+
+
+def decode(inst: int) -> Fields:
+    """
+    Decode a 32 bit instruction word.
+    Raises: IllegalInstruction for an encoding that is not in the table
+    """
+    entry = _instructions.get(inst & _key_masks.get(inst & _opcode_funct3, 0))
+    if entry is None:
+        raise IllegalInstruction(inst)
+    name, has_rd, has_rs1, has_rs2, immediate = entry
+    return Fields(name,
+                  (inst >> 7) & 0x1f if has_rd else None,
+                  (inst >> 15) & 0x1f if has_rs1 else None,
+                  (inst >> 20) & 0x1f if has_rs2 else None,
+                  immediate(inst) if immediate else None)
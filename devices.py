@@ -0,0 +1,109 @@
+# Memory mapped devices, for guests that do their I/O the way firmware does instead of through ecall.
+# A device has read(offset, width) and write(offset, width, value), which Memory.mapDevice() calls for the
+# accesses to its region. attachDevices() maps the built-in ones at the addresses below, past the end of the
+# memory and each on its own 4 KiB page. The UART costs nothing until it is accessed. The timer is only mapped
+# when asked for: it counts every instruction, which runs TranslatingCPU on its interpreter.
+#
+# UART at UART_BASE, 32 bit registers:
+#   0x0  TXDATA  write: the low byte goes to stdout, buffered with the output of the write syscall. Reads 0
+#   0x4  RXDATA  read: the next byte of stdin, or RX_EMPTY at the end of the input. Reading waits for input
+# Timer at TIMER_BASE, 64 bit counters read as two 32 bit words, low word first:
+#   0x0  cycle   instructions retired since the timer was attached, one cycle each
+#   0x8  mtime   cycle / cycles_per_tick
+# Writes to the timer are ignored.
+
+from functools import partial
+import sys
+from fastcpu import FastCPU
+import syscalls
+
+UART_BASE = 0x10000000
+UART_SIZE = 0x8
+TIMER_BASE = 0x10001000
+TIMER_SIZE = 0x10
+
+_txdata = 0x0
+_rxdata = 0x4
+RX_EMPTY = 0x80000000
+
+
+def _register(value: int, offset: int, width: int) -> int:
+    """
+    The width bytes at offset (within its word) of a register holding value
+    """
+    return (value >> (8 * (offset & 3))) & ((1 << (8 * width)) - 1)
+
+
+class Uart:
+    """
+        Serial port backed by the host stdout and stdin.
+        Args:
+            input: binary stream RXDATA reads from, sys.stdin.buffer by default
+    """
+    def __init__(self, input=None):
+        self.input = input
+        self.transmitted = 0  # bytes written to TXDATA
+
+    def read(self, offset: int, width: int) -> int:
+        if offset & ~3 != _rxdata:
+            return 0
+        syscalls.flushOutput()  # Show the prompt before waiting for the answer
+        stream = self.input if self.input is not None else sys.stdin.buffer
+        data = stream.read(1)
+        return _register(data[0] if data else RX_EMPTY, offset, width)
+
+    def write(self, offset: int, width: int, value: int):
+        if offset == _txdata:
+            syscalls.queueOutput(1, bytes((value & 0xff,)))
+            self.transmitted += 1
+
+
+class Timer:
+    """
+        Cycle counter and mtime, derived from the instructions a CPU retires.
+        Creating the timer attaches it to the CPU, like Profiler. TranslatingCPU runs on its interpreter.
+        Args:
+            cpu: any engine
+            cycles_per_tick: cycles per mtime tick
+    """
+    def __init__(self, cpu, cycles_per_tick: int = 1):
+        self.cpu = cpu
+        self.cycles_per_tick = cycles_per_tick
+        self.retired = [0]  # A list, so the fetch wrapper updates it without an attribute lookup
+        self.attach()
+
+    def attach(self):
+        cpu = self.cpu
+        fetch = cpu.fetch
+        retired = self.retired
+        if getattr(cpu, 'translate_enabled', False):
+            # The counters are read in the middle of blocks, count instruction by instruction
+            cpu.translate_enabled = False
+            fetch = partial(FastCPU.fetch, cpu)
+
+        def countedFetch():
+            fetch()
+            retired[0] += 1
+        cpu.fetch = countedFetch
+
+    def read(self, offset: int, width: int) -> int:
+        cycle = self.retired[0]
+        value = cycle if offset < 8 else cycle // self.cycles_per_tick
+        return _register(value >> 32 if offset & 4 else value, offset, width)
+
+    def write(self, offset: int, width: int, value: int):
+        pass
+
+
+def attachDevices(cpu, input=None, timer: bool = False) -> tuple:
+    """
+    Map a Uart, and a Timer if timer, into the memory of cpu.
+    Returns: (uart, timer), timer is None when not mapped
+    """
+    uart = Uart(input)
+    cpu.ram.mapDevice(UART_BASE, UART_SIZE, uart.read, uart.write)
+    if not timer:
+        return uart, None
+    timer = Timer(cpu)
+    cpu.ram.mapDevice(TIMER_BASE, TIMER_SIZE, timer.read, timer.write)
+    return uart, timer
@@ -0,0 +1,83 @@
+# Reading RV32 ELF executables.
+# The file is mmapped and the segments are memoryview slices of the map,
+# so loading one into Memory is a single slice assignment.
+
+from collections import namedtuple
+import mmap
+import os
+import struct
+
+_header = struct.Struct('<16sHHIIIIIHHHHHH')
+_program_header = struct.Struct('<IIIIIIII')
+_section_header = struct.Struct('<IIIIIIIIII')
+_symbol = struct.Struct('<IIIBBH')
+
+_magic = b'\x7fELF'
+_class_32 = 1
+_data_little = 1
+_machine_riscv = 243
+_pt_load = 1
+_sht_symtab = 2
+
+# One PT_LOAD segment: its content in the file is data, the rest up to memsz is .bss
+Segment = namedtuple('Segment', ['address', 'data', 'memsz', 'flags'])
+ElfImage = namedtuple('ElfImage', ['entry', 'segments', 'symbols'])
+
+
+class ElfError(ValueError):
+    """
+    Raised when a file is not a little endian RV32 ELF executable.
+    """
+
+
+def isElf(file_name: str) -> bool:
+    with open(file_name, 'rb') as file:
+        return file.read(4) == _magic
+
+
+def readElf(file_name: str) -> ElfImage:
+    """
+    Map an ELF file and find its loadable segments, entry point and symbols.
+    The segment data are views of the map, which stays open while they are referenced.
+    Returns: ElfImage, symbols is a dict of name -> value
+    """
+    with open(file_name, 'rb') as file:
+        if os.fstat(file.fileno()).st_size < _header.size:  # An empty file can not be mapped either
+            raise ElfError(file_name + ': too short for an ELF header')
+        image = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(image)
+    (ident, e_type, machine, version, entry, phoff, shoff, flags, ehsize,
+     phentsize, phnum, shentsize, shnum, shstrndx) = _header.unpack_from(view)
+    if ident[:4] != _magic:
+        raise ElfError(file_name + ': not an ELF file')
+    if ident[4] != _class_32 or ident[5] != _data_little or machine != _machine_riscv:
+        raise ElfError(file_name + ': not a little endian RV32 ELF file')
+
+    if phnum and (phentsize < _program_header.size or phoff + phnum * phentsize > len(view)):
+        raise ElfError(file_name + ': truncated program header table')
+    if shnum and (shentsize < _section_header.size or shoff + shnum * shentsize > len(view)):
+        raise ElfError(file_name + ': truncated section header table')
+
+    segments = list()
+    for i in range(phnum):
+        p_type, offset, vaddr, paddr, filesz, memsz, p_flags, align = \
+            _program_header.unpack_from(view, phoff + i * phentsize)
+        if p_type == _pt_load:
+            if offset + filesz > len(view):
+                raise ElfError('{}: truncated segment at {:#x}'.format(file_name, vaddr))
+            segments.append(Segment(vaddr, view[offset:offset + filesz], memsz, p_flags))
+
+    symbols = dict()
+    sections = [_section_header.unpack_from(view, shoff + i * shentsize) for i in range(shnum)]
+    for name, sh_type, sh_flags, addr, offset, size, link, info, addralign, entsize in sections:
+        if sh_type != _sht_symtab:
+            continue
+        if offset + size > len(view) or link >= shnum or sections[link][4] + sections[link][5] > len(view):
+            raise ElfError(file_name + ': truncated symbol table')
+        strings_offset = sections[link][4]
+        for st_name, value, st_size, st_info, other, shndx in \
+                _symbol.iter_unpack(view[offset:offset + size]):
+            if st_name:
+                end = image.find(b'\0', strings_offset + st_name)
+                symbols[bytes(view[strings_offset + st_name:end]).decode()] = value
+    return ElfImage(entry, segments, symbols)
@@ -0,0 +1,326 @@
+from mem import Memory
+from CPU import CPU, DecodedInstruction, Breakpoint, illegalInstruction, _add_text_base, _add_text_limit
+from decoder import IllegalInstruction
+import decoder
+import syscalls
+import tracing
+
+_mask = 0xFFFFFFFF
+_sign_bit = 0x80000000
+_int_min = 0x80000000
+
+
+def _signed(value: int) -> int:
+    """
+    Reinterpret a 32 bit unsigned value as a signed one.
+    """
+    return (value ^ _sign_bit) - _sign_bit
+
+
+class FastCPU:
+    """
+        Same machine as CPU, but the registers are plain Python ints holding the unsigned 32 bit value.
+        All arithmetic is done on ints and masked back to 32 bits, no intbv is created while running.
+        Instructions are decoded once into closures over the register list and kept in a decode cache,
+        exactly like CPU does.
+    """
+    def __init__(self, ram: Memory, trace: int = tracing.TRACE_OFF):
+        """
+            FastCPU constructor
+            Input: instance of the memory, trace level (see tracing.py)
+        """
+        self.regs = [0] * 32  # The Registers, unsigned 32 bit ints. x0 is reset to 0 on every fetch
+        self.pc = 0
+        self.ram = ram
+        self.jump_flag = False
+        self.breakpoints = set()
+        self.decode_cache = [None] * ((_add_text_limit - _add_text_base) >> 2)
+        self.trace = trace
+        if trace != tracing.TRACE_OFF:
+            self.fetch = tracing.traced(self, self.fetch, trace)
+
+    # =========== Fetching Area =========== #
+    def fetch(self):
+        # Same as lookup(), kept inline to save a call per instruction
+        self.jump_flag = False
+        self.regs[0] = 0
+        pc = self.pc
+        if _add_text_base <= pc < _add_text_limit:
+            index = (pc - _add_text_base) >> 2
+            decoded = self.decode_cache[index]
+            if decoded is None:
+                decoded = self.decode(self._readInstruction(pc))
+                self.decode_cache[index] = decoded
+        else:
+            decoded = self.decode(self._readInstruction(pc))
+        decoded.execute()
+
+    def lookup(self, pc: int) -> DecodedInstruction:
+        """
+        Returns the decoded instruction at pc, from the decode cache if it was decoded before.
+        """
+        if _add_text_base <= pc < _add_text_limit:
+            index = (pc - _add_text_base) >> 2
+            decoded = self.decode_cache[index]
+            if decoded is None:
+                decoded = self.decode(self._readInstruction(pc))
+                self.decode_cache[index] = decoded
+            return decoded
+        return self.decode(self._readInstruction(pc))
+
+    # Same loop as CPU, it only uses fetch(), pc and jump_flag
+    run = CPU.run
+
+    def _readInstruction(self, address: int) -> int:
+        return self.ram.fetchWordAsInt(address)
+
+    def invalidate(self, address: int, width: int = 1):
+        """
+        Drop the decode cache entries covering address .. address+width-1.
+        """
+        first = max(address, _add_text_base)
+        last = min(address + width - 1, _add_text_limit - 1)
+        for index in range((first - _add_text_base) >> 2, ((last - _add_text_base) >> 2) + 1):
+            self.decode_cache[index] = None
+
+    # =========== Decoding Area =========== #
+    def decode(self, inst: int) -> DecodedInstruction:
+        """
+        Decode the instruction word with the shared tables of decoder.py and build the closure that executes it.
+        An illegal instruction decodes to one that raises IllegalInstruction when it is executed.
+        """
+        try:
+            fields = decoder.decode(inst)
+        except IllegalInstruction as illegal:
+            return illegalInstruction(illegal)
+        return self.decodeFields(fields)
+
+    def decodeFields(self, fields) -> DecodedInstruction:
+        """
+        Build the DecodedInstruction of fields decoder.decode() returned, e.g. kept by codecache.py
+        """
+        name, rd, rs1, rs2, imm = fields
+        execute = _executors[name](self, rd, rs1, rs2, imm)
+        return DecodedInstruction(name, rd, rs1, rs2, imm, execute)
+
+    # ================================= Execution Area ================================= #
+    # The execution functions of each instruction are built by the factories below, see _executors.
+
+    def ecall(self):
+        syscalls.handle(self.regs, self.ram, self.invalidate)
+
+    def ebreak(self):
+        raise Breakpoint()
+
+
+# ------------------------------- RV32M helpers --------------------------------- #
+def _div(a: int, b: int) -> int:
+    """
+    Signed division rounding towards zero. a and b are unsigned 32 bit values.
+    Division by zero gives -1, INT_MIN / -1 overflows to INT_MIN.
+    """
+    if b == 0:
+        return _mask
+    if a == _int_min and b == _mask:
+        return _int_min
+    a, b = _signed(a), _signed(b)
+    q = abs(a) // abs(b)
+    return (-q if (a < 0) != (b < 0) else q) & _mask
+
+
+def _rem(a: int, b: int) -> int:
+    """
+    Signed remainder, takes the sign of the dividend.
+    Remainder by zero gives the dividend, INT_MIN % -1 gives 0.
+    """
+    if b == 0:
+        return a
+    if a == _int_min and b == _mask:
+        return 0
+    a, b = _signed(a), _signed(b)
+    r = abs(a) % abs(b)
+    return (-r if a < 0 else r) & _mask
+
+
+def _divu(a: int, b: int) -> int:
+    return a // b if b else _mask
+
+
+def _remu(a: int, b: int) -> int:
+    return a % b if b else a
+
+
+# ------------------------------- Execution factories --------------------------------- #
+def _r_type(operation):
+    """
+    Build the factory of an R type instruction from operation(value of rs1, value of rs2) -> 32 bit result.
+    """
+    def factory(cpu: FastCPU, rd, rs1, rs2, imm):
+        regs = cpu.regs
+
+        def execute():
+            regs[rd] = operation(regs[rs1], regs[rs2])
+        return execute
+    return factory
+
+
+def _i_type(operation):
+    """
+    Build the factory of an I type (Arithmetic and logic) instruction from operation(value of rs1, imm).
+    """
+    def factory(cpu: FastCPU, rd, rs1, rs2, imm):
+        regs = cpu.regs
+
+        def execute():
+            regs[rd] = operation(regs[rs1], imm)
+        return execute
+    return factory
+
+
+def _load(width: int, signed: bool):
+    def factory(cpu: FastCPU, rd, rs1, rs2, imm):
+        regs = cpu.regs
+        ram = cpu.ram
+        read = {1: ram.readAsInt, 2: ram.readHalfWordAsInt, 4: ram.readWordAsInt}[width]
+        if signed:
+            sign = 1 << (8 * width - 1)
+
+            def execute():
+                regs[rd] = ((read((regs[rs1] + imm) & _mask) ^ sign) - sign) & _mask
+        else:
+            def execute():
+                regs[rd] = read((regs[rs1] + imm) & _mask)
+        return execute
+    return factory
+
+
+def _store(width: int):
+    def factory(cpu: FastCPU, rd, rs1, rs2, imm):
+        regs = cpu.regs
+        ram = cpu.ram
+        write = {1: ram.writeByte, 2: ram.writeHalfWord, 4: ram.writeWord}[width]
+
+        def execute():
+            address = (regs[rs1] + imm) & _mask
+            write(address, regs[rs2])
+            # Self-modifying code: drop cached decodes of the overwritten instructions
+            if address < _add_text_limit:
+                cpu.invalidate(address, width)
+        return execute
+    return factory
+
+
+def _branch(condition):
+    """
+    Build the factory of a branch from condition(value of rs1, value of rs2) -> bool.
+    """
+    def factory(cpu: FastCPU, rd, rs1, rs2, imm):
+        regs = cpu.regs
+
+        def execute():
+            if condition(regs[rs1], regs[rs2]):
+                cpu.jump_flag = True
+                cpu.pc = (cpu.pc + imm) & _mask
+        return execute
+    return factory
+
+
+def _jal(cpu: FastCPU, rd, rs1, rs2, imm):
+    regs = cpu.regs
+
+    def execute():
+        regs[rd] = (cpu.pc + 4) & _mask  # Save return address in rd
+        cpu.jump_flag = True
+        cpu.pc = (cpu.pc + imm) & _mask
+    return execute
+
+
+def _jalr(cpu: FastCPU, rd, rs1, rs2, imm):
+    regs = cpu.regs
+
+    def execute():
+        target = (regs[rs1] + imm) & 0xFFFFFFFE  # read rs1 before rd is written, rd may be rs1
+        regs[rd] = (cpu.pc + 4) & _mask
+        cpu.jump_flag = True
+        cpu.pc = target
+    return execute
+
+
+def _lui(cpu: FastCPU, rd, rs1, rs2, imm):
+    regs = cpu.regs
+    value = imm & _mask
+
+    def execute():
+        regs[rd] = value
+    return execute
+
+
+def _auipc(cpu: FastCPU, rd, rs1, rs2, imm):
+    regs = cpu.regs
+
+    def execute():
+        regs[rd] = (cpu.pc + imm) & _mask
+    return execute
+
+
+def _system(method_name: str):
+    def factory(cpu: FastCPU, rd, rs1, rs2, imm):
+        return getattr(cpu, method_name)
+    return factory
+
+
+_executors = {
+    # R type
+    'add': _r_type(lambda a, b: (a + b) & _mask),
+    'sub': _r_type(lambda a, b: (a - b) & _mask),
+    'sll': _r_type(lambda a, b: (a << (b & 0x1f)) & _mask),
+    'slt': _r_type(lambda a, b: int(_signed(a) < _signed(b))),
+    'sltu': _r_type(lambda a, b: int(a < b)),
+    'xor': _r_type(lambda a, b: a ^ b),
+    'srl': _r_type(lambda a, b: a >> (b & 0x1f)),
+    'sra': _r_type(lambda a, b: (_signed(a) >> (b & 0x1f)) & _mask),
+    'or': _r_type(lambda a, b: a | b),
+    'and': _r_type(lambda a, b: a & b),
+    'mul': _r_type(lambda a, b: (a * b) & _mask),
+    'mulh': _r_type(lambda a, b: ((_signed(a) * _signed(b)) >> 32) & _mask),
+    'mulhsu': _r_type(lambda a, b: ((_signed(a) * b) >> 32) & _mask),
+    'mulhu': _r_type(lambda a, b: (a * b) >> 32),
+    'div': _r_type(_div),
+    'divu': _r_type(_divu),
+    'rem': _r_type(_rem),
+    'remu': _r_type(_remu),
+    # I type
+    'addi': _i_type(lambda a, imm: (a + imm) & _mask),
+    'slti': _i_type(lambda a, imm: int(_signed(a) < imm)),
+    'sltiu': _i_type(lambda a, imm: int(a < (imm & _mask))),
+    'xori': _i_type(lambda a, imm: (a ^ imm) & _mask),
+    'ori': _i_type(lambda a, imm: (a | imm) & _mask),
+    'andi': _i_type(lambda a, imm: (a & imm) & _mask),
+    'slli': _i_type(lambda a, shamt: (a << shamt) & _mask),
+    'srli': _i_type(lambda a, shamt: a >> shamt),
+    'srai': _i_type(lambda a, shamt: (_signed(a) >> shamt) & _mask),
+    # Loads and stores
+    'lb': _load(1, True),
+    'lh': _load(2, True),
+    'lw': _load(4, False),
+    'lbu': _load(1, False),
+    'lhu': _load(2, False),
+    'sb': _store(1),
+    'sh': _store(2),
+    'sw': _store(4),
+    # Branches and jumps
+    'beq': _branch(lambda a, b: a == b),
+    'bne': _branch(lambda a, b: a != b),
+    'blt': _branch(lambda a, b: _signed(a) < _signed(b)),
+    'bge': _branch(lambda a, b: _signed(a) >= _signed(b)),
+    'bltu': _branch(lambda a, b: a < b),
+    'bgeu': _branch(lambda a, b: a >= b),
+    'jal': _jal,
+    'jalr': _jalr,
+    # Large immediates
+    'lui': _lui,
+    'auipc': _auipc,
+    # System calls
+    'ecall': _system('ecall'),
+    'ebreak': _system('ebreak'),
+}
@@ -0,0 +1,137 @@
+# Several harts (hardware threads) of the same engine running on one shared memory.
+# The scheduler gives each runnable hart a quantum of instructions in turn, always in hart id order, so a run
+# is reproducible. A hart blocked in the wait syscall is skipped until the word it waits on changes,
+# a halted, exited or faulted hart is skipped for good.
+#
+# There are no CSRs in this VM: a hart finds its mhartid in a0 when it starts, the way boot firmware
+# passes it, and gets its own stack below the one of the hart before it.
+
+from collections import namedtuple
+import time
+from CPU import STOP_EBREAK, STOP_STEP_LIMIT, STOP_WAIT, STOP_EXIT
+from loader import setReg
+import syscalls
+
+_index_sp = 2
+_index_a0 = 10
+_index_a1 = 11
+
+# Hart states
+RUNNING = 'running'
+WAITING = 'waiting'
+STOPPED = 'stopped'
+
+"""
+    Result of Scheduler.run()
+        reasons: stop reason of each hart, in hart id order (RUNNING or WAITING ones were still going)
+        exit_codes: exit code of each hart, None for a hart that did not exit
+        retired: instructions retired by each hart
+        time: wall time of the run in seconds
+"""
+SchedulerResult = namedtuple('SchedulerResult', ['reasons', 'exit_codes', 'retired', 'time'])
+
+
+class Hart:
+    """
+        One hart of the scheduler.
+        Args:
+            cpu: its engine, on the shared memory
+            hartid: its mhartid
+    """
+    def __init__(self, cpu, hartid: int):
+        self.cpu = cpu
+        self.hartid = hartid
+        self.state = RUNNING
+        self.retired = 0
+        self.result = None  # RunResult of its last quantum
+        self.wait = None  # (address, value) of the word it waits on while WAITING
+
+
+def makeHarts(cpu, count: int, stack_stride: int = 0x200) -> list:
+    """
+    Build count harts from a loaded CPU: hart 0 is cpu, the others are new CPUs of the same engine on its memory,
+    starting at its pc with its registers. Each gets its hart id in a0 and sp lowered by stack_stride per hart id.
+    Returns: list of Hart
+    """
+    harts = [Hart(cpu, 0)]
+    for hartid in range(1, count):
+        hart = type(cpu)(cpu.ram, cpu.trace)
+        for index in range(32):
+            setReg(hart, index, int(cpu.regs[index]))
+        hart.pc = int(cpu.pc)
+        harts.append(Hart(hart, hartid))
+    for hart in harts:
+        setReg(hart.cpu, _index_a0, hart.hartid)
+        setReg(hart.cpu, _index_sp, int(cpu.regs[_index_sp]) - hart.hartid * stack_stride)
+    return harts
+
+
+class Scheduler:
+    """
+        Interleaves harts sharing one memory, quantum instructions at a time.
+        A store into the text section by any hart drops the decodes of every hart.
+        Args:
+            harts: list of Hart, see makeHarts()
+            quantum: instructions a hart runs before the next one gets its turn
+    """
+    def __init__(self, harts: list, quantum: int = 1000):
+        self.harts = harts
+        self.quantum = quantum
+        for hart in harts:
+            hart.cpu.invalidate = self.invalidate  # Instance attribute, the engines look it up on each store
+
+    def invalidate(self, address: int, width: int = 1):
+        for hart in self.harts:
+            type(hart.cpu).invalidate(hart.cpu, address, width)
+
+    def run(self, max_steps: int = None) -> SchedulerResult:
+        """
+        Run the harts until none of them can run, or they retired max_steps instructions together.
+        The memory is dumped once, when the last hart stops, if any hart exited.
+        """
+        ram = self.harts[0].cpu.ram
+        dump_on_exit = syscalls.dump_on_exit
+        syscalls.dump_on_exit = False
+        retired = 0
+        start = time.perf_counter()
+        try:
+            ran = True
+            while ran and (max_steps is None or retired < max_steps):
+                ran = False
+                for hart in self.harts:
+                    if hart.state == WAITING and ram.readWordAsInt(hart.wait[0]) != hart.wait[1]:
+                        hart.state = RUNNING
+                    if hart.state != RUNNING:
+                        continue
+                    steps = self.quantum if max_steps is None else min(self.quantum, max_steps - retired)
+                    if steps <= 0:
+                        break
+                    result = hart.cpu.run(steps)
+                    ran = True
+                    hart.result = result
+                    hart.retired += result.retired
+                    retired += result.retired
+                    if result.reason == STOP_WAIT:
+                        hart.state = WAITING
+                        hart.wait = (int(hart.cpu.regs[_index_a0]), int(hart.cpu.regs[_index_a1]))
+                    elif result.reason not in (STOP_STEP_LIMIT, STOP_EBREAK):
+                        hart.state = STOPPED
+        finally:
+            syscalls.dump_on_exit = dump_on_exit
+            syscalls.flushOutput()
+        elapsed = time.perf_counter() - start
+        reasons = [hart.result.reason if hart.state == STOPPED else hart.state for hart in self.harts]
+        if dump_on_exit and STOP_EXIT in reasons and all(hart.state == STOPPED for hart in self.harts):
+            syscalls.exitDump(ram)
+        return SchedulerResult(reasons, [hart.result.exit_code if hart.result else None for hart in self.harts],
+                               [hart.retired for hart in self.harts], elapsed)
+
+
+def report(result: SchedulerResult) -> str:
+    lines = ['hart  state                 retired  exit code']
+    for hartid, (reason, exit_code, retired) in enumerate(zip(result.reasons, result.exit_codes, result.retired)):
+        lines.append('{:4}  {:<20} {:>8}  {}'.format(hartid, reason, retired, '' if exit_code is None else exit_code))
+    total = sum(result.retired)
+    lines.append('Total {} instructions in {:.3f} s, {:.3f} MIPS'.format(
+        total, result.time, total / result.time / 1e6 if result.time else 0))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,132 @@
+# Loading guest programs into a new Memory and CPU.
+# Shared by team-2-riscv-vm and the batch runner.
+
+from myhdl import intbv
+from mem import Memory, PagedMemory, PERM_READ, PERM_EXECUTE
+from CPU import CPU, _add_text_limit
+from fastcpu import FastCPU
+from translator import TranslatingCPU
+from elf import ElfError, readElf
+import tracing
+
+# From memory-layout.txt
+_add_text_base = 0
+_add_data_base = 0x2000 # up to 2fff
+_add_heap_base = 0x3000
+_add_stack_base = 0x3ffc
+_add_global_ptr = 0x1800
+_mem_size = 0x3ffc
+# Largest flat memory an ELF may ask for, the paged memory holds images linked further up
+_max_flat_elf_size = 16 << 20
+
+_index_sp = 2
+_index_gp = 3
+
+# Symbols an ELF can give the initial sp with, the first one found is used
+_stack_symbols = ('__stack_top', '_stack_top', '__stack')
+
+# Execution engines, by the name used on the command line
+engines = {'intbv': CPU, 'fast': FastCPU, 'translate': TranslatingCPU}
+# Memory implementations: flat is one bytearray of mem_size bytes, paged covers the 4 GiB address space
+memories = ('flat', 'paged')
+
+
+def readMemFile(file_name: str) -> bytearray:
+    """
+    Read file as binary byte array
+    """
+    content = bytearray()
+    with open(file_name, 'rb') as file:
+        content += file.read()
+    return content
+
+
+def loadRam(RAM: Memory, data: bytearray, offset:int = 0) -> Memory:
+    RAM.write_bytes(offset, data)
+    return RAM
+
+
+def setReg(cpu, index: int, value: int):
+    """
+    Set a register of any engine, CPU keeps intbv registers and the others plain ints.
+    """
+    if isinstance(cpu, CPU):
+        cpu.regs[index] = intbv(value)[32:0]
+    else:
+        cpu.regs[index] = value & 0xFFFFFFFF
+
+
+def loadProgram(text: bytes, data: bytes, engine: str = 'intbv', trace: int = tracing.TRACE_OFF,
+                mem_size: int = _mem_size, memory: str = 'flat'):
+    """
+    Build the memory and CPU for a program, with sp and gp set up as memory-layout.txt describes.
+    Args:
+        text: content of the text section, loaded at 0x0000
+        data: content of the data section, loaded at 0x2000
+        engine: key of engines
+        trace: trace level, see tracing.py
+        mem_size: size of the memory in bytes, for the flat memory
+        memory: one of memories. A paged memory makes the text section read and execute only
+    Returns: the CPU, ready to run from pc 0
+    """
+    RAM = Memory(mem_size) if memory == 'flat' else PagedMemory()
+    RAM = loadRam(RAM, text) # Load text section
+    RAM = loadRam(RAM, data, _add_data_base) # Load data
+    if memory == 'paged':
+        RAM.setPermissions(_add_text_base, _add_text_limit, PERM_READ | PERM_EXECUTE)
+    cpu = engines[engine](RAM, trace)
+    setReg(cpu, _index_sp, _add_stack_base)
+    setReg(cpu, _index_gp, _add_global_ptr)
+    RAM.clearDirty()  # The exit dump shows what the program changed from here
+    return cpu
+
+
+def loadElf(file_name: str, engine: str = 'intbv', trace: int = tracing.TRACE_OFF, mem_size: int = _mem_size,
+            memory: str = 'flat'):
+    """
+    Build the memory and CPU for an RV32 ELF executable. Each PT_LOAD segment is copied in one slice
+    and the rest of it (.bss) zeroed. pc starts at e_entry (at _start when e_entry is 0), gp at
+    __global_pointer$ and sp at __stack_top, each falling back to memory-layout.txt when the ELF has none.
+    Args:
+        file_name: path of the ELF file
+        engine: key of engines
+        trace: trace level, see tracing.py
+        mem_size: smallest size of the flat memory in bytes, it grows to hold every segment, up to 16 MiB
+        memory: one of memories. A paged memory gives each segment the permissions of its p_flags
+    Returns: the CPU, ready to run
+    Raises: ElfError if the code or entry point lies outside the text section the engines run,
+            or a flat memory would have to be larger than 16 MiB to hold the segments
+    """
+    image = readElf(file_name)
+    entry = image.entry or image.symbols.get('_start', 0)
+    for segment in image.segments:
+        if segment.flags & PERM_EXECUTE and segment.memsz and \
+                not _add_text_base <= segment.address <= segment.address + segment.memsz <= _add_text_limit:
+            raise ElfError('{}: code at {:#x}..{:#x} is outside the text section {:#x}..{:#x}, link it with '
+                           '-Ttext={:#x}'.format(file_name, segment.address, segment.address + segment.memsz,
+                                                 _add_text_base, _add_text_limit, _add_text_base))
+    if not _add_text_base <= entry < _add_text_limit:
+        raise ElfError('{}: entry point {:#x} is outside the text section {:#x}..{:#x}'.format(
+            file_name, entry, _add_text_base, _add_text_limit))
+    if memory == 'flat':
+        end = max([segment.address + segment.memsz for segment in image.segments], default=0)
+        if end > max(mem_size, _max_flat_elf_size):
+            raise ElfError('{}: segments end at {:#x}, too far up for a flat memory, use --memory paged'.format(
+                file_name, end))
+        RAM = Memory(max(mem_size, end))
+    else:
+        RAM = PagedMemory()
+    for segment in image.segments:
+        RAM.write_bytes(segment.address, segment.data)
+        RAM.write_bytes(segment.address + len(segment.data), bytes(segment.memsz - len(segment.data)))
+    if memory == 'paged':
+        for segment in image.segments:
+            if segment.memsz:
+                RAM.setPermissions(segment.address, segment.address + segment.memsz, segment.flags)
+    cpu = engines[engine](RAM, trace)
+    cpu.pc = entry
+    stack = next((image.symbols[name] for name in _stack_symbols if name in image.symbols), _add_stack_base)
+    setReg(cpu, _index_sp, stack)
+    setReg(cpu, _index_gp, image.symbols.get('__global_pointer$', _add_global_ptr))
+    RAM.clearDirty()  # The exit dump shows what the program changed from here
+    return cpu
@@ -0,0 +1,154 @@
+# Lockstep differential verification: runs the reference CPU (myhdl intbv) and a fast engine side by side,
+# each on its own Memory, and compares them every interval instructions. Stores are compared through the
+# dirty pages of both memories, so every byte either engine wrote in the interval is checked.
+# With an interval above 1 each engine is copied before the interval runs, and a divergence is
+# replayed from the copies one instruction at a time to find the instruction that caused it.
+
+from collections import namedtuple
+from contextlib import contextmanager
+from CPU import STOP_EBREAK, STOP_STEP_LIMIT
+from mem import Memory, PagedMemory
+from loader import setReg
+import syscalls
+import tracing
+
+# retired: instructions both engines retired before the diverging one
+# pc: address of the diverging instruction
+# instructions: its disassembly by the reference and by the candidate
+# differences: list of 'what: reference value, candidate value' strings
+Divergence = namedtuple('Divergence', ['retired', 'pc', 'instructions', 'differences'])
+
+
+@contextmanager
+def _quiet():
+    """
+    Run a CPU that only checks another one, without guest output or exit dump
+    """
+    saved = syscalls.output_enabled, syscalls.dump_on_exit
+    syscalls.output_enabled = syscalls.dump_on_exit = False
+    try:
+        yield
+    finally:
+        syscalls.output_enabled, syscalls.dump_on_exit = saved
+
+
+def _copyMemory(ram):
+    """
+    Returns a new memory of the same kind with the content of ram, and for PagedMemory its pages and permissions
+    """
+    if isinstance(ram, PagedMemory):
+        copy = PagedMemory(ram.getSize(), ram.strict, ram.default_permissions)
+        copy.pages = {page: bytearray(data) for page, data in ram.pages.items()}
+        copy.permissions = dict(ram.permissions)
+        return copy
+    copy = Memory(ram.getSize())
+    copy.write_bytes(0, ram.mem)
+    return copy
+
+
+def _copy(cpu):
+    """
+    Returns a new CPU of the same engine with the registers, pc and memory of cpu
+    """
+    copy = type(cpu)(_copyMemory(cpu.ram))
+    for index in range(32):
+        setReg(copy, index, int(cpu.regs[index]))
+    copy.pc = int(cpu.pc)
+    return copy
+
+
+def _disassemble(cpu, pc: int) -> str:
+    try:
+        return tracing.formatInstruction(cpu.lookup(pc))
+    except Exception as error:
+        return 'can not decode: {!r}'.format(error)
+
+
+class Lockstep:
+    """
+        Compare a candidate engine against the reference CPU.
+        Both must be loaded with the same program, each on its own Memory or PagedMemory.
+        Args:
+            reference: the CPU (intbv) instance, runs without guest output
+            candidate: the engine under test, its output and exit dump go through as usual
+            interval: instructions between two comparisons. 1 checks every instruction
+    """
+    def __init__(self, reference, candidate, interval: int = 1):
+        self.reference = reference
+        self.candidate = candidate
+        self.interval = interval
+        self.retired = 0  # Instructions retired by both and found equal
+        self.result = None  # RunResult of the candidate for the last interval
+
+    def compare(self, reference_result, candidate_result) -> list:
+        """
+        Returns: the differences between the two engines after an interval, empty when they agree
+        """
+        differences = list()
+        for field in ('reason', 'exit_code', 'retired', 'fault_address'):
+            expected, got = getattr(reference_result, field), getattr(candidate_result, field)
+            if expected != got:
+                differences.append('{}: {}, {}'.format(field, expected, got))
+        if int(self.reference.pc) != int(self.candidate.pc):
+            differences.append('pc: {:#x}, {:#x}'.format(int(self.reference.pc), int(self.candidate.pc)))
+        # x0 is skipped, FastCPU only clears it at the next fetch
+        for index in range(1, 32):
+            expected, got = int(self.reference.regs[index]), int(self.candidate.regs[index])
+            if expected != got:
+                differences.append('x{}: {:#010x}, {:#010x}'.format(index, expected, got))
+        for start, end in sorted(set(self.reference.ram.dirtyRanges()) | set(self.candidate.ram.dirtyRanges())):
+            expected = self.reference.ram.read_bytes(start, end - start)
+            got = self.candidate.ram.read_bytes(start, end - start)
+            if expected != got:
+                offset = next(i for i in range(end - start) if expected[i] != got[i])
+                differences.append('memory {:#x}: {:#04x}, {:#04x}'.format(start + offset, expected[offset],
+                                                                          got[offset]))
+        return differences
+
+    def step(self, steps: int) -> list:
+        """
+        Run both engines for up to steps instructions.
+        Returns: the differences, see compare()
+        """
+        self.reference.ram.clearDirty()
+        self.candidate.ram.clearDirty()
+        with _quiet():
+            reference_result = self.reference.run(steps)
+        self.result = self.candidate.run(steps)
+        return self.compare(reference_result, self.result)
+
+    def run(self, max_steps: int = None) -> Divergence:
+        """
+        Run both engines until they stop, max_steps instructions are retired or they diverge.
+        ebreak does not stop the run.
+        Returns: the first Divergence, or None if the engines agreed all the way
+        """
+        while max_steps is None or self.retired < max_steps:
+            steps = self.interval if max_steps is None else min(self.interval, max_steps - self.retired)
+            pc = int(self.candidate.pc)
+            instructions = (_disassemble(self.reference, pc), _disassemble(self.candidate, pc))
+            saved = (_copy(self.reference), _copy(self.candidate)) if steps > 1 else None
+            differences = self.step(steps)
+            if differences:
+                if saved is None:
+                    return Divergence(self.retired, pc, instructions, differences)
+                # Replay the interval one instruction at a time to find the first one that differs
+                replay = Lockstep(saved[0], saved[1], 1)
+                with _quiet():
+                    divergence = replay.run(steps)
+                if divergence is None:  # Should not happen, keep what the interval found
+                    return Divergence(self.retired, pc, instructions, differences)
+                return divergence._replace(retired=self.retired + divergence.retired)
+            self.retired += self.result.retired
+            if self.result.reason not in (STOP_STEP_LIMIT, STOP_EBREAK):
+                return None
+        return None
+
+
+def report(divergence: Divergence) -> str:
+    lines = ['Engines diverged after {} instructions, at pc {:#x}'.format(divergence.retired, divergence.pc),
+             '  reference decodes: ' + divergence.instructions[0],
+             '  candidate decodes: ' + divergence.instructions[1],
+             '  differences (reference, candidate):']
+    lines.extend('    ' + difference for difference in divergence.differences)
+    return '\n'.join(lines) + '\n'
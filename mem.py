@@ -1,19 +1,209 @@
+import struct
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional, only Memory.array() needs it
+    numpy = None
+
+_halfword = struct.Struct('<H')
+_word = struct.Struct('<I')
+
+_page_bits = 8  # Writes are tracked per page of 256 bytes
+_page_size = 1 << _page_bits
+
+# PagedMemory allocates the address space in pages of 4 KiB
+_paged_bits = 12
+_paged_size = 1 << _paged_bits
+_paged_mask = _paged_size - 1
+_address_space = 1 << 32
+_zero_page = bytes(_paged_size)  # What unmapped pages read as
+
+# Page permissions, the same bits as the p_flags of an ELF segment
+PERM_EXECUTE = 1
+PERM_WRITE = 2
+PERM_READ = 4
+
+# Watchpoint kinds
+WATCH_WRITE = 1
+WATCH_READ = 2
+WATCH_ACCESS = WATCH_READ | WATCH_WRITE
+
+# Access methods a memory with watchpoints checks, and the width of their access (None: given by the arguments)
+_watched_reads = {'readAsInt': 1, 'readHalfWordAsInt': 2, 'readWordAsInt': 4, 'read': 1, 'readHalfWord': 2,
+                  'readWord': 4}
+_watched_writes = {'writeByte': 1, 'writeHalfWord': 2, 'writeWord': 4, 'write': None, 'write_bytes': None}
+
+
+class MemoryFault(IndexError):
+    """
+    Raised when an access falls outside the memory.
+    Args:
+        address: first address of the access
+    """
+    def __init__(self, message: str, address: int):
+        IndexError.__init__(self, message)
+        self.address = address
+
+
+class AccessFault(MemoryFault):
+    """
+    Raised when an access is not allowed by the permissions of its page,
+    or reads an unmapped page of a strict PagedMemory.
+    """
+
+
+class WatchpointHit(Exception):
+    """
+    Raised before an access that touches a watchpoint, the access is not done.
+    Args:
+        address: first watched address of the access
+        kind: WATCH_READ or WATCH_WRITE
+    """
+    def __init__(self, address: int, kind: int):
+        Exception.__init__(self, hex(address))
+        self.address = address
+        self.kind = kind
+
+
+# =========== Watchpoints =========== #
+# Shared by Memory and PagedMemory. While a memory has watchpoints, the methods in _watched_reads and
+# _watched_writes are replaced on the instance by ones that look up the 4 KiB pages of the access in
+# watched_pages first. Without watchpoints the class methods run untouched.
+# Engines bind memory methods when they decode, so they have to drop their decodes after the first
+# watchpoint is added and after the last one is removed (debugger.py does).
+
+def _checkWatch(memory, address: int, length: int, kind: int):
+    if not memory.watching:
+        return
+    for page in range(address >> _paged_bits, ((address + max(length, 1) - 1) >> _paged_bits) + 1):
+        for start, end, watch_kind in memory.watched_pages.get(page, ()):
+            if watch_kind & kind and start < address + length and address < end:
+                raise WatchpointHit(max(start, address), kind)
+
+
+def _watchedRead(memory, method, width: int):
+    def read(address):
+        _checkWatch(memory, address, width, WATCH_READ)
+        return method(memory, address)
+    return read
+
+
+def _watchedWrite(memory, method, width: int):
+    def write(address, value):
+        _checkWatch(memory, address, width or len(value), WATCH_WRITE)
+        method(memory, address, value)
+    return write
+
+
+def _watchedFill(memory, method):
+    def fill(address, length, value=0):
+        _checkWatch(memory, address, length, WATCH_WRITE)
+        method(memory, address, length, value)
+    return fill
+
+
+def _watchedCopy(memory, method):
+    def copy(destination, source, length):
+        _checkWatch(memory, source, length, WATCH_READ)
+        _checkWatch(memory, destination, length, WATCH_WRITE)
+        method(memory, destination, source, length)
+    return copy
+
+
+def _addWatchpoint(memory, address: int, length: int, kind: int):
+    if not memory.watched_pages:
+        cls = type(memory)
+        for name, width in _watched_reads.items():
+            setattr(memory, name, _watchedRead(memory, getattr(cls, name), width))
+        for name, width in _watched_writes.items():
+            setattr(memory, name, _watchedWrite(memory, getattr(cls, name), width))
+        memory.fill = _watchedFill(memory, cls.fill)
+        memory.copy = _watchedCopy(memory, cls.copy)
+    for page in range(address >> _paged_bits, ((address + length - 1) >> _paged_bits) + 1):
+        memory.watched_pages.setdefault(page, []).append((address, address + length, kind))
+
+
+def _removeWatchpoint(memory, address: int, length: int, kind: int):
+    for page in range(address >> _paged_bits, ((address + length - 1) >> _paged_bits) + 1):
+        watches = memory.watched_pages.get(page, [])
+        if (address, address + length, kind) in watches:
+            watches.remove((address, address + length, kind))
+        if not watches:
+            memory.watched_pages.pop(page, None)
+    if not memory.watched_pages:
+        for name in list(_watched_reads) + list(_watched_writes) + ['fill', 'copy']:
+            vars(memory).pop(name, None)
+
+
+# =========== Devices =========== #
+# Shared by Memory and PagedMemory. A device region has read(offset, width) -> int and
+# write(offset, width, value) callbacks, and is entered in device_pages under each 4 KiB page it covers.
+# The devices are only looked up where an access would otherwise fault: past the end of a flat Memory, or
+# on a page PagedMemory does not have selected. Accesses to RAM never look at them.
+
+def _mapDevice(memory, start: int, length: int, read, write):
+    for page in range(start >> _paged_bits, ((start + length - 1) >> _paged_bits) + 1):
+        memory.device_pages.setdefault(page, []).append((start, start + length, read, write))
+
+
+def _device(memory, address: int, width: int):
+    """
+    Returns: (start, read, write) of the device region holding address .. address+width-1, or None
+    """
+    for start, end, read, write in memory.device_pages.get(address >> _paged_bits, ()):
+        if start <= address and address + width <= end and width in (1, 2, 4):
+            return start, read, write
+    return None
+
+
+def _deviceRead(memory, address: int, width: int, message: str) -> int:
+    device = _device(memory, address, width)
+    if device is None:
+        raise MemoryFault(message + hex(address), address)
+    return device[1](address - device[0], width)
+
+
+def _deviceWrite(memory, address: int, width: int, value: int, message: str):
+    device = _device(memory, address, width)
+    if device is None:
+        raise MemoryFault(message + hex(address), address)
+    device[2](address - device[0], width, value)
+
+
+def _compareBytes(a, b) -> int:
+    """
+    memcmp of two equally long buffers, for when NumPy can not be used
+    """
+    if a == b:
+        return 0
+    for x, y in zip(a, b):
+        if x != y:
+            return x - y
+
 
 class Memory:
     """
     Object class of a Random access memory. Byte addressable.
+    The memory is one contiguous bytearray, values are stored little endian.
+    Every write marks its pages in dirty, one byte per page of _page_size bytes.
     Args:
         size: size of memory
     """
     def __init__(self, size: int):
-        self.mem = [bytes() for i in range(size)]
-    
+        self.mem = bytearray(size)
+        self.view = memoryview(self.mem)
+        self.dirty = bytearray((size + _page_size - 1) >> _page_bits)
+        self._array = None
+        self.watched_pages = dict()  # 4 KiB page number -> list of (start, end, WATCH_ kind), see addWatchpoint()
+        self.watching = True  # False lets accesses through without checking the watchpoints
+        self.device_pages = dict()  # 4 KiB page number -> list of (start, end, read, write), see mapDevice()
+
     def getSize(self) -> int:
         """
         Returns the size or number of bytes of the memory module.
         """
         return len(self.mem)
-    
+
     def write(self, address: int, value: bytearray):
         """
         Write the passed bytes to address according to size.
@@ -21,46 +211,467 @@ class Memory:
             address: location to write to.
             value: value as bytearray object
         """
-        for i, val in enumerate(value):
-            self.mem[address+i] = value
+        self.write_bytes(address, value)
 
     def read(self, address: int) -> bytes:
         """
         Read address as byte
         """
-        return bytearray() + self.mem[address]
+        return bytearray((self.readAsInt(address),))
 
     def readHalfWord(self, address: int) -> bytearray:
-        return bytearray(self.mem[address] + self.mem[address+1])
-    
+        return bytearray(self.read_bytes(address, 2))
+
     def readWord(self, address: int) -> bytearray:
-        return bytearray(self.mem[address] + self.mem[address+1] + self.mem[address+2] + self.mem[address+3])
+        return bytearray(self.read_bytes(address, 4))
 
     def readAsInt(self, address: int) -> int:
-        # TODO check if valid address
-        val = int.from_bytes(self.mem[address], 'little')
-        return val
-    
+        try:
+            return self.mem[address]
+        except IndexError:
+            return _deviceRead(self, address, 1, 'byte read out of memory range: ')
+
+    def readHalfWordAsInt(self, address: int) -> int:
+        """
+        Read the little endian, unsigned halfword at address
+        """
+        try:
+            return _halfword.unpack_from(self.mem, address)[0]
+        except struct.error:
+            return _deviceRead(self, address, 2, 'halfword read out of memory range: ')
+
+    def readWordAsInt(self, address: int) -> int:
+        """
+        Read the little endian, unsigned word at address
+        """
+        try:
+            return _word.unpack_from(self.mem, address)[0]
+        except struct.error:
+            return _deviceRead(self, address, 4, 'word read out of memory range: ')
+
+    # Instruction fetch. The flat memory has no permissions, any word can be executed
+    fetchWordAsInt = readWordAsInt
+
+    def writeByte(self, address: int, value: int):
+        """
+        Write the low 8 bits of value to address
+        """
+        try:
+            self.mem[address] = value & 0xff
+        except IndexError:
+            return _deviceWrite(self, address, 1, value & 0xff, 'byte write out of memory range: ')
+        self.dirty[address >> _page_bits] = 1
+
+    def writeHalfWord(self, address: int, value: int):
+        """
+        Write the low 16 bits of value to address, little endian
+        """
+        try:
+            _halfword.pack_into(self.mem, address, value & 0xffff)
+        except struct.error:
+            return _deviceWrite(self, address, 2, value & 0xffff, 'halfword write out of memory range: ')
+        self.dirty[address >> _page_bits] = 1
+        self.dirty[(address + 1) >> _page_bits] = 1
+
+    def writeWord(self, address: int, value: int):
+        """
+        Write the low 32 bits of value to address, little endian
+        """
+        try:
+            _word.pack_into(self.mem, address, value & 0xffffffff)
+        except struct.error:
+            return _deviceWrite(self, address, 4, value & 0xffffffff, 'word write out of memory range: ')
+        self.dirty[address >> _page_bits] = 1
+        self.dirty[(address + 3) >> _page_bits] = 1
+
+    def read_bytes(self, address: int, length: int) -> memoryview:
+        """
+        Returns a view of length bytes starting at address. Nothing is copied,
+        the view changes when the memory is written.
+        """
+        if address < 0 or address + length > len(self.mem):
+            value = _deviceRead(self, address, length, 'read out of memory range: ')
+            return memoryview(value.to_bytes(length, 'little'))
+        return self.view[address:address + length]
+
+    def write_bytes(self, address: int, data):
+        """
+        Copy data (bytes, bytearray, memoryview or any buffer) to address in one slice assignment
+        """
+        length = len(data)
+        if address < 0 or address + length > len(self.mem):
+            return _deviceWrite(self, address, length, int.from_bytes(data, 'little'), 'write out of memory range: ')
+        self.view[address:address + length] = data
+        self._markDirty(address, length)
+
+    def _checkRange(self, address: int, length: int, access: str):
+        if address < 0 or length < 0 or address + length > len(self.mem):
+            raise MemoryFault(access + ' out of memory range: ' + hex(address), address)
+
+    def _markDirty(self, address: int, length: int):
+        if length:
+            first, last = address >> _page_bits, (address + length - 1) >> _page_bits
+            self.dirty[first:last + 1] = b'\x01' * (last - first + 1)
+
+    # =========== Watchpoint Area =========== #
+    def addWatchpoint(self, address: int, length: int, kind: int = WATCH_WRITE):
+        """
+        Raise WatchpointHit before any access of kind (WATCH_*) to address .. address+length-1
+        """
+        _addWatchpoint(self, address, length, kind)
+
+    def removeWatchpoint(self, address: int, length: int, kind: int = WATCH_WRITE):
+        _removeWatchpoint(self, address, length, kind)
+
+    # =========== Device Area =========== #
+    def mapDevice(self, start: int, length: int, read, write):
+        """
+        Send the accesses to start .. start+length-1 to a device instead of memory.
+        The region has to be past the end of the memory.
+        Args:
+            read: read(offset in the region, width in bytes) -> unsigned value
+            write: write(offset in the region, width in bytes, unsigned value)
+        """
+        if start < len(self.mem):
+            raise ValueError('device region {:#x} overlaps the memory, which ends at {:#x}'.format(start,
+                                                                                                len(self.mem)))
+        _mapDevice(self, start, length, read, write)
+
+    # =========== Bulk Operations =========== #
+    def array(self):
+        """
+        Returns a NumPy uint8 array sharing the storage of the memory.
+        Writes through it are not tracked by dirty, use the bulk operations below for that.
+        Raises: ImportError without NumPy
+        """
+        if numpy is None:
+            raise ImportError('Memory.array() needs NumPy')
+        if self._array is None:
+            self._array = numpy.frombuffer(self.mem, dtype=numpy.uint8)
+        return self._array
+
+    def fill(self, address: int, length: int, value: int = 0):
+        """
+        Set length bytes from address to the low 8 bits of value, like memset
+        """
+        self._checkRange(address, length, 'fill')
+        if numpy is not None:
+            self.array()[address:address + length] = value & 0xff
+        else:
+            self.view[address:address + length] = bytes((value & 0xff,)) * length
+        self._markDirty(address, length)
+
+    def copy(self, destination: int, source: int, length: int):
+        """
+        Copy length bytes from source to destination, like memmove: the ranges may overlap
+        """
+        self._checkRange(source, length, 'copy read')
+        self._checkRange(destination, length, 'copy write')
+        if numpy is not None:
+            array = self.array()
+            array[destination:destination + length] = array[source:source + length]
+        else:
+            self.mem[destination:destination + length] = self.mem[source:source + length]
+        self._markDirty(destination, length)
+
+    def compare(self, first: int, second: int, length: int) -> int:
+        """
+        Compare length bytes at first and second, like memcmp
+        Returns: 0 if equal, else the difference of the first bytes that differ (first - second)
+        """
+        self._checkRange(first, length, 'compare')
+        self._checkRange(second, length, 'compare')
+        if numpy is None:
+            return _compareBytes(self.view[first:first + length], self.view[second:second + length])
+        array = self.array()
+        a = array[first:first + length]
+        b = array[second:second + length]
+        differ = numpy.flatnonzero(a != b)
+        if not len(differ):
+            return 0
+        return int(a[differ[0]]) - int(b[differ[0]])
+
+    def clearDirty(self):
+        """
+        Mark every page clean, e.g. once the program is loaded
+        """
+        self.dirty[:] = bytes(len(self.dirty))
+
+    def dirtyRanges(self) -> list:
+        """
+        Returns: list of (start, end) address ranges of the pages written since clearDirty(),
+                 adjacent pages merged into one range
+        """
+        ranges = list()
+        page = self.dirty.find(1)
+        while page != -1:
+            end = self.dirty.find(0, page)
+            if end == -1:
+                end = len(self.dirty)
+            ranges.append((page << _page_bits, min(end << _page_bits, len(self.mem))))
+            page = self.dirty.find(1, end)
+        return ranges
+
     def dump(self) -> list:
-        values = list()
-        for i, val in enumerate(self.mem):
-            values.append(hex(int.from_bytes(val, 'little')))
-
-        # dum = str()
-        # for i, val in enumerate(values):
-        #    dum = dum + hex(i) +' '+ val + os.linesep
-        return values
-
-    # TODO: Edit this function to be more efficient
-    def dump_data(self) -> list:
-        values = list()
-        for i in range(0x2000, self.getSize()):
-            values.append(self.mem[i])
-        return values
+        return list(map(hex, self.mem))
+
+    def getUsedSize(self) -> int:
+        """
+        Returns the end of the memory in use, all of it for a flat memory
+        """
+        return len(self.mem)
+
+    def dump_data(self) -> memoryview:
+        """
+        Returns a view of the memory from the start of the data section (0x2000) to the end
+        """
+        return self.read_bytes(0x2000, self.getSize() - 0x2000)
+
+
+class PagedMemory:
+    """
+    Memory covering the whole 32 bit address space, with the same methods as Memory.
+    Pages of _paged_size bytes are allocated on their first write. Unmapped pages read as zeros,
+    or raise AccessFault if strict. Each page has PERM_* permissions, pages without any set get
+    default_permissions. The last page read and the last page written are cached, so accesses
+    within one page cost one compare more than the flat Memory.
+    Writes are tracked per page of _paged_size bytes.
+    Args:
+        size: size of the address space
+        strict: reads of unmapped pages raise AccessFault instead of reading zeros
+        default_permissions: permissions of the pages setPermissions() was not called for
+    """
+    def __init__(self, size: int = _address_space, strict: bool = False,
+                 default_permissions: int = PERM_READ | PERM_WRITE):
+        self.size = size
+        self.strict = strict
+        self.default_permissions = default_permissions
+        self.pages = dict()        # page number -> bytearray of the page
+        self.permissions = dict()  # page number -> PERM_* bits
+        self.dirty_pages = set()   # pages written since clearDirty()
+        self._read_page = -1       # page number and content of the last page read
+        self._read_data = None
+        self._write_page = -1      # page number and content of the last page written
+        self._write_data = None
+        self.watched_pages = dict()
+        self.watching = True
+        self.device_pages = dict()
+
+    def getSize(self) -> int:
+        return self.size
+
+    def getUsedSize(self) -> int:
+        """
+        Returns the end of the highest allocated page
+        """
+        return (max(self.pages) + 1) << _paged_bits if self.pages else 0
+
+    def setPermissions(self, start: int, end: int, permissions: int):
+        """
+        Set the PERM_* bits of every page in start up to end
+        """
+        for page in range(start >> _paged_bits, ((end - 1) >> _paged_bits) + 1):
+            self.permissions[page] = permissions
+        self._read_page = self._write_page = -1
+
+    # =========== Watchpoint Area =========== #
+    def addWatchpoint(self, address: int, length: int, kind: int = WATCH_WRITE):
+        """
+        Raise WatchpointHit before any access of kind (WATCH_*) to address .. address+length-1
+        """
+        _addWatchpoint(self, address, length, kind)
+
+    def removeWatchpoint(self, address: int, length: int, kind: int = WATCH_WRITE):
+        _removeWatchpoint(self, address, length, kind)
+
+    # =========== Device Area =========== #
+    def mapDevice(self, start: int, length: int, read, write):
+        """
+        Send the accesses to start .. start+length-1 to a device instead of memory, see Memory.mapDevice().
+        The pages of the region can not be allocated, they belong to the device.
+        """
+        pages = range(start >> _paged_bits, ((start + length - 1) >> _paged_bits) + 1)
+        if any(page in self.pages for page in pages):
+            raise ValueError('device region {:#x} overlaps allocated memory'.format(start))
+        _mapDevice(self, start, length, read, write)
+        self._read_page = self._write_page = -1
+
+    # =========== Page Selection =========== #
+    def _readable(self, address: int) -> bytes:
+        """
+        Returns the content of the page of address, after checking it can be read
+        """
+        page = address >> _paged_bits
+        if not 0 <= address < self.size:
+            raise MemoryFault('read out of memory range: ' + hex(address), address)
+        if not self.permissions.get(page, self.default_permissions) & PERM_READ:
+            raise AccessFault('read of a page without read permission: ' + hex(address), address)
+        data = self.pages.get(page)
+        if data is None:
+            if self.strict:
+                raise AccessFault('read of an unmapped address: ' + hex(address), address)
+            data = _zero_page
+        return data
+
+    def _writable(self, address: int) -> bytearray:
+        """
+        Returns the content of the page of address, after checking it can be written.
+        The page is allocated and marked dirty here, so writes hitting the cache skip both.
+        """
+        page = address >> _paged_bits
+        if not 0 <= address < self.size:
+            raise MemoryFault('write out of memory range: ' + hex(address), address)
+        if not self.permissions.get(page, self.default_permissions) & PERM_WRITE:
+            raise AccessFault('write to a page without write permission: ' + hex(address), address)
+        data = self.pages.get(page)
+        if data is None:
+            data = self.pages[page] = bytearray(_paged_size)
+            if self._read_page == page:
+                self._read_page = -1  # It cached the zero page
+        self.dirty_pages.add(page)
+        return data
+
+    def _selectRead(self, address: int) -> bytes:
+        self._read_data = self._readable(address)
+        self._read_page = address >> _paged_bits
+        return self._read_data
+
+    def _selectWrite(self, address: int) -> bytearray:
+        self._write_data = self._writable(address)
+        self._write_page = address >> _paged_bits
+        return self._write_data
+
+    # =========== Access Area =========== #
+    def readAsInt(self, address: int) -> int:
+        if address >> _paged_bits == self._read_page:
+            return self._read_data[address & _paged_mask]
+        if address >> _paged_bits in self.device_pages:
+            return _deviceRead(self, address, 1, 'byte read of no device: ')
+        return self._selectRead(address)[address & _paged_mask]
+
+    def readHalfWordAsInt(self, address: int) -> int:
+        offset = address & _paged_mask
+        if address >> _paged_bits == self._read_page and offset <= _paged_size - 2:
+            return _halfword.unpack_from(self._read_data, offset)[0]
+        return int.from_bytes(self.read_bytes(address, 2), 'little')
+
+    def readWordAsInt(self, address: int) -> int:
+        offset = address & _paged_mask
+        if address >> _paged_bits == self._read_page and offset <= _paged_size - 4:
+            return _word.unpack_from(self._read_data, offset)[0]
+        return int.from_bytes(self.read_bytes(address, 4), 'little')
+
+    def fetchWordAsInt(self, address: int) -> int:
+        """
+        Read the instruction word at address, raise AccessFault if its page has no execute permission
+        """
+        if not self.permissions.get(address >> _paged_bits, self.default_permissions) & PERM_EXECUTE:
+            raise AccessFault('instruction fetch from a page without execute permission: ' + hex(address), address)
+        return self.readWordAsInt(address)
+
+    def writeByte(self, address: int, value: int):
+        if address >> _paged_bits == self._write_page:
+            self._write_data[address & _paged_mask] = value & 0xff
+        elif address >> _paged_bits in self.device_pages:
+            _deviceWrite(self, address, 1, value & 0xff, 'byte write of no device: ')
+        else:
+            self._selectWrite(address)[address & _paged_mask] = value & 0xff
+
+    def writeHalfWord(self, address: int, value: int):
+        offset = address & _paged_mask
+        if address >> _paged_bits == self._write_page and offset <= _paged_size - 2:
+            _halfword.pack_into(self._write_data, offset, value & 0xffff)
+        else:
+            self.write_bytes(address, (value & 0xffff).to_bytes(2, 'little'))
+
+    def writeWord(self, address: int, value: int):
+        offset = address & _paged_mask
+        if address >> _paged_bits == self._write_page and offset <= _paged_size - 4:
+            _word.pack_into(self._write_data, offset, value & 0xffffffff)
+        else:
+            self.write_bytes(address, (value & 0xffffffff).to_bytes(4, 'little'))
+
+    def read(self, address: int) -> bytes:
+        return bytearray((self.readAsInt(address),))
+
+    def readHalfWord(self, address: int) -> bytearray:
+        return bytearray(self.read_bytes(address, 2))
+
+    def readWord(self, address: int) -> bytearray:
+        return bytearray(self.read_bytes(address, 4))
+
+    def write(self, address: int, value: bytearray):
+        self.write_bytes(address, value)
+
+    def read_bytes(self, address: int, length: int):
+        """
+        Returns length bytes starting at address. Within one allocated page this is a view, like
+        Memory.read_bytes(), across pages it is a copy.
+        """
+        if address < 0 or address + length > self.size:
+            raise MemoryFault('read out of memory range: ' + hex(address), address)
+        if address >> _paged_bits in self.device_pages:
+            return memoryview(_deviceRead(self, address, length, 'read of no device: ').to_bytes(length, 'little'))
+        offset = address & _paged_mask
+        if offset + length <= _paged_size:
+            return memoryview(self._selectRead(address))[offset:offset + length]
+        content = bytearray()
+        end = address + length
+        while address < end:
+            offset = address & _paged_mask
+            chunk = min(_paged_size - offset, end - address)
+            content += self._selectRead(address)[offset:offset + chunk]
+            address += chunk
+        return memoryview(content)
+
+    def write_bytes(self, address: int, data):
+        """
+        Copy data to address, one slice assignment per page
+        """
+        length = len(data)
+        if address < 0 or address + length > self.size:
+            raise MemoryFault('write out of memory range: ' + hex(address), address)
+        if address >> _paged_bits in self.device_pages:
+            return _deviceWrite(self, address, length, int.from_bytes(data, 'little'), 'write of no device: ')
+        data = memoryview(data).cast('B')
+        done = 0
+        while done < length:
+            offset = (address + done) & _paged_mask
+            chunk = min(_paged_size - offset, length - done)
+            self._selectWrite(address + done)[offset:offset + chunk] = data[done:done + chunk]
+            done += chunk
+
+    def fill(self, address: int, length: int, value: int = 0):
+        self.write_bytes(address, bytes((value & 0xff,)) * length)
+
+    def copy(self, destination: int, source: int, length: int):
+        self.write_bytes(destination, bytes(self.read_bytes(source, length)))
+
+    def compare(self, first: int, second: int, length: int) -> int:
+        return _compareBytes(self.read_bytes(first, length), self.read_bytes(second, length))
+
+    def clearDirty(self):
+        self.dirty_pages.clear()
+        self._write_page = -1  # The next write to each page marks it dirty again
+
+    def dirtyRanges(self) -> list:
+        ranges = list()
+        for page in sorted(self.dirty_pages):
+            if ranges and ranges[-1][1] == page << _paged_bits:
+                ranges[-1] = (ranges[-1][0], (page + 1) << _paged_bits)
+            else:
+                ranges.append((page << _paged_bits, (page + 1) << _paged_bits))
+        return ranges
+
+    def dump_data(self):
+        """
+        Returns the memory from the start of the data section (0x2000) to the end of the allocated pages
+        """
+        return self.read_bytes(0x2000, max(self.getUsedSize() - 0x2000, 0))
 
 if __name__ == '__main__':
     x = Memory(50)
     x.write(0x22, int(22).to_bytes(1,'little'))
     x.write(0, int(9).to_bytes(1, 'little'))
     dump = x.dump()
-    for i in range(len(dump)): print(dump[i])
\ No newline at end of file
+    for i in range(len(dump)): print(dump[i])
@@ -0,0 +1,271 @@
+# Cycle estimates from a classic five stage IF/ID/EX/MEM/WB pipeline.
+# The model wraps fetch() of a CPU, like the profiler does: the engine runs each instruction as usual, then the
+# model works out the cycle it entered EX from the registers it reads, the unit it needs and the outcome of the
+# previous control transfer. Nothing is attached, and nothing is paid, while no timing is asked for.
+#
+# The pipeline is in order and issues one instruction per cycle, with:
+#   - a register ready cycle per register: an ALU result can be forwarded to the next instruction, a load result
+#     one cycle later (a load-use stall). Without forwarding every result is read after WB.
+#   - MUL and DIV/REM holding EX for mul_latency and div_latency cycles, like a not pipelined multiplier/divider.
+#   - branch prediction at IF: a direction predictor for the conditional branches and a branch target buffer
+#     for every control transfer. A conditional branch or JALR going elsewhere than fetched flushes the
+#     instructions fetched behind it (resolved in EX), a JAL missing in the BTB costs one bubble (resolved in ID).
+# Caches are not part of the model, every memory access takes one cycle.
+
+from functools import partial
+from fastcpu import FastCPU
+
+_loads = ('lb', 'lh', 'lw', 'lbu', 'lhu')
+_muls = ('mul', 'mulh', 'mulhsu', 'mulhu')
+_divs = ('div', 'divu', 'rem', 'remu')
+_branches = ('beq', 'bne', 'blt', 'bge', 'bltu', 'bgeu')
+_stopping = ('ecall', 'ebreak')  # Retire even when they stop the run
+
+# Stall kinds
+STALL_LOAD_USE = 'load-use'
+STALL_RAW = 'raw'
+STALL_MULDIV = 'mul/div'
+STALL_BRANCH = 'branch flush'
+STALL_JUMP = 'jump flush'
+stall_kinds = (STALL_LOAD_USE, STALL_RAW, STALL_MULDIV, STALL_BRANCH, STALL_JUMP)
+
+
+# =========== Predictors =========== #
+class StaticPredictor:
+    """
+        Backward branches taken, forward branches not taken.
+    """
+    name = 'static'
+
+    def predict(self, pc: int, offset: int) -> bool:
+        return offset < 0
+
+    def update(self, pc: int, taken: bool):
+        pass
+
+
+class BimodalPredictor:
+    """
+        A table of 2 bit saturating counters indexed by pc.
+        Args:
+            entries: counters in the table, a power of two
+    """
+    name = 'bimodal'
+
+    def __init__(self, entries: int = 1024):
+        self.mask = entries - 1
+        self.counters = [1] * entries  # Weakly not taken
+
+    def predict(self, pc: int, offset: int) -> bool:
+        return self.counters[(pc >> 2) & self.mask] >= 2
+
+    def update(self, pc: int, taken: bool):
+        index = (pc >> 2) & self.mask
+        counter = self.counters[index]
+        if taken:
+            if counter < 3:
+                self.counters[index] = counter + 1
+        elif counter > 0:
+            self.counters[index] = counter - 1
+
+
+class GsharePredictor(BimodalPredictor):
+    """
+        2 bit counters indexed by pc xor the global history of the last history_bits branch outcomes.
+        Args:
+            entries: counters in the table, a power of two
+            history_bits: branch outcomes kept in the global history
+    """
+    name = 'gshare'
+
+    def __init__(self, entries: int = 1024, history_bits: int = 10):
+        BimodalPredictor.__init__(self, entries)
+        self.history = 0
+        self.history_mask = (1 << history_bits) - 1
+
+    def predict(self, pc: int, offset: int) -> bool:
+        return self.counters[((pc >> 2) ^ self.history) & self.mask] >= 2
+
+    def update(self, pc: int, taken: bool):
+        index = ((pc >> 2) ^ self.history) & self.mask
+        counter = self.counters[index]
+        if taken:
+            if counter < 3:
+                self.counters[index] = counter + 1
+        elif counter > 0:
+            self.counters[index] = counter - 1
+        self.history = ((self.history << 1) | taken) & self.history_mask
+
+
+predictors = {'static': StaticPredictor, 'bimodal': BimodalPredictor, 'gshare': GsharePredictor}
+
+
+class BranchTargetBuffer:
+    """
+        Direct mapped table of the last target of each control transfer, tags and targets in flat lists.
+        Args:
+            entries: a power of two
+    """
+    def __init__(self, entries: int = 64):
+        self.mask = entries - 1
+        self.tags = [None] * entries
+        self.targets = [0] * entries
+        self.hits = 0
+        self.lookups = 0
+
+    def lookup(self, pc: int):
+        """
+        Returns: the target last taken from pc, None when pc is not in the buffer
+        """
+        self.lookups += 1
+        index = (pc >> 2) & self.mask
+        if self.tags[index] != pc:
+            return None
+        self.hits += 1
+        return self.targets[index]
+
+    def update(self, pc: int, target: int):
+        index = (pc >> 2) & self.mask
+        self.tags[index] = pc
+        self.targets[index] = target
+
+
+# =========== Pipeline =========== #
+class PipelineModel:
+    """
+        Counts the cycles a CPU would take on a five stage pipeline.
+        Creating the model attaches it to the CPU, it counts from then on.
+        Args:
+            cpu: any engine. TranslatingCPU runs on its interpreter while timed
+            predictor: a predictor of predictors, BimodalPredictor() by default
+            btb_entries: entries of the branch target buffer
+            mul_latency: cycles MUL, MULH, MULHSU and MULHU hold EX
+            div_latency: cycles DIV, DIVU, REM and REMU hold EX
+            branch_penalty: cycles lost when a branch or JALR resolved in EX was mispredicted
+            forwarding: False reads every result from the register file, after WB
+    """
+    def __init__(self, cpu, predictor=None, btb_entries: int = 64, mul_latency: int = 3, div_latency: int = 32,
+                 branch_penalty: int = 2, forwarding: bool = True):
+        self.cpu = cpu
+        self.predictor = predictor or BimodalPredictor()
+        self.btb = BranchTargetBuffer(btb_entries)
+        self.mul_latency = mul_latency
+        self.div_latency = div_latency
+        self.branch_penalty = branch_penalty
+        self.forwarding = forwarding
+        self.instructions = 0
+        self.issue = 1           # Cycle the last instruction entered EX, the first one enters at cycle 2
+        self.next_issue = 2      # Earliest cycle the next instruction can enter EX
+        self.next_kind = None    # Stall kind of the cycles between issue + 1 and next_issue
+        self.ready = [0] * 32    # Cycle each register can be read in EX
+        self.ready_kind = [STALL_RAW] * 32  # Stall kind of waiting for each register
+        self.stalls = dict.fromkeys(stall_kinds, 0)
+        self.branches = 0
+        self.predicted = 0       # Conditional branches whose direction was predicted right
+        self.jumps = 0
+        self.jump_mispredicted = 0
+        self.attach()
+
+    def attach(self):
+        cpu = self.cpu
+        fetch = cpu.fetch
+        lookup = cpu.lookup
+        account = self.account
+        if getattr(cpu, 'translate_enabled', False):
+            # Whole blocks do not stop between instructions, run them on the interpreter
+            cpu.translate_enabled = False
+            fetch = partial(FastCPU.fetch, cpu)
+
+        def timedFetch():
+            pc = int(cpu.pc)
+            decoded = lookup(pc)
+            try:
+                fetch()
+            except Exception:
+                if decoded.name in _stopping:
+                    account(pc, decoded, pc + 4)
+                raise
+            account(pc, decoded, int(cpu.pc) if cpu.jump_flag else pc + 4)
+        cpu.fetch = timedFetch
+
+    def account(self, pc: int, decoded, next_pc: int):
+        """
+        Time one executed instruction.
+        Args:
+            pc: its address
+            decoded: its DecodedInstruction
+            next_pc: where it went on to
+        """
+        ready = self.ready
+        issue = self.next_issue
+        if issue > self.issue + 1:  # The previous instruction held EX, or flushed what was fetched behind it
+            self.stalls[self.next_kind] += issue - self.issue - 1
+        for register in (decoded.rs1, decoded.rs2):
+            if register and ready[register] > issue:
+                self.stalls[self.ready_kind[register]] += ready[register] - issue
+                issue = ready[register]
+        self.issue = issue
+        self.instructions += 1
+        name = decoded.name
+        occupancy = 1
+        if name in _muls:
+            occupancy = self.mul_latency
+        elif name in _divs:
+            occupancy = self.div_latency
+        self.next_issue = issue + occupancy
+        self.next_kind = STALL_MULDIV
+        rd = decoded.rd
+        if rd:
+            if not self.forwarding:
+                ready[rd] = issue + occupancy + 2  # Written in WB, read in ID the same cycle
+            elif name in _loads:
+                ready[rd] = issue + 2
+            else:
+                ready[rd] = issue + occupancy
+            self.ready_kind[rd] = STALL_LOAD_USE if name in _loads and self.forwarding else \
+                STALL_MULDIV if occupancy > 1 else STALL_RAW
+
+        if name in _branches:
+            self.branches += 1
+            taken = next_pc != pc + 4
+            predict_taken = self.predictor.predict(pc, decoded.imm)
+            target = self.btb.lookup(pc) if predict_taken else None
+            if predict_taken == taken:
+                self.predicted += 1
+            if (target if target is not None else pc + 4) != next_pc:
+                self.next_issue += self.branch_penalty
+                self.next_kind = STALL_BRANCH
+            self.predictor.update(pc, taken)
+            if taken:
+                self.btb.update(pc, next_pc)
+        elif name in ('jal', 'jalr'):
+            self.jumps += 1
+            if self.btb.lookup(pc) != next_pc:
+                self.jump_mispredicted += 1
+                self.next_issue += 1 if name == 'jal' else self.branch_penalty
+                self.next_kind = STALL_JUMP
+            self.btb.update(pc, next_pc)
+
+    def cycles(self) -> int:
+        """
+        Cycles from the first fetch until the last instruction left WB.
+        """
+        return self.issue + 3 if self.instructions else 0
+
+    # =========== Report Area =========== #
+    def report(self) -> str:
+        cycles = self.cycles()
+        lines = ['Pipeline: 5 stages, {}forwarding, {} predictor, MUL {} cycles, DIV {} cycles'.format(
+            '' if self.forwarding else 'no ', self.predictor.name, self.mul_latency, self.div_latency),
+            '  Cycles {:>14}'.format(cycles),
+            '  Instructions {:>8}'.format(self.instructions),
+            '  CPI {:>17.3f}'.format(cycles / self.instructions if self.instructions else 0),
+            '  Stalls:']
+        for kind in stall_kinds:
+            lines.append('    {:<14} {:>12} {:>7.2%}'.format(kind, self.stalls[kind],
+                                                           self.stalls[kind] / cycles if cycles else 0))
+        lines.append('  Branches {:>12}  direction predicted {:>10} ({:.2%})'.format(
+            self.branches, self.predicted, self.predicted / self.branches if self.branches else 0))
+        lines.append('  Jumps {:>15}  mispredicted {:>17}'.format(self.jumps, self.jump_mispredicted))
+        lines.append('  BTB hits {:>12}  of {:>10} lookups'.format(self.btb.hits, self.btb.lookups))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,155 @@
+# Instruction mix and hot pc profiler for guest programs.
+# The profiler wraps fetch() of a CPU, like tracing does, and only counts per pc while running:
+# executions and taken jumps in lists indexed by pc/4, plus call edges.
+# Mnemonics, branch outcomes, memory traffic, loops and the call graph are worked out
+# from those counts and the decode cache when the report is made.
+
+from functools import partial
+from CPU import _add_text_base, _add_text_limit
+from fastcpu import FastCPU
+import tracing
+
+_load_widths = {'lb': 1, 'lh': 2, 'lw': 4, 'lbu': 1, 'lhu': 2}
+_store_widths = {'sb': 1, 'sh': 2, 'sw': 4}
+_branches = ('beq', 'bne', 'blt', 'bge', 'bltu', 'bgeu')
+_link_registers = (1, 5)  # ra and t0, a JAL/JALR writing one of them is a call
+
+
+class Profiler:
+    """
+        Counts the instructions a CPU retires, per pc.
+        Creating the profiler attaches it to the CPU, it counts from then on.
+        Args:
+            cpu: any engine. TranslatingCPU runs on its interpreter while profiled
+    """
+    def __init__(self, cpu):
+        self.cpu = cpu
+        words = (_add_text_limit - _add_text_base) >> 2
+        self.counts = [0] * words  # executions of each text word
+        self.taken = [0] * words   # times the instruction at each word jumped
+        self.calls = dict()        # (call site pc, target pc) -> number of calls
+        self.attach()
+
+    def attach(self):
+        cpu = self.cpu
+        fetch = cpu.fetch
+        counts = self.counts
+        taken = self.taken
+        calls = self.calls
+        cache = cpu.decode_cache
+        if getattr(cpu, 'translate_enabled', False):
+            # Whole blocks can not be counted per instruction, run them on the interpreter
+            cpu.translate_enabled = False
+            fetch = partial(FastCPU.fetch, cpu)
+
+        def profiledFetch():
+            pc = int(cpu.pc)
+            index = (pc - _add_text_base) >> 2
+            counts[index] += 1  # Counted first, so the ecall that exits is in the counts
+            fetch()
+            if cpu.jump_flag:
+                taken[index] += 1
+                decoded = cache[index]
+                if decoded.rd in _link_registers:
+                    edge = (pc, int(cpu.pc))
+                    calls[edge] = calls.get(edge, 0) + 1
+        cpu.fetch = profiledFetch
+
+    # =========== Report Area =========== #
+    def executed(self):
+        """
+        Returns: list of (pc, DecodedInstruction, count) of every pc that ran
+        """
+        return [(_add_text_base + 4 * index, self.cpu.lookup(_add_text_base + 4 * index), count)
+                for index, count in enumerate(self.counts) if count]
+
+    def mnemonicCounts(self) -> dict:
+        mix = dict()
+        for pc, decoded, count in self.executed():
+            mix[decoded.name] = mix.get(decoded.name, 0) + count
+        return mix
+
+    def memoryBytes(self) -> dict:
+        """
+        Returns: {'load': {width: bytes}, 'store': {width: bytes}}
+        """
+        traffic = {'load': {1: 0, 2: 0, 4: 0}, 'store': {1: 0, 2: 0, 4: 0}}
+        for pc, decoded, count in self.executed():
+            if decoded.name in _load_widths:
+                width = _load_widths[decoded.name]
+                traffic['load'][width] += width * count
+            elif decoded.name in _store_widths:
+                width = _store_widths[decoded.name]
+                traffic['store'][width] += width * count
+        return traffic
+
+    def branchOutcomes(self) -> list:
+        """
+        Returns: list of (pc, DecodedInstruction, taken, not taken) for the conditional branches that ran
+        """
+        return [(pc, decoded, self.taken[(pc - _add_text_base) >> 2], count - self.taken[(pc - _add_text_base) >> 2])
+                for pc, decoded, count in self.executed() if decoded.name in _branches]
+
+    def loops(self) -> list:
+        """
+        Loops are found from taken backward branches and jumps, calls are not loops.
+        Returns: list of (start pc, end pc, iterations, instructions executed in the body), hottest first
+        """
+        found = list()
+        for pc, decoded, count in self.executed():
+            is_jump = decoded.name == 'jal' and decoded.rd not in _link_registers
+            if (decoded.name in _branches or is_jump) and decoded.imm <= 0:
+                iterations = self.taken[(pc - _add_text_base) >> 2]
+                start = pc + decoded.imm
+                if not iterations or start < _add_text_base:
+                    continue
+                body = sum(self.counts[(start - _add_text_base) >> 2:((pc - _add_text_base) >> 2) + 1])
+                found.append((start, pc, iterations, body))
+        found.sort(key=lambda loop: loop[3], reverse=True)
+        return found
+
+    def callGraph(self) -> dict:
+        """
+        Rebuild the call graph from the JAL/JALR calls seen. A function starts at a call target (or at
+        the first executed pc) and a call site belongs to the closest function start before it.
+        Returns: {(caller function pc, callee function pc): calls}
+        """
+        starts = sorted({target for site, target in self.calls} |
+                        {pc for pc, decoded, count in self.executed()[:1]})
+        graph = dict()
+        for (site, target), calls in self.calls.items():
+            caller = max([start for start in starts if start <= site], default=site)
+            graph[(caller, target)] = graph.get((caller, target), 0) + calls
+        return graph
+
+    def report(self, top: int = 20) -> str:
+        executed = self.executed()
+        total = sum(count for pc, decoded, count in executed) or 1
+        lines = ['Instructions retired: {}'.format(total), '', 'Instruction mix:']
+        for name, count in sorted(self.mnemonicCounts().items(), key=lambda item: item[1], reverse=True):
+            lines.append('  {:<8} {:>12} {:>7.2%}'.format(name, count, count / total))
+
+        lines += ['', 'Hottest pcs:']
+        for pc, decoded, count in sorted(executed, key=lambda item: item[2], reverse=True)[:top]:
+            lines.append('  {:#06x}  {:<24} {:>12} {:>7.2%}'.format(
+                pc, tracing.formatInstruction(decoded), count, count / total))
+
+        lines += ['', 'Hottest loops:']
+        for start, end, iterations, body in self.loops()[:top]:
+            lines.append('  {:#06x} - {:#06x}  {:>10} iterations {:>12} instructions {:>7.2%}'.format(
+                start, end, iterations, body, body / total))
+
+        lines += ['', 'Branches:', '  {:<6}  {:<24} {:>10} {:>10}'.format('pc', '', 'taken', 'not taken')]
+        for pc, decoded, taken, not_taken in self.branchOutcomes():
+            lines.append('  {:#06x}  {:<24} {:>10} {:>10}'.format(pc, tracing.formatInstruction(decoded),
+                                                                 taken, not_taken))
+
+        lines += ['', 'Memory traffic (bytes):']
+        for kind, widths in self.memoryBytes().items():
+            lines.append('  {:<6} byte {:>10}  halfword {:>10}  word {:>10}'.format(kind, widths[1], widths[2],
+                                                                                  widths[4]))
+
+        lines += ['', 'Call graph:']
+        for (caller, callee), calls in sorted(self.callGraph().items(), key=lambda item: item[1], reverse=True):
+            lines.append('  {:#06x} -> {:#06x} {:>10} calls'.format(caller, callee, calls))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,97 @@
+# Snapshots of the whole VM state: pc, the 32 registers and all of memory.
+#
+# File format (little endian):
+#   magic     6 bytes  b'RVSNAP'
+#   version   u16      _version, files of another version are refused
+#   flags     u16      _flag_compressed: the memory is zlib compressed
+#   pc        u32
+#   regs      32 x u32
+#   retired   u64      instructions retired before the snapshot
+#   mem_size  u32      size of the memory
+#   memory    the rest of the file, mem_size bytes (or their zlib stream)
+
+from collections import namedtuple
+import mmap
+import os
+import struct
+import zlib
+from mem import Memory
+from loader import engines, setReg
+import tracing
+
+_magic = b'RVSNAP'
+_version = 1
+_flag_compressed = 1
+_header = struct.Struct('<6sHHI32IQI')
+
+Snapshot = namedtuple('Snapshot', ['pc', 'regs', 'retired', 'memory'])
+
+
+class SnapshotError(ValueError):
+    """
+    Raised when a file is not a snapshot of this version.
+    """
+
+
+def saveSnapshot(cpu, file_name: str, retired: int = 0, compress: bool = False):
+    """
+    Write the state of cpu to file_name in a single write.
+    Args:
+        cpu: any engine
+        retired: instructions retired so far, kept in the snapshot for the record
+        compress: zlib compress the memory
+    Raises: SnapshotError for a PagedMemory
+    """
+    if not isinstance(cpu.ram, Memory):
+        raise SnapshotError('snapshots hold a flat Memory, not a ' + type(cpu.ram).__name__)
+    memory = cpu.ram.mem
+    if compress:
+        memory = zlib.compress(memory, 1)
+    header = _header.pack(_magic, _version, _flag_compressed if compress else 0, int(cpu.pc),
+                          *[int(reg) for reg in cpu.regs], retired, len(cpu.ram.mem))
+    snapshot = bytearray(header)
+    snapshot += memory
+    with open(file_name, 'wb') as file:
+        file.write(snapshot)
+
+
+def readSnapshot(file_name: str) -> Snapshot:
+    """
+    Map a snapshot file and check its header.
+    Returns: Snapshot, memory is a view of the map (or the decompressed bytes)
+    """
+    with open(file_name, 'rb') as file:
+        if os.fstat(file.fileno()).st_size < _header.size:  # An empty file can not be mapped either
+            raise SnapshotError(file_name + ': too short for a snapshot')
+        image = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(image)
+    fields = _header.unpack_from(view)
+    magic, version, flags, pc = fields[:4]
+    regs = list(fields[4:36])
+    retired, mem_size = fields[36:]
+    if magic != _magic:
+        raise SnapshotError(file_name + ': not a snapshot')
+    if version != _version:
+        raise SnapshotError('{}: snapshot version {}, this VM reads version {}'.format(file_name, version, _version))
+    memory = view[_header.size:]
+    if flags & _flag_compressed:
+        memory = zlib.decompress(memory)
+    if len(memory) != mem_size:
+        raise SnapshotError(file_name + ': memory is truncated')
+    return Snapshot(pc, regs, retired, memory)
+
+
+def restoreSnapshot(file_name: str, engine: str = 'intbv', trace: int = tracing.TRACE_OFF):
+    """
+    Build a CPU of the engine in the state saved in file_name.
+    Returns: (cpu, instructions retired before the snapshot)
+    """
+    snapshot = readSnapshot(file_name)
+    RAM = Memory(len(snapshot.memory))
+    RAM.write_bytes(0, snapshot.memory)
+    cpu = engines[engine](RAM, trace)
+    for index, value in enumerate(snapshot.regs):
+        setReg(cpu, index, value)
+    cpu.pc = snapshot.pc
+    RAM.clearDirty()  # The exit dump shows what the program changed from here
+    return cpu, snapshot.retired
@@ -13,70 +13,202 @@ _code = 10
 _syscall_exit = 93
 _syscall_print = 64
 _syscall_halt = 0
+# Not Linux syscalls: bulk memory operations the guest libc can hand to the host.
+# a0 = destination (or first block), a1 = source (or byte value, or second block), a2 = length
+_syscall_memcpy = 1000  # returns a0, like memcpy. The blocks may overlap, like memmove
+_syscall_memset = 1001  # returns a0, like memset
+_syscall_memcmp = 1002  # returns <0, 0 or >0 in a0, like memcmp
+# Blocks the hart while the word at a0 still equals a1, like futex wait. Another hart wakes it by writing the word.
+_syscall_wait = 1003
+_source = 11
 
 _stdout = 1
 _stderr = 2
+_ebadf = -9  # Returned for a file descriptor other than stdout and stderr, like Linux
 
-def handle(regs: list, mem: Memory):
+# Guest output is kept per stream and written out in one write when it reaches flush_threshold bytes,
+# at exit and at halt. Whoever stops a guest another way calls flushOutput().
+flush_threshold = 1 << 16
+# False drops the guest output, for a CPU that only runs to check another one (lockstep.py)
+output_enabled = True
+_output = {_stdout: bytearray(), _stderr: bytearray()}
+
+# Dump the memory when the guest exits.
+# The batch runner turns this off, its workers run many programs in the same directory.
+dump_on_exit = True
+# What the exit dump shows: the pages written since the program was loaded, as one hex dump,
+# or with full_dump every byte of the data section one per print, and the whole memory in mem-dump.bin.
+full_dump = False
+
+_dump_row = 16  # bytes per line of the hex dump
+
+
+class SyscallExit(Exception):
+    """
+    Raised by the exit syscall so the CPU run loop can stop.
+    Args:
+        code: exit code from a0
+    """
+    def __init__(self, code: int):
+        Exception.__init__(self, code)
+        self.code = code
+
+
+class SyscallHalt(Exception):
+    """
+    Raised by the halt syscall. The CPU can not recover without intervention.
+    """
+
+
+class SyscallWait(Exception):
+    """
+    Raised by the wait syscall when the hart has to block.
+    Args:
+        address: the word the hart waits on
+        value: it blocks while the word holds this value
+    """
+    def __init__(self, address: int, value: int):
+        Exception.__init__(self, hex(address))
+        self.address = address
+        self.value = value
+
+def handle(regs: list, mem: Memory, invalidate=None):
+    """
+    Run the syscall selected by a7.
+    Args:
+        invalidate: invalidate(address, width) of the CPU, called for the memory memcpy and memset write,
+                    so code they write over is decoded again
+    """
     # Read reg values
     # a7 req/funct
     # a1, a2 from to if print
     # stdin, stdout
 
-    if regs[_function].unsigned() == _syscall_print:
-        # Print to console
-        data = _getTextFromMem(mem, regs[_address].unsigned(), regs[_length].unsigned())
-        stream = regs[_code].unsigned()
-        _sys_print(data, stream)
+    # Registers may be intbv (CPU) or plain ints (FastCPU), int() reads both as unsigned
+    if int(regs[_function]) == _syscall_print:
+        # Write to console, a0 returns the number of bytes written
+        _setResult(regs, _sys_write(mem, int(regs[_code]), int(regs[_address]), int(regs[_length])))
     elif regs[_function] == _syscall_exit:
         exit_val = regs[_code]  # Exit code in a0, x10. could be signed
-        # dump the data section of memory before exiting
-        data = mem.dump_data()
-        for i in range(len(data)):
-            if i % 4 == 0:
-                print("\n")
-            print(hex(int.from_bytes(data[i], byteorder='little')), end=" ")
-        _saveMemDump(mem)
+        flushOutput()
+        # dump the memory before exiting
+        if dump_on_exit:
+            exitDump(mem)
         _sys_exit(int(exit_val))
     elif regs[_function] == _syscall_halt:
+        flushOutput()
         _sys_halt()
+    elif int(regs[_function]) == _syscall_memcpy:
+        mem.copy(int(regs[_code]), int(regs[_source]), int(regs[_length]))
+        if invalidate:
+            invalidate(int(regs[_code]), int(regs[_length]))
+    elif int(regs[_function]) == _syscall_memset:
+        mem.fill(int(regs[_code]), int(regs[_length]), int(regs[_source]))
+        if invalidate:
+            invalidate(int(regs[_code]), int(regs[_length]))
+    elif int(regs[_function]) == _syscall_memcmp:
+        _setResult(regs, mem.compare(int(regs[_code]), int(regs[_source]), int(regs[_length])))
+    elif int(regs[_function]) == _syscall_wait:
+        address, value = int(regs[_code]), int(regs[_source])
+        if mem.readWordAsInt(address) == value:
+            raise SyscallWait(address, value)
     else:
         # Unimplemented req
         pass
 
 
-def _sys_print(data, stream: int = 0):
-    # stdin 0, stdout 1, stderr 2
-    if stream == _stdout:
-        print(data, file=sys.stdout)
-    elif stream == _stderr:
-        print(data, file=sys.stderr)
-    else:
-        pass # Exception?
+def _setResult(regs: list, value: int):
+    """
+    Return value to the guest in a0, as a CPU (intbv) or FastCPU (int) register
+    """
+    value &= 0xffffffff
+    regs[_code] = intbv(value)[32:] if isinstance(regs[_code], intbv) else value
+
+
+def _sys_write(mem: Memory, fd: int, address: int, length: int) -> int:
+    """
+    Queue length bytes from address for stdout (fd 1) or stderr (fd 2), exactly as they are in memory.
+    Returns: the number of bytes written, or _ebadf for another fd
+    """
+    if fd not in _output:
+        return _ebadf
+    queueOutput(fd, mem.read_bytes(address, length))
+    return length
+
+
+def queueOutput(fd: int, data):
+    """
+    Queue guest output for stdout (fd 1) or stderr (fd 2), it is written out with the output of the write syscall.
+    """
+    if not output_enabled:
+        return
+    buffer = _output[fd]
+    buffer += data
+    if len(buffer) >= flush_threshold:
+        flushOutput()
+
+
+def flushOutput():
+    """
+    Write the queued guest output to sys.stdout and sys.stderr.
+    """
+    for fd, buffer in _output.items():
+        if not buffer:
+            continue
+        stream = sys.stdout if fd == _stdout else sys.stderr
+        stream.flush()  # Keep the order with the text the VM itself printed
+        if hasattr(stream, 'buffer'):
+            stream.buffer.write(buffer)
+            stream.buffer.flush()
+        else:  # A text only stream, e.g. io.StringIO from contextlib.redirect_stdout
+            stream.write(buffer.decode(errors='replace'))
+        buffer.clear()
 
 
 def _sys_exit(code: int):
-    exit(code)
+    raise SyscallExit(code)
 
 
 def _sys_halt():
-    input("system is halted")
     # After a halt, we assume a CPU can not recover with out intervention.
-    exit()
+    raise SyscallHalt()
+
+def exitDump(mem: Memory):
+    """
+    The memory dump shown when the guest exits, see full_dump
+    """
+    if full_dump:
+        # Every byte of the data section, 4 per line, built as one string
+        data = mem.dump_data()
+        sys.stdout.write(''.join(('\n\n' if i % 4 == 0 else '') + hex(value) + ' ' for i, value in enumerate(data)))
+        _saveMemDump(mem)
+    else:
+        sys.stdout.write(hexDump(mem, mem.dirtyRanges()))
+        sys.stdout.flush()
+
 
 def _saveMemDump(mem: Memory):
-    data = bytearray()
-    for val in mem.mem:
-        data += val
     with open('mem-dump.bin', 'wb') as file:
-        file.write(data)
-
-def _getTextFromMem(mem: Memory, start_add, length):
-    val = bytes()
-    for i in range(length):
-        address = start_add + i  # Start add + inc. byte by byte
-        val += mem.read(address)
-    if val.isascii():
-        return val.decode('ascii')
-    else:
-        return int.from_bytes(val, 'little')
+        file.write(mem.read_bytes(0, mem.getUsedSize()))
+
+def hexDump(mem: Memory, ranges: list) -> str:
+    """
+    Hex dump of the address ranges, 16 bytes per line. Repeated lines are shown once and then a '*',
+    the way hexdump does.
+    Args:
+        ranges: list of (start, end) addresses, e.g. Memory.dirtyRanges()
+    Returns: the whole dump as one string
+    """
+    lines = ['Memory changed since load: {} range(s)'.format(len(ranges))]
+    for start, end in ranges:
+        previous = None
+        for address in range(start, end, _dump_row):
+            row = bytes(mem.read_bytes(address, min(_dump_row, end - address)))
+            if row == previous:
+                if lines[-1] != '*':
+                    lines.append('*')
+                continue
+            previous = row
+            lines.append('{:08x}: {}'.format(address, row.hex(' ')))
+        lines.append('{:08x}'.format(end))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,21 @@
+# ELF fixture for test_elf.py: prints "hi", exits with the word at msg ("hi" then .bss zeros) = 0x6968.
+# Built with llvm-mc and lld:
+#   llvm-mc -triple=riscv32 -mattr=+m,-relax -filetype=obj hello.s -o hello.o
+#   ld.lld -m elf32lriscv -Ttext=0 -Tdata=0x2000 --defsym=__stack_top=0x3ff0 \
+#          --defsym=__global_pointer\$=0x2800 hello.o -o hello.elf
+.globl _start
+.text
+    nop
+_start:
+    la a1, msg
+    li a0, 1
+    li a2, 2
+    li a7, 64
+    ecall
+    lw a0, 0(a1)
+    li a7, 93
+    ecall
+.data
+msg: .ascii "hi"
+.bss
+buf: .zero 64
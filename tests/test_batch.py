@@ -0,0 +1,62 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+import batch
+
+_hello = [0x000025b7,  # lui a1, 2
+          0x00200613,  # li a2, 2
+          0x00100513,  # li a0, 1
+          0x04000893,  # li a7, 64  (print)
+          0x00000073,  # ecall
+          0x00300513,  # li a0, 3
+          0x05d00893,  # li a7, 93  (exit)
+          0x00000073]  # ecall
+_forever = [0x0000006f]  # j 0
+
+
+def writeProgram(directory: str, name: str, words: list, data: bytes = b''):
+    with open(os.path.join(directory, name + '.text'), 'wb') as file:
+        file.write(b''.join(word.to_bytes(4, 'little') for word in words))
+    with open(os.path.join(directory, name + '.data'), 'wb') as file:
+        file.write(data)
+    return {'name': name, 'text': name + '.text', 'data': name + '.data'}
+
+
+class BatchTestSuit(unittest.TestCase):
+    def test_batch(self):
+        with tempfile.TemporaryDirectory() as directory:
+            entries = [dict(writeProgram(directory, 'hello', _hello, b'hi'), expected_exit=3),
+                       dict(writeProgram(directory, 'wrong', _hello, b'hi'), expected_exit=0),
+                       dict(writeProgram(directory, 'limited', _forever), max_steps=1000),
+                       writeProgram(directory, 'forever', _forever)]
+            manifest = os.path.join(directory, 'manifest.jsonl')
+            with open(manifest, 'w') as file:
+                file.writelines(json.dumps(entry) + '\n' for entry in entries)
+            results = io.StringIO()
+            batch.runBatch(batch.readManifest(manifest), results, jobs=2, timeout=0.2)
+            records = {record['name']: record for record in map(json.loads, results.getvalue().splitlines())}
+
+        self.assertEqual(len(records), 4)
+        self.assertEqual(records['hello']['reason'], 'exit')
+        self.assertEqual(records['hello']['exit_code'], 3)
+        self.assertEqual(records['hello']['retired'], 8)
+        self.assertEqual(records['hello']['stdout'], 'hi')
+        self.assertTrue(records['hello']['passed'])
+        self.assertFalse(records['wrong']['passed'])
+        self.assertEqual(records['limited']['reason'], 'step_limit')
+        self.assertEqual(records['limited']['retired'], 1000)
+        self.assertEqual(records['forever']['reason'], 'timeout')
+
+    def test_timeout_on_intbv(self):
+        with tempfile.TemporaryDirectory() as directory:
+            entry = writeProgram(directory, 'forever', _forever)
+            entry.update(text=os.path.join(directory, entry['text']), data=os.path.join(directory, entry['data']))
+            record = batch.runEntry(entry, 'intbv', timeout=0.2)
+        self.assertEqual(record['reason'], 'timeout')
+        self.assertLess(record['time'], 0.2 + 0.1)  # A fixed chunk of 100000 instructions overshoots it
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+import contextlib
+import io
+import os
+import unittest
+from batch import readManifest
+from loader import loadProgram, readMemFile
+import syscalls
+
+_manifest = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'manifest.jsonl')
+
+
+class BenchmarkProgramsTestSuit(unittest.TestCase):
+    def setUp(self):
+        syscalls.dump_on_exit = False
+
+    def tearDown(self):
+        syscalls.dump_on_exit = True
+
+    def test_exit_codes(self):
+        for entry in readManifest(_manifest):
+            cpu = loadProgram(readMemFile(entry['text']), readMemFile(entry['data']), 'translate')
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = cpu.run()
+            self.assertEqual(result.exit_code, entry['expected_exit'], entry['name'])
+
+
+if __name__ == '__main__':
+    unittest.main()
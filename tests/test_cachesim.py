@@ -0,0 +1,48 @@
+import unittest
+from cachesim import Cache, CacheSimulator, parseCache, RANDOM
+from CPU import STOP_EBREAK
+from loader import loadProgram
+from test_profiler import _text
+
+
+class CacheSimTestSuit(unittest.TestCase):
+    def test_lru(self):
+        cache = Cache(64, 16, 2)  # 2 sets of 2 ways, 0x00, 0x20 and 0x40 share set 0
+        hits = [cache.access(address, 0x10) for address in (0x00, 0x24, 0x08, 0x40, 0x0c, 0x20)]
+        self.assertEqual(hits, [False, False, True, False, True, False])
+        self.assertEqual((cache.hits, cache.misses, cache.evictions), (2, 4, 2))
+        self.assertEqual(cache.miss_pcs, {0x10: {0x00: 1, 0x20: 2, 0x40: 1}})
+        self.assertFalse(cache.access(0x10, 0x10))  # Set 1 is apart
+        self.assertTrue(cache.access(0x1c, 0x10))
+
+    def test_random(self):
+        cache = Cache(64, 16, 2, RANDOM)
+        for address in (0x00, 0x20, 0x40):
+            cache.access(address, 0)
+        self.assertEqual(cache.evictions, 1)  # Empty ways are filled first
+        self.assertIn(sorted(cache.tags[:2]), ([0, 4], [2, 4]))
+
+    def test_parse(self):
+        cache = parseCache('4k:32:2:random')
+        self.assertEqual((cache.size, cache.line_size, cache.ways, cache.sets, cache.policy),
+                         (4096, 32, 2, 64, RANDOM))
+        for spec in ('4k:32', '3000:32:1', '4k:32:3', '4k:32:1:fifo'):
+            with self.subTest(spec=spec):
+                self.assertRaises(ValueError, parseCache, spec)
+
+    def test_simulator(self):
+        for engine in ('intbv', 'fast', 'translate'):
+            with self.subTest(engine=engine):
+                cpu = loadProgram(_text, b'', engine)
+                caches = CacheSimulator(cpu, Cache(64, 16, 1), Cache(64, 16, 1))
+                result = cpu.run()
+                self.assertEqual(result.reason, STOP_EBREAK)
+                self.assertEqual((caches.icache.accesses(), caches.icache.misses), (result.retired, 2))
+                gp = int(cpu.regs[3])
+                self.assertEqual((caches.dcache.hits, caches.dcache.misses), (9, 1))
+                self.assertEqual(caches.dcache.miss_pcs, {0x14: {gp & ~15: 1}})
+                self.assertIn('D-cache: 64 bytes, 16 byte lines, 1 ways, 4 sets, lru', caches.report())
+
+
+if __name__ == '__main__':
+    unittest.main()
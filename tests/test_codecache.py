@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+from codecache import CodeCache
+from CPU import STOP_EBREAK
+from loader import loadProgram
+from test_profiler import _text
+from test_translator import _program as _self_modifying
+
+_self_modifying_text = b''.join(word.to_bytes(4, 'little') for word in _self_modifying)
+
+
+class CodeCacheTestSuit(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def files(self) -> list:
+        return sorted(name for name in os.listdir(self.directory.name) if name.endswith('.rvcode'))
+
+    def test_round_trip(self):
+        for engine in ('fast', 'translate'):
+            with self.subTest(engine=engine):
+                cache = CodeCache(self.directory.name)
+                cpu = loadProgram(_text, b'', engine)
+                self.assertFalse(cache.load(cpu))
+                expected = cpu.run()
+                self.assertTrue(cache.save(cpu))
+                self.assertFalse(cache.save(cpu))  # Nothing new
+                cpu = loadProgram(_text, b'', engine)
+                cache = CodeCache(self.directory.name)
+                self.assertTrue(cache.load(cpu))
+                self.assertIsNotNone(cpu.decode_cache[0])
+                if engine == 'translate':
+                    self.assertIn(0, cpu.blocks)
+                result = cpu.run()
+                self.assertEqual((result.reason, result.pc, result.retired), (STOP_EBREAK, expected.pc,
+                                                                              expected.retired))
+                self.assertEqual(cpu.regs[10], 0)
+        self.assertEqual(len(self.files()), 2)  # One per engine
+
+    def test_other_program_misses(self):
+        cache = CodeCache(self.directory.name)
+        cpu = loadProgram(_text, b'', 'fast')
+        cache.load(cpu)
+        cpu.run()
+        cache.save(cpu)
+        self.assertFalse(CodeCache(self.directory.name).load(loadProgram(_text[:-4], b'', 'fast')))
+
+    def test_corrupt_file_is_rebuilt(self):
+        cache = CodeCache(self.directory.name)
+        cpu = loadProgram(_text, b'', 'translate')
+        cache.load(cpu)
+        cpu.run()
+        cache.save(cpu)
+        path = os.path.join(self.directory.name, self.files()[0])
+        with open(path, 'r+b') as file:
+            file.truncate(20)
+        cpu = loadProgram(_text, b'', 'translate')
+        self.assertFalse(cache.load(cpu))
+        self.assertEqual(cpu.run().reason, STOP_EBREAK)
+        self.assertTrue(cache.save(cpu))
+        self.assertTrue(CodeCache(self.directory.name).load(loadProgram(_text, b'', 'translate')))
+
+    def test_self_modifying_code_is_not_saved(self):
+        cache = CodeCache(self.directory.name)
+        cpu = loadProgram(_self_modifying_text, b'', 'translate')
+        cache.load(cpu)
+        cpu.run()
+        self.assertEqual(cpu.regs[10], 3)
+        self.assertFalse(cache.save(cpu))
+        self.assertEqual(self.files(), [])
+
+    def test_evicts_least_recently_used(self):
+        cache = CodeCache(self.directory.name)
+        for engine in ('fast', 'translate'):
+            cpu = loadProgram(_text, b'', engine)
+            cache.load(cpu)
+            cpu.run()
+            cache.save(cpu)
+        fast, translate = (os.path.join(self.directory.name, cache.key(loadProgram(_text, b'', engine)) + '.rvcode')
+                           for engine in ('fast', 'translate'))
+        os.utime(translate, (0, 0))  # Used long ago
+        cache.max_bytes = os.path.getsize(fast)
+        cache.evict()
+        self.assertTrue(os.path.exists(fast))
+        self.assertFalse(os.path.exists(translate))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+from myhdl import intbv
+from mem import Memory
+from CPU import CPU
+import tracing
+
+
+def loadWords(ram: Memory, words: list, offset: int = 0):
+    for i, word in enumerate(words):
+        ram.writeWord(offset + 4 * i, word)
+
+
+class DecodeCacheTestSuit(unittest.TestCase):
+    cpu = None
+    def setUp(self):
+        ram = Memory(0x3ffc)
+        loadWords(ram, [0x00150513,   # addi a0, a0, 1
+                        0x00b02023])  # sw a1, 0(zero)
+        self.cpu = CPU(ram)
+
+    def test_decode_is_cached(self):
+        self.cpu.fetch()
+        cached = self.cpu.decode_cache[0]
+        self.assertEqual(cached.name, 'addi')
+        self.assertEqual((cached.rd, cached.rs1, cached.imm), (10, 10, 1))
+        self.cpu.fetch()
+        self.assertIs(self.cpu.decode_cache[0], cached)
+        self.assertEqual(int(self.cpu.regs[10]), 2)
+
+    def test_store_to_text_invalidates(self):
+        self.cpu.fetch()
+        self.cpu.regs[11] = intbv(0x00250513)[32:]  # addi a0, a0, 2
+        self.cpu.pc = 4
+        self.cpu.fetch()
+        self.assertIsNone(self.cpu.decode_cache[0])
+        self.cpu.pc = 0
+        self.cpu.fetch()
+        self.assertEqual(self.cpu.decode_cache[0].imm, 2)
+        self.assertEqual(int(self.cpu.regs[10]), 3)
+
+
+class TracingTestSuit(unittest.TestCase):
+    def test_trace_off_keeps_plain_fetch(self):
+        cpu = CPU(Memory(0x3ffc))
+        self.assertNotIn('fetch', vars(cpu))
+        cpu = CPU(Memory(0x3ffc), tracing.TRACE_INSTRUCTIONS)
+        self.assertIn('fetch', vars(cpu))
+
+    def test_format_instruction(self):
+        ram = Memory(0x3ffc)
+        loadWords(ram, [0x00150513,   # addi a0, a0, 1
+                        0x00b02023])  # sw a1, 0(zero)
+        cpu = CPU(ram)
+        self.assertEqual(tracing.formatInstruction(cpu.lookup(0)), 'addi x10, x10, 1')
+        self.assertEqual(tracing.formatInstruction(cpu.lookup(4)), 'sw x11, 0(x0)')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import socket
+import threading
+import unittest
+from CPU import STOP_BREAKPOINT, STOP_WATCHPOINT, STOP_EBREAK, STOP_STEP_LIMIT
+from debugger import Debugger, GdbServer
+from loader import loadProgram
+from mem import WATCH_WRITE, WATCH_READ
+from test_profiler import _text
+
+
+def _packet(data: str) -> bytes:
+    return '${}#{:02x}'.format(data, sum(data.encode()) & 0xff).encode()
+
+
+class DebuggerTestSuit(unittest.TestCase):
+    def test_breakpoints(self):
+        for engine in ('intbv', 'fast', 'translate'):
+            with self.subTest(engine=engine):
+                cpu = loadProgram(_text, b'', engine)
+                debugger = Debugger(cpu)
+                debugger.addBreakpoint(0x14)
+                debugger.addBreakpoint(0x0c)  # Inside the block 0x08 .. 0x0c
+                stops = [(result.reason, result.pc) for result in (debugger.cont() for i in range(4))]
+                self.assertEqual(stops, [(STOP_BREAKPOINT, 0x14), (STOP_BREAKPOINT, 0x0c)] * 2)
+                self.assertEqual(int(cpu.regs[10]), 3)
+                debugger.removeBreakpoint(0x14)
+                debugger.removeBreakpoint(0x0c)
+                self.assertEqual(debugger.cont().reason, STOP_EBREAK)
+
+    def test_step(self):
+        cpu = loadProgram(_text, b'', 'translate')
+        debugger = Debugger(cpu)
+        debugger.addBreakpoint(0x04)
+        pcs = [(debugger.step().reason, cpu.pc) for i in range(3)]
+        self.assertEqual(pcs, [(STOP_STEP_LIMIT, 0x04), (STOP_STEP_LIMIT, 0x14), (STOP_STEP_LIMIT, 0x18)])
+
+    def test_watchpoints(self):
+        for engine in ('intbv', 'fast', 'translate'):
+            with self.subTest(engine=engine):
+                cpu = loadProgram(_text, b'', engine)
+                gp = int(cpu.regs[3])
+                debugger = Debugger(cpu)
+                debugger.addWatchpoint(gp, 4, WATCH_WRITE)
+                result = debugger.cont()
+                # Stopped after the store, which is done
+                self.assertEqual((result.reason, result.pc, result.fault_address), (STOP_WATCHPOINT, 0x18, gp))
+                self.assertEqual(cpu.ram.readWordAsInt(gp), 5)
+                debugger.removeWatchpoint(gp, 4, WATCH_WRITE)
+                debugger.addWatchpoint(gp + 1, 1, WATCH_READ)  # lb reads gp + 0 only
+                debugger.addWatchpoint(gp, 1, WATCH_READ)
+                self.assertEqual((debugger.cont().pc, int(cpu.regs[5])), (0x1c, 5))
+                debugger.removeWatchpoint(gp + 1, 1, WATCH_READ)
+                debugger.removeWatchpoint(gp, 1, WATCH_READ)
+                self.assertNotIn('readAsInt', vars(cpu.ram))
+                self.assertEqual(debugger.cont().reason, STOP_EBREAK)
+
+
+class GdbServerTestSuit(unittest.TestCase):
+    def setUp(self):
+        self.cpu = loadProgram(_text, b'', 'fast')
+        self.server = GdbServer(self.cpu, 0)
+        self.thread = threading.Thread(target=self.server.serve)
+        self.thread.start()
+        self.client = socket.create_connection(('127.0.0.1', self.server.port))
+        self.client.settimeout(10)
+        self.received = b''
+
+    def tearDown(self):
+        self.client.close()
+        self.thread.join(10)
+
+    def request(self, data: str) -> str:
+        self.client.sendall(_packet(data))
+        while not (b'#' in self.received and len(self.received) - self.received.index(b'#') >= 3):
+            self.received += self.client.recv(4096)
+        self.assertEqual(self.received[:2], b'+$')
+        end = self.received.index(b'#')
+        reply = self.received[2:end].decode()
+        self.assertEqual(self.received[end + 1:end + 3].decode(), '{:02x}'.format(sum(reply.encode()) & 0xff))
+        self.received = self.received[end + 3:]
+        self.client.sendall(b'+')
+        return reply
+
+    def test_session(self):
+        gp = int(self.cpu.regs[3])
+        self.assertIn('PacketSize', self.request('qSupported:multiprocess+'))
+        self.assertEqual(self.request('?'), 'S05')
+        self.assertEqual(self.request('Z0,14,4'), 'OK')
+        self.assertEqual(self.request('c'), 'S05')
+        self.assertEqual(self.request('p20'), '14000000')
+        registers = self.request('g')
+        self.assertEqual((len(registers), registers[80:88]), (33 * 8, '05000000'))  # a0 = 5
+        self.assertEqual(self.request('P5=78563412'), 'OK')
+        self.assertEqual(self.cpu.regs[5], 0x12345678)
+        self.assertEqual(self.request('z0,14,4'), 'OK')
+        self.assertEqual(self.request('Z2,{:x},4'.format(gp)), 'OK')
+        self.assertEqual(self.request('c'), 'T05watch:{:x};'.format(gp))
+        self.assertEqual(self.request('m{:x},4'.format(gp)), '05000000')
+        self.assertEqual(self.request('z2,{:x},4'.format(gp)), 'OK')
+        self.assertEqual(self.request('s'), 'S05')
+        self.assertEqual(self.request('p20'), '1c000000')
+        self.assertEqual(self.request('vMustReplyEmpty'), '')
+        self.assertEqual(self.request('c'), 'S05')  # ebreak
+        self.assertEqual(self.cpu.pc, 0x14)
+        self.assertEqual(self.request('D'), 'OK')
+
+
+if __name__ == '__main__':
+    unittest.main()
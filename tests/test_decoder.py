@@ -0,0 +1,82 @@
+import unittest
+from myhdl import intbv
+from mem import Memory
+from CPU import CPU, STOP_ILLEGAL_INSTRUCTION
+from decoder import decode, Fields, IllegalInstruction
+from fastcpu import FastCPU
+from translator import TranslatingCPU
+from test_cpu import loadWords
+
+# Instructions the old reference decoder got wrong
+_program = [0x00b522b3,  # slt t0, a0, a1
+            0x00b53333,  # sltu t1, a0, a1
+            0x02b513b3,  # mulh t2, a0, a1
+            0x02b52433,  # mulhsu s0, a0, a1
+            0x02b534b3,  # mulhu s1, a0, a1
+            0x40455613,  # srai a2, a0, 4
+            0x00455693,  # srli a3, a0, 4
+            0x01f59713,  # slli a4, a1, 31
+            0xfff5a793,  # slti a5, a1, -1
+            0xfff5b813,  # sltiu a6, a1, -1
+            0xfff54893,  # xori a7, a0, -1
+            0xfea12e23,  # sw a0, -4(sp)
+            0xffc10903,  # lb s2, -4(sp)
+            0xffc14983,  # lbu s3, -4(sp)
+            0xffc11a03,  # lh s4, -4(sp)
+            0xffc15a83,  # lhu s5, -4(sp)
+            0x051080e7]  # jalr ra, 81(ra)
+
+# a0 = 0x8000fff0, a1 = -13, sp = 0x2000, ra = 0x100
+_inputs = {10: 0x8000fff0, 11: 0xfffffff3, 2: 0x2000, 1: 0x100}
+
+
+class DecoderTestSuit(unittest.TestCase):
+    def test_fields(self):
+        self.assertEqual(decode(0x00150513), Fields('addi', 10, 10, None, 1))
+        self.assertEqual(decode(0xfea12e23), Fields('sw', None, 2, 10, -4))
+        self.assertEqual(decode(0xfe0718e3), Fields('bne', None, 14, 0, -16))    # bne a4, zero, -16
+        self.assertEqual(decode(0x8000006f), Fields('jal', 0, None, None, -1048576))  # j -1048576
+        self.assertEqual(decode(0xfffff2b7), Fields('lui', 5, None, None, -4096))  # lui t0, 0xfffff
+        self.assertEqual(decode(0x40455613), Fields('srai', 12, 10, None, 4))
+        self.assertEqual(decode(0x00100073), Fields('ebreak', None, None, None, 1))
+
+    def test_illegal(self):
+        for word in (0x00000000, 0xffffffff,
+                     0x051090e7,   # jalr with funct3 = 1
+                     0x34011073,   # csrrw
+                     0x80455613):  # srai with funct7 = 0x40
+            with self.subTest(word=hex(word)):
+                with self.assertRaises(IllegalInstruction) as raised:
+                    decode(word)
+                self.assertEqual(raised.exception.word, word)
+
+    def test_reference_agrees_with_fast(self):
+        results = list()
+        for engine in (CPU, FastCPU):
+            ram = Memory(0x3ffc)
+            loadWords(ram, _program)
+            cpu = engine(ram)
+            for index, value in _inputs.items():
+                cpu.regs[index] = intbv(value)[32:] if engine is CPU else value
+            self.assertEqual(cpu.run(len(_program)).pc, 0x150)
+            results.append([int(reg) for reg in cpu.regs])
+        self.assertEqual(results[0], results[1])
+        regs = results[0]
+        self.assertEqual(regs[5:10], [1, 1, 0x6, 0x8000fff6, 0x8000ffe9])
+        self.assertEqual(regs[12:18], [0xf8000fff, 0x08000fff, 0x80000000, 1, 1, 0x7fff000f])
+        self.assertEqual(regs[1], 0x44)
+        self.assertEqual(regs[18:22], [0xfffffff0, 0xf0, 0xfffffff0, 0xfff0])
+
+    def test_illegal_instruction_stops_every_engine(self):
+        for engine in (CPU, FastCPU, TranslatingCPU):
+            with self.subTest(engine=engine.__name__):
+                ram = Memory(0x3ffc)
+                loadWords(ram, [0x00150513,   # addi a0, a0, 1
+                                0x00150513,   # addi a0, a0, 1
+                                0xffffffff])
+                result = engine(ram).run()
+                self.assertEqual((result.reason, result.retired, result.pc), (STOP_ILLEGAL_INSTRUCTION, 2, 8))
+
+
+if __name__ == '__main__':
+    unittest.main()
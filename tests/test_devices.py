@@ -0,0 +1,91 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from CPU import STOP_EBREAK, STOP_MEMORY_FAULT
+from devices import attachDevices, RX_EMPTY, UART_BASE
+from loader import loadProgram
+from mem import Memory, PagedMemory, MemoryFault
+import syscalls
+from tracefile import TraceWriter, readTrace
+
+_program = [0x100002b7,  # lui t0, 0x10000  (UART)
+            0x04800313,  # li t1, 'H'
+            0x0062a023,  # sw t1, 0(t0)
+            0x06900313,  # li t1, 'i'
+            0x00628023,  # sb t1, 0(t0)
+            0x0042a583,  # lw a1, 4(t0)
+            0x0042c603,  # lbu a2, 4(t0)
+            0x0042a683,  # lw a3, 4(t0)
+            0x100013b7,  # lui t2, 0x10001  (timer)
+            0x0003a703,  # lw a4, 0(t2)
+            0x0043a783,  # lw a5, 4(t2)
+            0x00100073]  # ebreak
+_text = b''.join(word.to_bytes(4, 'little') for word in _program)
+
+
+class DevicesTestSuit(unittest.TestCase):
+    def test_map_device(self):
+        for memory in (Memory(0x1000), PagedMemory()):
+            with self.subTest(memory=type(memory).__name__):
+                accesses = []
+                memory.mapDevice(0x20000, 8, lambda offset, width: accesses.append(('read', offset, width)) or 0x1234,
+                                 lambda offset, width, value: accesses.append(('write', offset, width, value)))
+                memory.writeWord(0x20004, 0xdeadbeef)
+                memory.writeByte(0x20001, 0x1ff)
+                self.assertEqual(memory.readHalfWordAsInt(0x20002), 0x1234)
+                self.assertEqual(bytes(memory.readWord(0x20000)), b'\x34\x12\x00\x00')
+                self.assertEqual(accesses, [('write', 4, 4, 0xdeadbeef), ('write', 1, 1, 0xff), ('read', 2, 2),
+                                            ('read', 0, 4)])
+                self.assertRaises(MemoryFault, memory.readWordAsInt, 0x20006)  # Runs past the region
+                memory.writeByte(0x10, 1)
+                self.assertRaises(ValueError, memory.mapDevice, 0x0, 8, None, None)  # Over the memory
+        self.assertRaises(MemoryFault, Memory(0x1000).readWordAsInt, 0x20000)
+
+    def test_uart_and_timer(self):
+        for engine in ('intbv', 'fast', 'translate'):
+            with self.subTest(engine=engine):
+                cpu = loadProgram(_text, b'', engine)
+                uart, timer = attachDevices(cpu, io.BytesIO(b'ok'), timer=True)
+                with contextlib.redirect_stdout(io.StringIO()) as output:
+                    result = cpu.run()
+                    syscalls.flushOutput()
+                self.assertEqual(result.reason, STOP_EBREAK)
+                self.assertEqual(output.getvalue(), 'Hi')
+                self.assertEqual([int(cpu.regs[index]) for index in range(11, 16)], [ord('o'), ord('k'), RX_EMPTY,
+                                                                                     9, 0])
+
+    def test_traced_input_is_read_once(self):
+        for engine in ('intbv', 'fast', 'translate'):
+            with self.subTest(engine=engine), tempfile.TemporaryDirectory() as directory:
+                cpu = loadProgram(_text, b'', engine)
+                attachDevices(cpu, io.BytesIO(b'ok'), timer=True)
+                writer = TraceWriter(cpu, os.path.join(directory, 'trace.bin'))
+                with contextlib.redirect_stdout(io.StringIO()):
+                    cpu.run()
+                    syscalls.flushOutput()
+                writer.close()
+                self.assertEqual((int(cpu.regs[11]), int(cpu.regs[12])), (ord('o'), ord('k')))
+                records = readTrace(os.path.join(directory, 'trace.bin'))
+                self.assertEqual([record.value for record in records[2:7]], [ord('H'), 0, ord('i'), ord('o'), ord('k')])
+
+    def test_uart_keeps_blocks(self):
+        cpu = loadProgram(_text[:8 * 4] + (0x00100073).to_bytes(4, 'little'), b'', 'translate')
+        uart, timer = attachDevices(cpu, io.BytesIO(b'ok'))
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            result = cpu.run()
+            syscalls.flushOutput()
+        self.assertIsNone(timer)
+        self.assertTrue(cpu.translate_enabled)
+        self.assertIn(0, cpu.blocks)
+        self.assertEqual((result.reason, output.getvalue(), int(cpu.regs[12])), (STOP_EBREAK, 'Hi', ord('k')))
+
+    def test_no_device(self):
+        cpu = loadProgram(_text, b'', 'fast')
+        result = cpu.run()
+        self.assertEqual((result.reason, result.fault_address), (STOP_MEMORY_FAULT, UART_BASE))
+
+
+if __name__ == '__main__':
+    unittest.main()
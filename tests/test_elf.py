@@ -0,0 +1,96 @@
+import contextlib
+import io
+import os
+import struct
+import tempfile
+import unittest
+from elf import ElfError, isElf, readElf
+from loader import loadElf
+from mem import PERM_READ, PERM_WRITE, PERM_EXECUTE
+import syscalls
+
+_hello = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'elf', 'hello.elf')
+
+
+def writeElf(file, entry: int, segments: list):
+    """
+    Write an RV32 ELF executable with a PT_LOAD per (address, data, flags) of segments, and no sections
+    """
+    offset = 52 + 32 * len(segments)
+    file.write(struct.pack('<16sHHIIIIIHHHHHH', b'\x7fELF\x01\x01\x01', 2, 243, 1, entry, 52, 0, 0, 52, 32,
+                           len(segments), 40, 0, 0))
+    for address, data, flags in segments:
+        file.write(struct.pack('<IIIIIIII', 1, offset, address, address, len(data), len(data), flags, 4))
+        offset += len(data)
+    for address, data, flags in segments:
+        file.write(data)
+    file.flush()
+
+
+class ElfTestSuit(unittest.TestCase):
+    def test_read(self):
+        image = readElf(_hello)
+        self.assertEqual(image.entry, 0x4)
+        self.assertEqual(image.symbols['_start'], 0x4)
+        self.assertEqual(image.symbols['__global_pointer$'], 0x2800)
+        data = [segment for segment in image.segments if segment.address == 0x2000][0]
+        self.assertEqual(bytes(data.data), b'hi')
+        self.assertEqual(data.memsz, 0x42)  # 2 bytes of .data and 64 of .bss
+
+    def test_load_and_run(self):
+        syscalls.dump_on_exit = False
+        try:
+            for engine in ('intbv', 'fast', 'translate'):
+                with self.subTest(engine=engine):
+                    cpu = loadElf(_hello, engine)
+                    self.assertEqual(cpu.pc, 0x4)
+                    self.assertEqual(int(cpu.regs[2]), 0x3ff0)
+                    self.assertEqual(int(cpu.regs[3]), 0x2800)
+                    with contextlib.redirect_stdout(io.StringIO()) as output:
+                        result = cpu.run()
+                    self.assertEqual(result.exit_code, 0x6968)
+                    self.assertEqual(result.retired, 9)
+                    self.assertTrue(output.getvalue().startswith('hi'))
+        finally:
+            syscalls.dump_on_exit = True
+
+    def test_not_elf(self):
+        with tempfile.NamedTemporaryFile(suffix='.bin') as file:
+            file.write(b'\x13\x00\x00\x00' * 16)
+            file.flush()
+            self.assertFalse(isElf(file.name))
+            with self.assertRaises(ElfError):
+                readElf(file.name)
+        with tempfile.NamedTemporaryFile(suffix='.elf') as file:
+            with self.assertRaises(ElfError):
+                loadElf(file.name)  # Empty
+
+    def test_truncated(self):
+        with open(_hello, 'rb') as file:
+            content = file.read()
+        header = struct.pack('<16sHHIIIIIHHHHHH', b'\x7fELF\x01\x01\x01', 2, 243, 1, 0, 52, 0, 0, 52, 32, 1, 40, 0, 0)
+        for data in (header, content[:200], content[:4100], content[:-40]):  # Cut in the tables or the text
+            with self.subTest(length=len(data)), tempfile.NamedTemporaryFile(suffix='.elf') as file:
+                file.write(data)
+                file.flush()
+                with self.assertRaises(ElfError):
+                    readElf(file.name)
+
+    def test_outside_the_text_section(self):
+        code = (0x00100073).to_bytes(4, 'little')  # ebreak
+        for entry, segments, memory in ((0x10000, [(0x10000, code, PERM_READ | PERM_EXECUTE)], 'paged'),
+                                        (0x2000, [(0x0, code, PERM_READ | PERM_EXECUTE)], 'flat'),
+                                        (0x0, [(0x0, code, PERM_READ | PERM_EXECUTE),
+                                               (0x80000000, b'hi', PERM_READ | PERM_WRITE)], 'flat')):
+            with self.subTest(entry=entry, memory=memory), tempfile.NamedTemporaryFile(suffix='.elf') as file:
+                writeElf(file, entry, segments)
+                with self.assertRaises(ElfError):
+                    loadElf(file.name, 'fast', memory=memory)
+        with tempfile.NamedTemporaryFile(suffix='.elf') as file:
+            writeElf(file, 0x0, [(0x0, code, PERM_READ | PERM_EXECUTE), (0x80000000, b'hi', PERM_READ | PERM_WRITE)])
+            cpu = loadElf(file.name, 'fast', memory='paged')  # The paged memory holds data that far up
+            self.assertEqual(cpu.ram.readHalfWordAsInt(0x80000000), 0x6968)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import unittest
+from myhdl import intbv
+from mem import Memory, PagedMemory, PERM_READ, PERM_EXECUTE
+from CPU import CPU, STOP_EBREAK, STOP_HALT, STOP_STEP_LIMIT, STOP_UNTIL_PC, STOP_MEMORY_FAULT, STOP_PC_OUT_OF_RANGE
+from fastcpu import FastCPU
+from translator import TranslatingCPU
+from test_cpu import loadWords
+
+_program = [0x02b542b3,  # div t0, a0, a1
+            0x02b56333,  # rem t1, a0, a1
+            0x02c6c3b3,  # div t2, a3, a2
+            0x02c6e433,  # rem s0, a3, a2
+            0x02c6d4b3,  # divu s1, a3, a2
+            0x02c6f7b3,  # remu a5, a3, a2
+            0x02d74833,  # div a6, a4, a3
+            0x02d768b3,  # rem a7, a4, a3
+            0x02d70933,  # mul s2, a4, a3
+            0x40e609b3,  # sub s3, a2, a4
+            0xffb70a13]  # addi s4, a4, -5
+
+# a0 = INT_MIN, a1 = -1, a2 = 0, a3 = 7, a4 = -20
+_inputs = {10: 0x80000000, 11: 0xffffffff, 12: 0, 13: 7, 14: 0xffffffec}
+
+
+def runProgram(cpu):
+    for index, value in _inputs.items():
+        cpu.regs[index] = intbv(value)[32:] if isinstance(cpu, CPU) else value
+    for i in range(len(_program)):
+        cpu.fetch()
+        if not cpu.jump_flag:
+            cpu.pc += 4
+    return [int(reg) for reg in cpu.regs]
+
+
+class FastCPUTestSuit(unittest.TestCase):
+    def setUp(self):
+        self.ram = Memory(0x3ffc)
+        loadWords(self.ram, _program)
+
+    def test_rv32m_edge_cases(self):
+        regs = runProgram(FastCPU(self.ram))
+        self.assertEqual(regs[5], 0x80000000)  # INT_MIN / -1 overflows
+        self.assertEqual(regs[6], 0)           # INT_MIN % -1
+        self.assertEqual(regs[7], 0xffffffff)  # division by zero
+        self.assertEqual(regs[8], 7)           # remainder by zero is the dividend
+        self.assertEqual(regs[9], 0xffffffff)
+        self.assertEqual(regs[15], 7)
+        self.assertEqual(regs[16], 0xfffffffe)  # -20 / 7 rounds towards zero
+        self.assertEqual(regs[17], 0xfffffffa)  # -20 % 7 takes the sign of the dividend
+        self.assertEqual(regs[18], (-140) & 0xffffffff)
+
+    def test_matches_intbv_cpu(self):
+        self.assertEqual(runProgram(FastCPU(self.ram)), runProgram(CPU(self.ram)))
+
+
+_run_program = [0x00700513,  # li a0, 7
+                0x00100073,  # ebreak
+                0x00500293,  # li t0, 5
+                0xfff28293,  # addi t0, t0, -1
+                0xfe029ee3,  # bnez t0, -4
+                0x00000893,  # li a7, 0  (halt)
+                0x00000073,  # ecall
+                0x0005a503,  # lw a0, 0(a1)
+                0x00a5a023]  # sw a0, 0(a1)
+
+
+class RunTestSuit(unittest.TestCase):
+    engines = (CPU, FastCPU, TranslatingCPU)
+
+    def newCPU(self, engine):
+        ram = Memory(0x3ffc)
+        loadWords(ram, _run_program)
+        return engine(ram)
+
+    def test_stop_reasons(self):
+        for engine in self.engines:
+            cpu = self.newCPU(engine)
+            result = cpu.run()
+            self.assertEqual((result.reason, result.retired, result.pc), (STOP_EBREAK, 2, 8))
+            result = cpu.run()
+            self.assertEqual((result.reason, result.retired, result.pc), (STOP_HALT, 13, 0x18))
+            self.assertEqual(int(cpu.regs[10]), 7)
+
+    def test_limits(self):
+        for engine in self.engines:
+            cpu = self.newCPU(engine)
+            cpu.pc = 8
+            result = cpu.run(max_steps=3)
+            self.assertEqual((result.reason, result.retired, result.pc), (STOP_STEP_LIMIT, 3, 0x0c))
+            result = cpu.run(until_pc=0x10)
+            self.assertEqual((result.reason, result.retired, result.pc), (STOP_UNTIL_PC, 1, 0x10))
+            self.assertEqual(int(cpu.regs[5]), 3)
+
+    def test_faults(self):
+        for engine in self.engines:
+            cpu = self.newCPU(engine)
+            cpu.pc = 0x1c
+            cpu.regs[11] = intbv(0x7fff0000)[32:] if engine is CPU else 0x7fff0000
+            result = cpu.run()
+            self.assertEqual((result.reason, result.retired, result.pc), (STOP_MEMORY_FAULT, 0, 0x1c))
+            self.assertEqual(result.fault_address, 0x7fff0000)
+            cpu.pc = 0x1000
+            self.assertEqual(cpu.run().reason, STOP_PC_OUT_OF_RANGE)
+
+    def test_paged_memory(self):
+        for engine in self.engines:
+            ram = PagedMemory()
+            loadWords(ram, _run_program)
+            ram.setPermissions(0, 0x1000, PERM_READ | PERM_EXECUTE)
+            cpu = engine(ram)
+            cpu.pc = 0x1c
+            cpu.regs[11] = intbv(0xfffff000)[32:] if engine is CPU else 0xfffff000
+            self.assertEqual(cpu.run(until_pc=0x24).reason, STOP_UNTIL_PC)
+            self.assertEqual(ram.readWordAsInt(0xfffff000), 0)
+            cpu.pc = 0x20
+            cpu.regs[10] = intbv(0x1234)[32:] if engine is CPU else 0x1234
+            cpu.run(until_pc=0x24)
+            self.assertEqual(ram.readWordAsInt(0xfffff000), 0x1234)
+            cpu.pc = 0x20
+            cpu.regs[11] = intbv(0x10)[32:] if engine is CPU else 0x10  # into the read only text
+            result = cpu.run()
+            self.assertEqual((result.reason, result.pc, result.fault_address), (STOP_MEMORY_FAULT, 0x20, 0x10))
+
+    def test_execute_permission(self):
+        for engine in self.engines:
+            with self.subTest(engine=engine.__name__):
+                ram = PagedMemory()  # Read and write only, like a data page
+                loadWords(ram, _run_program)
+                cpu = engine(ram)
+                cpu.pc = 0x1c
+                result = cpu.run()
+                self.assertEqual((result.reason, result.retired, result.pc, result.fault_address),
+                                 (STOP_MEMORY_FAULT, 0, 0x1c, 0x1c))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from CPU import STOP_EXIT, STOP_WAIT
+from harts import Scheduler, makeHarts, WAITING
+from loader import loadProgram
+import syscalls
+
+_program = [0x00051e63,  # bnez a0, 28
+            0x00018513,  # mv a0, gp
+            0x00000593,  # li a1, 0
+            0x3eb00893,  # li a7, 1003
+            0x00000073,  # ecall  wait while the word at gp is 0
+            0x0041a503,  # lw a0, 4(gp)
+            0x0140006f,  # j 20
+            0x00551293,  # slli t0, a0, 5
+            0x0051a223,  # sw t0, 4(gp)
+            0x00a1a023,  # sw a0, 0(gp)
+            0x00700513,  # li a0, 7
+            0x05d00893,  # li a7, 93
+            0x00000073]  # ecall  exit
+_text = b''.join(word.to_bytes(4, 'little') for word in _program)
+
+
+class HartsTestSuit(unittest.TestCase):
+    def setUp(self):
+        syscalls.dump_on_exit = False
+
+    def tearDown(self):
+        syscalls.dump_on_exit = True
+
+    def test_make_harts(self):
+        cpu = loadProgram(_text, b'', 'fast')
+        sp = int(cpu.regs[2])
+        harts = makeHarts(cpu, 3, stack_stride=0x100)
+        self.assertIs(harts[0].cpu, cpu)
+        self.assertEqual([int(hart.cpu.regs[10]) for hart in harts], [0, 1, 2])
+        self.assertEqual([int(hart.cpu.regs[2]) for hart in harts], [sp, sp - 0x100, sp - 0x200])
+        self.assertTrue(all(hart.cpu.ram is cpu.ram for hart in harts))
+
+    def test_wait_and_wake(self):
+        for engine in ('intbv', 'fast', 'translate'):
+            with self.subTest(engine=engine):
+                result = Scheduler(makeHarts(loadProgram(_text, b'', engine), 3)).run()
+                self.assertEqual(result.reasons, [STOP_EXIT] * 3)
+                # Hart 0 waits first, wakes after harts 1 and 2 stored their slots
+                self.assertEqual(result.exit_codes, [64, 7, 7])
+                self.assertEqual(result.retired, [9, 7, 7])
+
+    def test_small_quantum_is_reproducible(self):
+        results = [Scheduler(makeHarts(loadProgram(_text, b'', 'fast'), 3), quantum=1).run() for i in range(2)]
+        self.assertEqual(results[0][:3], results[1][:3])
+        self.assertEqual(results[0].reasons, [STOP_EXIT] * 3)
+
+    def test_wait_alone(self):
+        cpu = loadProgram(_text, b'', 'fast')
+        self.assertEqual(cpu.run().reason, STOP_WAIT)
+        self.assertEqual(cpu.pc, 0x14)  # Past the ecall, where it resumes once woken
+        result = Scheduler(makeHarts(loadProgram(_text, b'', 'fast'), 1)).run()
+        self.assertEqual((result.reasons, result.exit_codes), ([WAITING], [None]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+from CPU import CPU, STOP_EXIT
+from loader import loadProgram
+from lockstep import Lockstep, report
+import syscalls
+from test_snapshot import _text as _loop_text
+
+_program = [0x000025b7,  # lui a1, 2
+            0x0005a503,  # lw a0, 0(a1)
+            0x00150513,  # addi a0, a0, 1
+            0x00a5a223,  # sw a0, 4(a1)
+            0x00100073,  # ebreak
+            0x00150513]  # addi a0, a0, 1
+
+
+def words(program: list) -> bytes:
+    return b''.join(word.to_bytes(4, 'little') for word in program)
+
+
+class LockstepTestSuit(unittest.TestCase):
+    def setUp(self):
+        syscalls.dump_on_exit = False
+
+    def tearDown(self):
+        syscalls.dump_on_exit = True
+
+    def test_agree(self):
+        for engine in ('fast', 'translate'):
+            for interval in (1, 7):
+                with self.subTest(engine=engine, interval=interval):
+                    checker = Lockstep(loadProgram(_loop_text, b'', 'intbv'), loadProgram(_loop_text, b'', engine),
+                                       interval)
+                    self.assertIsNone(checker.run())
+                    self.assertEqual(checker.retired, 44)
+                    self.assertEqual((checker.result.reason, checker.result.exit_code), (STOP_EXIT, 55))
+
+    def test_paged_memory(self):
+        for interval in (1, 7):
+            with self.subTest(interval=interval):
+                checker = Lockstep(loadProgram(_loop_text, b'', 'intbv', memory='paged'),
+                                   loadProgram(_loop_text, b'', 'fast', memory='paged'), interval)
+                self.assertIsNone(checker.run())
+                self.assertEqual((checker.retired, checker.result.exit_code), (44, 55))
+        wrong = list(_program)
+        wrong[3] = 0x00a5a423  # sw a0, 8(a1)
+        divergence = Lockstep(loadProgram(words(_program), b'', 'intbv', memory='paged'),
+                              loadProgram(words(wrong), b'', 'fast', memory='paged'), 4).run()
+        self.assertEqual((divergence.retired, divergence.pc), (3, 0xc))  # Found by replaying the copies
+
+    def test_register_divergence(self):
+        for interval in (1, 10):
+            with self.subTest(interval=interval):
+                candidate = loadProgram(words(_program), b'', 'fast')
+                candidate.ram.writeWord(0x2000, 5)
+                divergence = Lockstep(loadProgram(words(_program), b'', 'intbv'), candidate, interval).run()
+                self.assertEqual((divergence.retired, divergence.pc), (1, 0x4))
+                self.assertEqual(divergence.instructions, ('lw x10, 0(x11)', 'lw x10, 0(x11)'))
+                self.assertEqual(divergence.differences, ['x10: 0x00000000, 0x00000005'])
+                self.assertIn('after 1 instructions, at pc 0x4', report(divergence))
+
+    def test_store_divergence(self):
+        wrong = list(_program)
+        wrong[3] = 0x00a5a423  # sw a0, 8(a1)
+        divergence = Lockstep(loadProgram(words(_program), b'', 'intbv'),
+                              loadProgram(words(wrong), b'', 'translate'), 4).run()
+        self.assertEqual((divergence.retired, divergence.pc), (3, 0xc))
+        self.assertEqual(divergence.instructions, ('sw x10, 4(x11)', 'sw x10, 8(x11)'))
+        self.assertEqual(divergence.differences, ['memory 0x2004: 0x01, 0x00'])
+
+    def test_step_limit(self):
+        checker = Lockstep(loadProgram(words(_program), b'', 'intbv'), loadProgram(words(_program), b'', 'fast'), 2)
+        self.assertIsNone(checker.run(max_steps=5))  # runs past the ebreak
+        self.assertEqual(checker.retired, 5)
+        self.assertIsInstance(checker.reference, CPU)
+
+
+if __name__ == '__main__':
+    unittest.main()
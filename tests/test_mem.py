@@ -1,5 +1,7 @@
 import unittest
-from mem import Memory
+from mem import Memory, PagedMemory, AccessFault, MemoryFault, PERM_READ, PERM_EXECUTE
+import mem
+import syscalls
 
 class MemoryTestSuit(unittest.TestCase):
     ram = None
@@ -19,7 +21,124 @@ class MemoryTestSuit(unittest.TestCase):
         self.assertEqual(val, 0)
     
     def test_mem_comprehinsive_numbers(self):
-        pass
+        self.ram.writeWord(8, 0x12345678)
+        self.assertEqual(self.ram.readWordAsInt(8), 0x12345678)
+        self.assertEqual(self.ram.readHalfWordAsInt(8), 0x5678)
+        self.assertEqual(self.ram.readHalfWordAsInt(10), 0x1234)
+        self.assertEqual(self.ram.readAsInt(8), 0x78)
+        self.assertEqual(self.ram.readWord(8), bytearray(b'\x78\x56\x34\x12'))
+        self.ram.writeHalfWord(8, 0xabcdef)  # only the low 16 bits are written
+        self.assertEqual(self.ram.readWordAsInt(8), 0x1234cdef)
+
+    def test_mem_bulk_bytes(self):
+        self.ram.write_bytes(90, b'0123456789')
+        view = self.ram.read_bytes(90, 10)
+        self.assertEqual(bytes(view), b'0123456789')
+        self.ram.writeByte(90, ord('x'))
+        self.assertEqual(view[0], ord('x'))  # a view, not a copy
+
+    def test_mem_out_of_range(self):
+        with self.assertRaises(IndexError):
+            self.ram.readWordAsInt(98)
+        with self.assertRaises(IndexError):
+            self.ram.write_bytes(95, bytes(10))
+        self.assertEqual(self.ram.getSize(), 100)
+
+    def test_mem_dirty_pages(self):
+        ram = Memory(0x1000)
+        ram.write_bytes(0, bytes(range(16)))
+        ram.clearDirty()
+        self.assertEqual(ram.dirtyRanges(), [])
+        ram.writeByte(0x105, 1)
+        ram.writeWord(0x2fe, 0xffffffff)  # crosses into the next page
+        ram.write_bytes(0xf00, b'abc')
+        self.assertEqual(ram.dirtyRanges(), [(0x100, 0x400), (0xf00, 0x1000)])
+        dump = syscalls.hexDump(ram, ram.dirtyRanges()).splitlines()
+        self.assertEqual(dump[:4], ['Memory changed since load: 2 range(s)',
+                                    '00000100: 00 00 00 00 00 01 00 00 00 00 00 00 00 00 00 00',
+                                    '00000110: 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00',
+                                    '*'])
+        self.assertIn('00000f00: 61 62 63 00 00 00 00 00 00 00 00 00 00 00 00 00', dump)
+
+    def test_mem_bulk_operations(self):
+        for use_numpy in (True, False):
+            saved = mem.numpy
+            if not use_numpy:
+                mem.numpy = None  # the fallback used when NumPy is not installed
+            try:
+                ram = Memory(0x1000)
+                ram.fill(0x100, 0x20, 0x1ab)
+                ram.copy(0x108, 0x100, 0x20)  # overlapping, like memmove
+                self.assertEqual(bytes(ram.read_bytes(0x100, 0x30)), b'\xab' * 0x28 + bytes(8))
+                self.assertEqual(ram.compare(0x100, 0x108, 0x20), 0)
+                self.assertEqual(ram.compare(0x100, 0x108, 0x21), 0xab)
+                self.assertEqual(ram.compare(0x128, 0x100, 4), -0xab)
+                self.assertEqual(ram.dirtyRanges(), [(0x100, 0x200)])
+                with self.assertRaises(MemoryFault):
+                    ram.fill(0xff0, 0x20)
+            finally:
+                mem.numpy = saved
+
+    @unittest.skipIf(mem.numpy is None, 'needs NumPy')
+    def test_mem_array(self):
+        ram = Memory(0x100)
+        array = ram.array()
+        self.assertEqual(array.shape, (0x100,))
+        array[4:8] = 7
+        self.assertEqual(ram.readWordAsInt(4), 0x07070707)
+        ram.writeByte(0, 9)
+        self.assertEqual(array[0], 9)
+
+
+class PagedMemoryTestSuit(unittest.TestCase):
+    def setUp(self):
+        self.ram = PagedMemory()
+
+    def test_whole_address_space(self):
+        self.assertEqual(self.ram.getSize(), 1 << 32)
+        self.assertEqual(self.ram.readWordAsInt(0x80000000), 0)  # unmapped reads as zero
+        self.assertEqual(len(self.ram.pages), 0)
+        self.ram.writeWord(0x80000000, 0x12345678)
+        self.ram.writeByte(0xffffffff, 0xab)
+        self.assertEqual(self.ram.readWordAsInt(0x80000000), 0x12345678)
+        self.assertEqual(self.ram.readAsInt(0xffffffff), 0xab)
+        self.assertEqual(len(self.ram.pages), 2)
+        with self.assertRaises(MemoryFault):
+            self.ram.readHalfWordAsInt(0xffffffff)
+        with self.assertRaises(MemoryFault):
+            self.ram.writeWord(-4, 0)
+
+    def test_page_crossing(self):
+        self.ram.writeWord(0x1ffe, 0xaabbccdd)
+        self.assertEqual(self.ram.readWordAsInt(0x1ffe), 0xaabbccdd)
+        self.assertEqual(self.ram.readHalfWordAsInt(0x2000), 0xaabb)
+        self.ram.write_bytes(0x2ff0, bytes(range(32)))
+        self.assertEqual(bytes(self.ram.read_bytes(0x2ff0, 32)), bytes(range(32)))
+        self.assertEqual(self.ram.dirtyRanges(), [(0x1000, 0x4000)])
+
+    def test_cached_zero_page(self):
+        self.assertEqual(self.ram.readAsInt(0x5000), 0)  # caches the shared zero page
+        self.ram.writeByte(0x5001, 7)
+        self.assertEqual(self.ram.readAsInt(0x5001), 7)
+
+    def test_permissions(self):
+        self.ram.write_bytes(0, b'\x13\x00\x00\x00')
+        self.ram.setPermissions(0, 0x1000, PERM_READ | PERM_EXECUTE)
+        self.assertEqual(self.ram.readWordAsInt(0), 0x13)
+        with self.assertRaises(AccessFault) as fault:
+            self.ram.writeWord(8, 0)
+        self.assertEqual(fault.exception.address, 8)
+        self.ram.writeWord(0x1000, 1)  # the next page is still writable
+        self.assertEqual(self.ram.fetchWordAsInt(0), 0x13)
+        with self.assertRaises(AccessFault):
+            self.ram.fetchWordAsInt(0x1000)  # readable and writable, not executable
+
+    def test_strict(self):
+        ram = PagedMemory(strict=True)
+        with self.assertRaises(AccessFault):
+            ram.readAsInt(0x4000)
+        ram.writeByte(0x4000, 1)
+        self.assertEqual(ram.readAsInt(0x4fff), 0)
 
 
 if __name__ == '__main__':
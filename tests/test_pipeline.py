@@ -0,0 +1,56 @@
+import unittest
+from CPU import STOP_EBREAK
+from loader import loadProgram
+from pipeline import PipelineModel, StaticPredictor, GsharePredictor, BimodalPredictor, STALL_LOAD_USE, STALL_RAW, \
+    STALL_MULDIV, STALL_BRANCH, STALL_JUMP
+from test_profiler import _text
+
+_hazards = [0x0001a283,  # lw t0, 0(gp)
+            0x00128313,  # addi t1, t0, 1
+            0x026303b3,  # mul t2, t1, t1
+            0x00738e33,  # add t3, t2, t2
+            0x00100073]  # ebreak
+_hazards_text = b''.join(word.to_bytes(4, 'little') for word in _hazards)
+
+
+class PipelineTestSuit(unittest.TestCase):
+    def test_control(self):
+        for engine in ('intbv', 'fast', 'translate'):
+            for predictor, predicted in ((StaticPredictor(), 4), (BimodalPredictor(), 3)):
+                with self.subTest(engine=engine, predictor=predictor.name):
+                    cpu = loadProgram(_text, b'', engine)
+                    model = PipelineModel(cpu, predictor)
+                    self.assertEqual(cpu.run().reason, STOP_EBREAK)
+                    self.assertEqual(model.instructions, 32)
+                    # The loop branch misses the BTB once and leaves the loop once, jal and ret miss once each
+                    self.assertEqual((model.stalls[STALL_BRANCH], model.stalls[STALL_JUMP]), (4, 3))
+                    self.assertEqual(model.cycles(), 32 + 4 + 7)
+                    self.assertEqual((model.branches, model.predicted), (5, predicted))
+                    self.assertEqual((model.jumps, model.jump_mispredicted), (10, 2))
+
+    def test_hazards(self):
+        cpu = loadProgram(_hazards_text, b'', 'fast')
+        model = PipelineModel(cpu)
+        cpu.run()
+        self.assertEqual((model.stalls[STALL_LOAD_USE], model.stalls[STALL_MULDIV], model.stalls[STALL_RAW]),
+                         (1, 2, 0))
+        self.assertEqual(model.cycles(), 5 + 4 + 3)
+        cpu = loadProgram(_hazards_text, b'', 'fast')
+        model = PipelineModel(cpu, forwarding=False)
+        cpu.run()
+        self.assertEqual((model.stalls[STALL_LOAD_USE], model.stalls[STALL_MULDIV], model.stalls[STALL_RAW]),
+                         (0, 4, 4))
+        self.assertIn('CPI', model.report())
+
+    def test_gshare_learns_a_pattern(self):
+        predictor = GsharePredictor(256, 4)
+        outcomes = [True, True, False] * 40
+        correct = 0
+        for taken in outcomes:
+            correct += predictor.predict(0x40, -8) == taken
+            predictor.update(0x40, taken)
+        self.assertGreater(correct, 100)  # A bimodal counter gets about two in three of this pattern
+
+
+if __name__ == '__main__':
+    unittest.main()
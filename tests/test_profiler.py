@@ -0,0 +1,39 @@
+import unittest
+from loader import loadProgram
+from profiler import Profiler
+
+_program = [0x00500513,  # li a0, 5
+            0x010000ef,  # jal ra, 16
+            0xfff50513,  # addi a0, a0, -1
+            0xfe051ce3,  # bnez a0, -8
+            0x00100073,  # ebreak
+            0x00a1a023,  # sw a0, 0(gp)
+            0x00018283,  # lb t0, 0(gp)
+            0x00008067]  # ret
+_text = b''.join(word.to_bytes(4, 'little') for word in _program)
+
+
+class ProfilerTestSuit(unittest.TestCase):
+    def test_profile(self):
+        for engine in ('intbv', 'fast', 'translate'):
+            with self.subTest(engine=engine):
+                cpu = loadProgram(_text, b'', engine)
+                profiler = Profiler(cpu)
+                result = cpu.run(until_pc=0x10)
+                self.assertEqual(result.retired, 31)
+                self.assertEqual(profiler.counts[:8], [1, 5, 5, 5, 0, 5, 5, 5])
+                self.assertEqual(profiler.mnemonicCounts(), {'addi': 6, 'jal': 5, 'bne': 5, 'sw': 5, 'lb': 5,
+                                                             'jalr': 5})
+                outcomes = profiler.branchOutcomes()
+                self.assertEqual([(pc, taken, not_taken) for pc, decoded, taken, not_taken in outcomes],
+                                 [(0x0c, 4, 1)])
+                self.assertEqual(profiler.loops(), [(0x04, 0x0c, 4, 15)])
+                self.assertEqual(profiler.memoryBytes(), {'load': {1: 5, 2: 0, 4: 0}, 'store': {1: 0, 2: 0, 4: 20}})
+                self.assertEqual(profiler.callGraph(), {(0x00, 0x14): 5})
+                report = profiler.report()
+                self.assertIn('Instructions retired: 31', report)
+                self.assertIn('0x0000 -> 0x0014          5 calls', report)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+from CPU import STOP_EXIT, STOP_STEP_LIMIT
+from loader import loadProgram
+from snapshot import SnapshotError, readSnapshot, restoreSnapshot, saveSnapshot
+import syscalls
+
+_program = [0x00000513,  # li a0, 0
+            0x00a00293,  # li t0, 10
+            0x00550533,  # add a0, a0, t0
+            0x00a1a023,  # sw a0, 0(gp)
+            0xfff28293,  # addi t0, t0, -1
+            0xfe029ae3,  # bnez t0, -12
+            0x05d00893,  # li a7, 93
+            0x00000073]  # ecall
+_text = b''.join(word.to_bytes(4, 'little') for word in _program)
+
+
+class SnapshotTestSuit(unittest.TestCase):
+    def setUp(self):
+        syscalls.dump_on_exit = False
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        syscalls.dump_on_exit = True
+        self.directory.cleanup()
+
+    def test_restore_and_resume(self):
+        for compress in (False, True):
+            file_name = os.path.join(self.directory.name, 'state.snap')
+            cpu = loadProgram(_text, b'', 'fast')
+            self.assertEqual(cpu.run(17).reason, STOP_STEP_LIMIT)
+            saveSnapshot(cpu, file_name, 17, compress)
+            regs = list(cpu.regs)
+            memory = bytes(cpu.ram.mem)
+            for engine in ('intbv', 'fast', 'translate'):
+                with self.subTest(engine=engine, compress=compress):
+                    restored, retired = restoreSnapshot(file_name, engine)
+                    self.assertEqual(retired, 17)
+                    self.assertEqual(restored.pc, cpu.pc)
+                    self.assertEqual([int(reg) for reg in restored.regs], regs)
+                    self.assertEqual(bytes(restored.ram.mem), memory)
+                    result = restored.run()
+                    self.assertEqual(result.reason, STOP_EXIT)
+                    self.assertEqual(result.exit_code, 55)
+                    self.assertEqual(retired + result.retired, 44)
+
+    def test_bad_files(self):
+        file_name = os.path.join(self.directory.name, 'state.snap')
+        saveSnapshot(loadProgram(_text, b'', 'fast'), file_name)
+        with open(file_name, 'r+b') as file:
+            file.seek(6)
+            file.write(b'\x63\x00')  # A version from the future
+        with self.assertRaises(SnapshotError):
+            readSnapshot(file_name)
+        with open(file_name, 'wb') as file:
+            file.write(_text)
+        with self.assertRaises(SnapshotError):
+            readSnapshot(file_name)
+        open(file_name, 'wb').close()
+        with self.assertRaises(SnapshotError):
+            restoreSnapshot(file_name)
+
+
+if __name__ == '__main__':
+    unittest.main()
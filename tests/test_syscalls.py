@@ -0,0 +1,107 @@
+import contextlib
+import io
+import unittest
+from CPU import STOP_EBREAK, STOP_STEP_LIMIT
+from loader import loadProgram
+import syscalls
+
+_bulk_program = [0x00002537,  # lui a0, 2
+                 0x05a00593,  # li a1, 90
+                 0x06400613,  # li a2, 100
+                 0x3e900893,  # li a7, 1001  (memset)
+                 0x00000073,  # ecall
+                 0x10050513,  # addi a0, a0, 256
+                 0x000025b7,  # lui a1, 2
+                 0x3e800893,  # li a7, 1000  (memcpy)
+                 0x00000073,  # ecall
+                 0x00002537,  # lui a0, 2
+                 0x10050593,  # addi a1, a0, 256
+                 0x3ea00893,  # li a7, 1002  (memcmp)
+                 0x00000073,  # ecall
+                 0x00050413,  # mv s0, a0
+                 0x000582a3,  # sb zero, 5(a1)
+                 0x00002537,  # lui a0, 2
+                 0x3ea00893,  # li a7, 1002  (memcmp)
+                 0x00000073,  # ecall
+                 0x00100073]  # ebreak
+_text = b''.join(word.to_bytes(4, 'little') for word in _bulk_program)
+
+_write_program = [0x000025b7,  # lui a1, 2
+                  0x00300613,  # li a2, 3
+                  0x00100513,  # li a0, 1
+                  0x04000893,  # li a7, 64  (write)
+                  0x00000073,  # ecall
+                  0x00050413,  # mv s0, a0
+                  0x00500513,  # li a0, 5
+                  0x00000073,  # ecall
+                  0x00050493,  # mv s1, a0
+                  0x00200513,  # li a0, 2
+                  0x00100613,  # li a2, 1
+                  0x00000073,  # ecall
+                  0x00100073]  # ebreak
+
+
+class SyscallTestSuit(unittest.TestCase):
+    def test_bulk_memory(self):
+        for engine in ('intbv', 'fast', 'translate'):
+            for memory in ('flat', 'paged'):
+                with self.subTest(engine=engine, memory=memory):
+                    cpu = loadProgram(_text, b'', engine, memory=memory)
+                    result = cpu.run()
+                    self.assertEqual((result.reason, result.retired), (STOP_EBREAK, 19))
+                    self.assertEqual(bytes(cpu.ram.read_bytes(0x2000, 101)), b'\x5a' * 100 + b'\0')
+                    self.assertEqual(bytes(cpu.ram.read_bytes(0x2100, 6)), b'\x5a' * 5 + b'\0')
+                    self.assertEqual(int(cpu.regs[8]), 0)  # equal before the sb
+                    self.assertEqual(int(cpu.regs[10]), 0x5a)
+
+    def test_memcpy_over_code(self):
+        # memcpy of two nops over the ebreaks, which must not run from a stale decode
+        program = [0x01400513,  # li a0, 20
+                   0x01c00593,  # li a1, 28
+                   0x00800613,  # li a2, 8
+                   0x3e800893,  # li a7, 1000  (memcpy)
+                   0x00000073,  # ecall
+                   0x00100073,  # ebreak, overwritten
+                   0x00100073,  # ebreak, overwritten
+                   0x00000013,  # nop
+                   0x00000013]  # nop
+        text = b''.join(word.to_bytes(4, 'little') for word in program)
+        for engine in ('intbv', 'fast', 'translate'):
+            with self.subTest(engine=engine):
+                cpu = loadProgram(text, b'', engine)
+                cpu.lookup(20)  # cache the ebreak
+                result = cpu.run(max_steps=7)
+                self.assertEqual((result.reason, result.pc), (STOP_STEP_LIMIT, 28))
+    def test_write(self):
+        text = b''.join(word.to_bytes(4, 'little') for word in _write_program)
+        for engine in ('intbv', 'fast', 'translate'):
+            with self.subTest(engine=engine):
+                stdout = io.TextIOWrapper(io.BytesIO())
+                stderr = io.TextIOWrapper(io.BytesIO())
+                with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                    cpu = loadProgram(text, b'\xff\x00A', engine)
+                    self.assertEqual(cpu.run().reason, STOP_EBREAK)
+                    self.assertEqual(stdout.buffer.getvalue(), b'')  # still buffered
+                    syscalls.flushOutput()
+                self.assertEqual(stdout.buffer.getvalue(), b'\xff\x00A')  # the raw bytes, no newline
+                self.assertEqual(stderr.buffer.getvalue(), b'\xff')
+                self.assertEqual(int(cpu.regs[8]), 3)  # bytes written
+                self.assertEqual(int(cpu.regs[9]), 0xfffffff7)  # -EBADF
+                self.assertEqual(int(cpu.regs[10]), 1)
+
+    def test_write_threshold(self):
+        saved = syscalls.flush_threshold
+        syscalls.flush_threshold = 2
+        try:
+            stdout = io.TextIOWrapper(io.BytesIO())
+            with contextlib.redirect_stdout(stdout):
+                cpu = loadProgram(b''.join(word.to_bytes(4, 'little') for word in _write_program[:5]),
+                                  b'abc', 'fast')
+                cpu.run()
+                self.assertEqual(stdout.buffer.getvalue(), b'abc')
+        finally:
+            syscalls.flush_threshold = saved
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+from CPU import STOP_EBREAK
+from loader import loadProgram
+from tracefile import TraceWriter, readTrace, formatRecord, FLAG_RD, FLAG_LOAD, FLAG_STORE, FLAG_STOPPED
+from test_profiler import _text
+
+
+class TraceFileTestSuit(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_name = os.path.join(self.directory.name, 'trace.bin')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_stream(self):
+        for engine in ('intbv', 'fast', 'translate'):
+            with self.subTest(engine=engine):
+                cpu = loadProgram(_text, b'', engine)
+                writer = TraceWriter(cpu, self.file_name)
+                self.assertEqual(cpu.run().reason, STOP_EBREAK)
+                writer.close()
+                records = readTrace(self.file_name)
+                self.assertEqual(len(records), 32)
+                self.assertEqual(records[0][:5], (0x00, 0x00500513, FLAG_RD, 10, 5))
+                gp = int(cpu.regs[3])
+                self.assertEqual(records[2][:3], (0x14, 0x00a1a023, FLAG_STORE))
+                self.assertEqual(records[2][5:], (gp, 5))
+                self.assertEqual(records[3][2:], (FLAG_RD | FLAG_LOAD, 5, 5, gp, 5))
+                self.assertEqual((records[-1].pc, records[-1].flags), (0x10, FLAG_STOPPED))
+                self.assertEqual(formatRecord(records[0]), '0x0  00500513  addi x10, x0, 5           x10 = 0x00000005')
+
+    def test_ring_keeps_the_last_records(self):
+        cpu = loadProgram(_text, b'', 'fast')
+        writer = TraceWriter(cpu, self.file_name, ring=4)
+        cpu.run()
+        self.assertEqual([record.pc for record in readTrace(self.file_name)], [0x1c, 0x08, 0x0c, 0x10])
+        writer.close()
+        self.assertEqual(writer.written, 32)
+        self.assertEqual([record.pc for record in readTrace(self.file_name)], [0x1c, 0x08, 0x0c, 0x10])
+        for ring in (0, -1):
+            with self.assertRaises(ValueError):
+                TraceWriter(loadProgram(_text, b'', 'fast'), self.file_name, ring)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+from mem import Memory
+from fastcpu import FastCPU
+from translator import TranslatingCPU
+from CPU import STOP_EBREAK
+from loader import loadProgram
+from test_cpu import loadWords
+
+_program = [0x00000513,  # li a0, 0
+            0x002505b7,  # lui a1, 0x250
+            0x51358593,  # addi a1, a1, 0x513  (a1 = addi a0, a0, 2)
+            0x00150513,  # addi a0, a0, 1
+            0x00b02623,  # sw a1, 12(zero)  (overwrite the instruction above)
+            0x00128293,  # addi t0, t0, 1
+            0x00200313,  # li t1, 2
+            0xfe62c8e3,  # blt t0, t1, -16
+            0x02650633,  # mul a2, a0, t1
+            0x025646b3,  # div a3, a2, t0
+            0x00000703,  # lb a4, 0(zero)
+            0x00205783,  # lhu a5, 2(zero)
+            0x40575833,  # sra a6, a4, t0
+            0xfff73893,  # sltiu a7, a4, -1
+            0xfff74913,  # not s2, a4
+            0x040009e7]  # jalr s3, 64(zero)
+
+_fusions = [0x12345537,  # lui a0, 0x12345
+            0x67850513,  # addi a0, a0, 0x678  (lui+addi)
+            0x000015b7,  # lui a1, 1
+            0xfff58613,  # addi a2, a1, -1  (lui+addi, a1 is kept)
+            0x00300293,  # li t0, 3
+            0xfff28293,  # addi t0, t0, -1
+            0xfe029ee3,  # bnez t0, -4  (addi+branch)
+            0x00062313,  # slti t1, a2, 0
+            0x00030463,  # beqz t1, 8  (slt+branch)
+            0x00100073,  # ebreak
+            0x00000397,  # auipc t2, 0
+            0x00c380e7,  # jalr ra, 12(t2)  (auipc+jalr)
+            0x00100073,  # ebreak
+            0x00100073]  # ebreak
+
+_fused_branches = [0x00000293,  # li t0, 0
+                   0x00500313,  # li t1, 5
+                   0x00128293,  # addi t0, t0, 1
+                   0xfe62cee3,  # blt t0, t1, -4  (addi+branch)
+                   0x00900393,  # li t2, 9
+                   0xffd38393,  # addi t2, t2, -3
+                   0xfe737ee3,  # bgeu t1, t2, -4  (addi+branch, the counter in rs2)
+                   0x00633513,  # sltiu a0, t1, 6
+                   0x00050463,  # beqz a0, 8  (slt+branch, not taken)
+                   0x005325b3,  # slt a1, t1, t0
+                   0x00059463,  # bnez a1, 8  (slt+branch, not taken)
+                   0x00700613,  # li a2, 7
+                   0x00100073]  # ebreak
+
+
+def runProgram(cpu):
+    steps = 0
+    while cpu.pc != 0x40:
+        cpu.fetch()
+        if not cpu.jump_flag:
+            cpu.pc += 4
+        steps += 1
+    return steps
+
+
+class TranslatorTestSuit(unittest.TestCase):
+    def setUp(self):
+        self.ram = Memory(0x3ffc)
+        loadWords(self.ram, _program)
+
+    def test_matches_interpreter(self):
+        fast_ram = Memory(0x3ffc)
+        loadWords(fast_ram, _program)
+        fast = FastCPU(fast_ram)
+        translating = TranslatingCPU(self.ram)
+        runProgram(fast)
+        steps = runProgram(translating)
+        self.assertEqual(translating.regs, fast.regs)
+        self.assertEqual(self.ram.mem, fast_ram.mem)
+        self.assertLess(steps, len(_program))  # whole blocks ran per fetch
+
+    def test_store_into_block_invalidates_it(self):
+        cpu = TranslatingCPU(self.ram)
+        runProgram(cpu)
+        self.assertEqual(cpu.regs[10], 3)  # 1 from the original code, 2 from the code written over it
+        self.assertNotIn(0, cpu.blocks)
+
+    def test_fusion(self):
+        text = b''.join(word.to_bytes(4, 'little') for word in _fusions)
+        fast = loadProgram(text, b'', 'fast')
+        expected = fast.run()
+        self.assertEqual(expected.pc, 0x38)  # Past the ebreak at the jalr target
+        for fusion_enabled in (True, False):
+            with self.subTest(fusion_enabled=fusion_enabled):
+                cpu = loadProgram(text, b'', 'translate')
+                cpu.fusion_enabled = fusion_enabled
+                cpu.count_fusions = True
+                result = cpu.run()
+                self.assertEqual((result.reason, result.pc, result.retired), (STOP_EBREAK, expected.pc, expected.retired))
+                self.assertEqual(cpu.regs, fast.regs)
+                self.assertEqual(cpu.fusions, [2, 1, 1, 2] if fusion_enabled else [0] * 4)
+                self.assertEqual(cpu.fused, [2, 1, 1, 3] if fusion_enabled else [0] * 4)
+        self.assertIn('addi+branch', cpu.fusionReport())
+
+    def test_fused_branches(self):
+        text = b''.join(word.to_bytes(4, 'little') for word in _fused_branches)
+        fast = loadProgram(text, b'', 'fast')
+        expected = fast.run()
+        cpu = loadProgram(text, b'', 'translate')
+        result = cpu.run()
+        self.assertEqual((result.reason, result.pc, result.retired), (STOP_EBREAK, expected.pc, expected.retired))
+        self.assertEqual(cpu.regs, fast.regs)
+        self.assertEqual([int(cpu.regs[index]) for index in (5, 7, 10, 11, 12)], [5, 6, 1, 0, 7])
+        self.assertEqual(cpu.fusions[2:], [2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
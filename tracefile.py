@@ -0,0 +1,207 @@
+# Binary execution traces: one fixed size record per executed instruction, written through a large
+# buffered stream, or kept in a preallocated ring of the last N records that is written out when the
+# guest stops the run (exit, halt, ebreak, a fault) and when the writer is closed.
+# Nothing is formatted while the guest runs, run this module on a trace file to disassemble it:
+#   python tracefile.py trace.bin
+#
+# File format (little endian):
+#   magic     7 bytes  b'RVTRACE'
+#   version   u8       _version
+#   records   the rest of the file, _record.size bytes each, oldest first:
+#     pc        u32
+#     word      u32    raw instruction word
+#     flags     u8     FLAG_ values below
+#     rd        u8     destination register, 0 if none
+#     rd_value  u32    value written to rd, if FLAG_RD
+#     address   u32    address loaded or stored, if FLAG_LOAD or FLAG_STORE
+#     value     u32    the value stored, or loaded (0 for a load into x0), as wide as the access
+
+from argparse import ArgumentParser
+from collections import namedtuple
+from functools import partial
+import struct
+import sys
+from decoder import decode, IllegalInstruction
+from fastcpu import FastCPU
+import tracing
+
+_magic = b'RVTRACE'
+_version = 1
+_header = struct.Struct('<7sB')
+_record = struct.Struct('<IIBBIII')
+
+FLAG_RD = 1        # the instruction wrote rd
+FLAG_LOAD = 2      # the instruction loaded from address
+FLAG_STORE = 4     # the instruction stored to address
+FLAG_STOPPED = 8   # the instruction stopped the run: a syscall, ebreak or fault. Nothing after it is known
+
+Record = namedtuple('Record', ['pc', 'word', 'flags', 'rd', 'rd_value', 'address', 'value'])
+
+_access_widths = {'lb': 1, 'lh': 2, 'lw': 4, 'lbu': 1, 'lhu': 2, 'sb': 1, 'sh': 2, 'sw': 4}
+_width_masks = {1: 0xFF, 2: 0xFFFF, 4: 0xFFFFFFFF}
+_stores = ('sb', 'sh', 'sw')
+
+
+class TraceError(ValueError):
+    """
+    Raised when a file is not a trace of this version.
+    """
+
+
+class TraceWriter:
+    """
+        Writes a record for every instruction a CPU executes.
+        Creating the writer attaches it to the CPU, like Profiler. Call close() when the run is over.
+        Args:
+            cpu: any engine. TranslatingCPU runs on its interpreter while traced
+            file_name: the trace file
+            ring: keep only the last ring records (at least 1) and write them out when the run stops. None streams
+                  every record
+            buffer_size: buffer of the stream, in bytes
+    """
+    def __init__(self, cpu, file_name: str, ring: int = None, buffer_size: int = 1 << 20):
+        if ring is not None and ring < 1:
+            raise ValueError('the trace ring must hold at least 1 record, not {}'.format(ring))
+        self.cpu = cpu
+        self.file_name = file_name
+        self.ring = ring
+        self.written = 0  # Records made so far, the ring holds the last min(written, ring) of them
+        if ring is None:
+            self.file = open(file_name, 'wb', buffering=buffer_size)
+            self.file.write(_header.pack(_magic, _version))
+        else:
+            self.file = None
+            self.buffer = bytearray(ring * _record.size)
+        self.attach()
+
+    def attach(self):
+        cpu = self.cpu
+        fetch = cpu.fetch
+        regs = cpu.regs
+        ram = cpu.ram
+        lookup = cpu.lookup
+        read_word = ram.readWordAsInt
+        if getattr(cpu, 'translate_enabled', False):
+            # Whole blocks do not stop between instructions, run them on the interpreter
+            cpu.translate_enabled = False
+            fetch = partial(FastCPU.fetch, cpu)
+        if self.ring is None:
+            write_record = self.file.write
+            pack = _record.pack
+
+            def record(*fields):
+                write_record(pack(*fields))
+        else:
+            buffer = self.buffer
+            pack_into = _record.pack_into
+            size = _record.size
+            length = len(buffer)
+            position = [0]
+
+            def record(*fields):
+                pack_into(buffer, position[0], *fields)
+                position[0] = (position[0] + size) % length
+
+        def tracedFetch():
+            pc = int(cpu.pc)
+            decoded = lookup(pc)
+            width = _access_widths.get(decoded.name)
+            address = flags = value = 0
+            if width:
+                address = (int(regs[decoded.rs1]) + decoded.imm) & 0xFFFFFFFF
+                if decoded.name in _stores:
+                    flags = FLAG_STORE
+                    value = int(regs[decoded.rs2]) & _width_masks[width]
+                else:
+                    flags = FLAG_LOAD
+            try:
+                fetch()
+            except Exception:
+                self.written += 1
+                record(pc, read_word(pc), flags | FLAG_STOPPED, 0, 0, address, 0)
+                self.dump()
+                raise
+            self.written += 1
+            rd = decoded.rd
+            rd_value = int(regs[rd]) if rd else 0
+            if flags == FLAG_LOAD:
+                # Taken from rd, reading memory again would read a device (e.g. the UART input) twice
+                value = rd_value & _width_masks[width]
+            record(pc, read_word(pc), flags | FLAG_RD if rd else flags, rd or 0, rd_value, address, value)
+        cpu.fetch = tracedFetch
+
+    def dump(self):
+        """
+        Write out what is buffered: the ring to the trace file (replacing what it had), or the stream buffer.
+        """
+        if self.ring is None:
+            self.file.flush()
+            return
+        size = _record.size
+        count = min(self.written, self.ring)
+        start = (self.written - count) % self.ring * size
+        with open(self.file_name, 'wb') as file:
+            file.write(_header.pack(_magic, _version))
+            if start == 0:
+                file.write(self.buffer[:count * size])
+            else:  # The ring wrapped, its oldest record is at start
+                file.write(self.buffer[start:])
+                file.write(self.buffer[:start])
+
+    def close(self):
+        self.dump()
+        if self.file:
+            self.file.close()
+
+
+def readTrace(file_name: str) -> list:
+    """
+    Returns: the Records of a trace file, oldest first
+    """
+    with open(file_name, 'rb') as file:
+        data = file.read()
+    if len(data) < _header.size:
+        raise TraceError(file_name + ': too short for a trace')
+    magic, version = _header.unpack_from(data)
+    if magic != _magic:
+        raise TraceError(file_name + ': not a trace')
+    if version != _version:
+        raise TraceError('{}: trace version {}, this VM reads version {}'.format(file_name, version, _version))
+    end = len(data) - (len(data) - _header.size) % _record.size  # A record cut short by a crash is dropped
+    return [Record(*fields) for fields in _record.iter_unpack(data[_header.size:end])]
+
+
+def formatRecord(record: Record) -> str:
+    """
+    One line per record, e.g. '0x10  00150513  addi x10, x10, 1    x10 = 0x00000002'
+    """
+    try:
+        text = tracing.formatInstruction(decode(record.word))
+    except IllegalInstruction:
+        text = 'illegal'
+    line = '{:#x}  {:08x}  {:<24}'.format(record.pc, record.word, text)
+    if record.flags & FLAG_RD:
+        line += '  x{} = {:#010x}'.format(record.rd, record.rd_value)
+    if record.flags & FLAG_STORE and not record.flags & FLAG_STOPPED:
+        line += '  [{:#x}] <- {:#x}'.format(record.address, record.value)
+    elif record.flags & FLAG_LOAD and not record.flags & FLAG_STOPPED:
+        line += '  [{:#x}] = {:#x}'.format(record.address, record.value)
+    if record.flags & FLAG_STOPPED:
+        line += '  stopped the run'
+    return line.rstrip()
+
+
+def main():
+    parser = ArgumentParser(description='Disassemble a binary execution trace')
+    parser.add_argument('trace_file', type=str)
+    parser.add_argument('--last', type=int, default=None, metavar='N', help='only the last N records')
+    args = parser.parse_args()
+    records = readTrace(args.trace_file)
+    if args.last is not None:
+        records = records[-args.last:]
+    sys.stdout.write(''.join(formatRecord(record) + '\n' for record in records))
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
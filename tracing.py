@@ -0,0 +1,62 @@
+# Execution tracing for the CPUs.
+# Tracing is chosen once when the CPU is built: with tracing off the CPU keeps its plain fetch()
+# and nothing in this module runs, so no formatting or printing happens per instruction.
+
+TRACE_OFF = 0
+TRACE_INSTRUCTIONS = 1  # pc and disassembly of every executed instruction
+TRACE_REGISTERS = 2     # ... plus the register file after every instruction
+TRACE_FULL = 3          # ... plus the raw instruction word and its decoded fields
+
+trace_levels = {'off': TRACE_OFF, 'instructions': TRACE_INSTRUCTIONS,
+                'registers': TRACE_REGISTERS, 'full': TRACE_FULL}
+
+_loads = ('lb', 'lh', 'lw', 'lbu', 'lhu')
+_stores = ('sb', 'sh', 'sw')
+
+
+def formatInstruction(decoded) -> str:
+    """
+    Disassemble a DecodedInstruction, e.g. 'addi x10, x10, 1' or 'lw x5, 4(x2)'
+    """
+    if decoded.name in _loads:
+        return '{} x{}, {}(x{})'.format(decoded.name, decoded.rd, decoded.imm, decoded.rs1)
+    if decoded.name in _stores:
+        return '{} x{}, {}(x{})'.format(decoded.name, decoded.rs2, decoded.imm, decoded.rs1)
+    operands = ['x{}'.format(reg) for reg in (decoded.rd, decoded.rs1, decoded.rs2) if reg is not None]
+    if decoded.imm is not None and decoded.name not in ('ecall', 'ebreak'):
+        operands.append(str(decoded.imm))
+    return (decoded.name + ' ' + ', '.join(operands)).strip()
+
+
+def printRegs(regs: list):
+    counter = 0
+    for i in range(len(regs)):
+        for j in range(4):
+            if counter+j > 31:
+                print()
+                return
+            print('x{} = {:08x} '.format(counter+j, int(regs[counter+j])), end='')
+        counter += 4
+        print()
+
+
+def traced(cpu, fetch, level: int):
+    """
+    Wrap the fetch() of cpu so every executed instruction is printed according to level.
+    Args:
+        cpu: CPU or FastCPU, must provide lookup(pc) returning the DecodedInstruction at pc
+        fetch: the untraced fetch function of cpu
+        level: one of the TRACE_ levels above TRACE_OFF
+    Returns: the traced fetch function
+    """
+    def tracedFetch():
+        pc = int(cpu.pc)
+        decoded = cpu.lookup(pc)
+        print('pc = {}\t{}'.format(hex(pc), formatInstruction(decoded)))
+        if level >= TRACE_FULL:
+            print('\tword: {:08x}\t rd: {}\t rs1: {}\t rs2: {}\t imm: {}'.format(
+                cpu.ram.readWordAsInt(pc), decoded.rd, decoded.rs1, decoded.rs2, decoded.imm))
+        fetch()
+        if level >= TRACE_REGISTERS:
+            printRegs(cpu.regs)
+    return tracedFetch
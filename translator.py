@@ -0,0 +1,443 @@
+# Basic block translator for FastCPU.
+# A basic block starts at the pc execution reaches and runs up to and including the first
+# branch, JAL, JALR or ECALL. The block is turned into the source of one Python function that keeps
+# the registers it uses in locals, compiled once and cached by its entry pc.
+# Fixed pairs compilers emit (lui+addi, auipc+jalr, slt+branch, addi+branch) are fused into one operation of
+# the block, with the same register writes as the two instructions.
+
+from functools import partial
+import time
+from mem import Memory
+from CPU import RunResult, stopReason, STOP_UNTIL_PC, STOP_BREAKPOINT, STOP_PC_OUT_OF_RANGE, STOP_STEP_LIMIT, \
+    _add_text_base, _add_text_limit
+from fastcpu import FastCPU, _div, _divu, _rem, _remu
+import tracing
+
+_max_block_length = 256  # instructions
+
+# Instructions that end a block
+_terminators = ('beq', 'bne', 'blt', 'bge', 'bltu', 'bgeu', 'jal', 'jalr', 'ecall')
+
+# Expression templates. {a} and {b} are the values of rs1 and rs2, {imm} the immediate.
+# {sa} and {sb} are the signed values of rs1 and rs2.
+_expressions = {
+    'add': '({a} + {b}) & 0xffffffff',
+    'sub': '({a} - {b}) & 0xffffffff',
+    'sll': '({a} << ({b} & 0x1f)) & 0xffffffff',
+    'slt': 'int({sa} < {sb})',
+    'sltu': 'int({a} < {b})',
+    'xor': '{a} ^ {b}',
+    'srl': '{a} >> ({b} & 0x1f)',
+    'sra': '({sa} >> ({b} & 0x1f)) & 0xffffffff',
+    'or': '{a} | {b}',
+    'and': '{a} & {b}',
+    'mul': '({a} * {b}) & 0xffffffff',
+    'mulh': '(({sa} * {sb}) >> 32) & 0xffffffff',
+    'mulhsu': '(({sa} * {b}) >> 32) & 0xffffffff',
+    'mulhu': '({a} * {b}) >> 32',
+    'div': '_div({a}, {b})',
+    'divu': '_divu({a}, {b})',
+    'rem': '_rem({a}, {b})',
+    'remu': '_remu({a}, {b})',
+    'addi': '({a} + {imm}) & 0xffffffff',
+    'slti': 'int({sa} < {imm})',
+    'sltiu': 'int({a} < {uimm})',
+    'xori': '{a} ^ {uimm}',
+    'ori': '{a} | {uimm}',
+    'andi': '{a} & {uimm}',
+    'slli': '({a} << {imm}) & 0xffffffff',
+    'srli': '{a} >> {imm}',
+    'srai': '({sa} >> {imm}) & 0xffffffff',
+    'lui': '{uimm}',
+    'auipc': '{auipc}',
+    'lb': '((_read_byte(({a} + {imm}) & 0xffffffff) ^ 0x80) - 0x80) & 0xffffffff',
+    'lh': '((_read_halfword(({a} + {imm}) & 0xffffffff) ^ 0x8000) - 0x8000) & 0xffffffff',
+    'lw': '_read_word(({a} + {imm}) & 0xffffffff)',
+    'lbu': '_read_byte(({a} + {imm}) & 0xffffffff)',
+    'lhu': '_read_halfword(({a} + {imm}) & 0xffffffff)',
+}
+_stores = {'sb': ('_write_byte', 1), 'sh': ('_write_halfword', 2), 'sw': ('_write_word', 4)}
+_conditions = {
+    'beq': '{a} == {b}',
+    'bne': '{a} != {b}',
+    'blt': '{sa} < {sb}',
+    'bge': '{sa} >= {sb}',
+    'bltu': '{a} < {b}',
+    'bgeu': '{a} >= {b}',
+}
+
+# Fused pairs, first instruction then second. A pair is fused when the second one reads the rd of the first,
+# slt+branch only when the branch is a beqz or bnez of it
+_fusion_patterns = ('lui+addi', 'auipc+jalr', 'slt+branch', 'addi+branch')
+_fused_branches = (2, 3)
+# slt, sltu, slti and sltiu as the condition a fused beqz/bnez of their rd tests
+_set_less_than = {
+    'slt': '{sa} < {sb}',
+    'sltu': '{a} < {b}',
+    'slti': '{sa} < {imm}',
+    'sltiu': '{a} < {uimm}',
+}
+
+# Names the generated code can use. Bound to locals through default arguments, see _header.
+_header = ('def block(cpu=cpu, regs=regs, _read_byte=_read_byte, _read_halfword=_read_halfword, '
+           '_read_word=_read_word, _write_byte=_write_byte, _write_halfword=_write_halfword, '
+           '_write_word=_write_word, _div=_div, _divu=_divu, _rem=_rem, _remu=_remu, _fused=_fused):')
+
+
+def translatable(name: str) -> bool:
+    return name in _expressions or name in _stores or name in _conditions or name in ('jal', 'jalr', 'ecall')
+
+
+def _reg(index: int) -> str:
+    return 'x{}'.format(index) if index else '0'
+
+
+def _signed(expression: str) -> str:
+    if expression == '0':
+        return '0'
+    return '(({} ^ 0x80000000) - 0x80000000)'.format(expression)
+
+
+def _fields(pc: int, decoded) -> dict:
+    """
+    Returns: the values the _expressions and _conditions templates of the instruction at pc are formatted with
+    """
+    a, b = _reg(decoded.rs1 or 0), _reg(decoded.rs2 or 0)
+    return {'a': a, 'b': b, 'sa': _signed(a), 'sb': _signed(b), 'imm': decoded.imm,
+            'uimm': (decoded.imm or 0) & 0xffffffff, 'auipc': (pc + (decoded.imm or 0)) & 0xffffffff}
+
+
+def findFusions(instructions: list) -> dict:
+    """
+    Find the pairs of a block to fuse. A pair does not overlap another one.
+    Args:
+        instructions: list of (pc, DecodedInstruction) of the block
+    Returns: {index of the first instruction of a pair: index of its pattern in _fusion_patterns}
+    """
+    fusions = dict()
+    index = 0
+    while index < len(instructions) - 1:
+        first, second = instructions[index][1], instructions[index + 1][1]
+        rd = first.rd
+        pattern = None
+        if rd and second.rs1 == rd:
+            if first.name == 'lui' and second.name == 'addi':
+                pattern = 0
+            elif first.name == 'auipc' and second.name == 'jalr':
+                pattern = 1
+        if pattern is None and rd and second.name in _conditions and rd in (second.rs1, second.rs2):
+            if first.name in _set_less_than and second.name in ('beq', 'bne') and {second.rs1, second.rs2} == {rd, 0}:
+                pattern = 2
+            elif first.name == 'addi' and first.rs1 == rd:  # A loop counter
+                pattern = 3
+        if pattern is None:
+            index += 1
+        else:
+            fusions[index] = pattern
+            index += 2
+    return fusions
+
+
+def generateBlock(instructions: list, fusions: dict = None, count_fusions: bool = False) -> str:
+    """
+    Generate the source of the function running a basic block.
+    Args:
+        instructions: list of (pc, DecodedInstruction), all translatable, only the last one may be a terminator
+        fusions: pairs to fuse, see findFusions()
+        count_fusions: count each fused pair run in _fused, indexed like _fusion_patterns
+    Returns: Python source defining block(), which returns the number of instructions it retired
+    """
+    fusions = fusions or dict()
+    used = set()
+    written = set()
+    for pc, decoded in instructions:
+        for reg in (decoded.rd, decoded.rs1, decoded.rs2):
+            if reg:
+                used.add(reg)
+        if decoded.rd:
+            written.add(decoded.rd)
+    writeback = ['regs[{}] = x{}'.format(reg, reg) for reg in sorted(written)]
+
+    body = []
+    tail = []
+    seconds = {index + 1: pattern for index, pattern in fusions.items()}  # second instruction of a pair -> pattern
+    for count, (pc, decoded) in enumerate(instructions, 1):
+        if count_fusions and count - 1 in fusions:
+            body.append('_fused[{}] += 1'.format(fusions[count - 1]))
+        if fusions.get(count - 1) in _fused_branches:
+            last_pc = pc
+            continue  # Computed by the branch, which ends the block
+        name = decoded.name
+        fields = _fields(pc, decoded)
+        a, b = fields['a'], fields['b']
+        target = 'x{}'.format(decoded.rd) if decoded.rd else '_'
+        pattern = seconds.get(count - 1)
+        if pattern is not None:
+            first_pc, first = instructions[count - 2]
+            if pattern == 0:
+                # lui+addi: one constant, which replaces the lui when both write the same register
+                if decoded.rd == first.rd:
+                    body.pop()
+                body.append('{} = {}'.format(target, ((first.imm & 0xffffffff) + decoded.imm) & 0xffffffff))
+                last_pc = pc
+                continue
+            if pattern == 1:
+                # auipc+jalr: a far call or jump to a known target
+                body.append('{} = {}'.format(target, (pc + 4) & 0xffffffff))
+                tail.append('cpu.pc = {}'.format((first_pc + first.imm + decoded.imm) & 0xfffffffe))
+                tail.append('cpu.jump_flag = True')
+                continue
+            taken, not_taken = (pc + decoded.imm) & 0xffffffff, (pc + 4) & 0xffffffff
+            if pattern == 2:
+                # slt+branch: branch on the comparison itself, rd gets the constant of the way taken
+                if name == 'beq':
+                    taken, not_taken = not_taken, taken
+                body.append('if {}:'.format(_set_less_than[first.name].format(**_fields(first_pc, first))))
+                body.append('    x{} = 1'.format(first.rd))
+                body.append('    cpu.pc = {}'.format(taken))
+                body.append('else:')
+                body.append('    x{} = 0'.format(first.rd))
+                body.append('    cpu.pc = {}'.format(not_taken))
+            else:
+                # addi+branch: the counter is stepped inside the condition that tests it
+                step = '(x{} := ({} + {}) & 0xffffffff)'.format(first.rd, _reg(first.rs1), first.imm)
+                if decoded.rs1 == first.rd:
+                    fields['a'], fields['sa'] = step, _signed(step)
+                else:
+                    fields['b'], fields['sb'] = step, _signed(step)
+                body.append('if {}:'.format(_conditions[name].format(**fields)))
+                body.append('    cpu.pc = {}'.format(taken))
+                body.append('else:')
+                body.append('    cpu.pc = {}'.format(not_taken))
+            tail.append('cpu.jump_flag = True')  # pc is already past the branch either way
+            continue
+        if name in _expressions:
+            if name in ('lb', 'lh', 'lw', 'lbu', 'lhu'):
+                body.append('at = {}'.format(pc))  # pc to report if the access faults
+            body.append('{} = {}'.format(target, _expressions[name].format(**fields)))
+        elif name in _stores:
+            write, width = _stores[name]
+            body.append('at = {}'.format(pc))
+            body.append('address = ({} + {}) & 0xffffffff'.format(a, decoded.imm))
+            body.append('{}(address, {})'.format(write, b))
+            # Self-modifying code: stop here so the rest of the block is not run from stale code
+            body.append('if address < {}:'.format(_add_text_limit))
+            body.extend('    ' + line for line in writeback)
+            body.append('    cpu.invalidate(address, {})'.format(width))
+            body.append('    cpu.pc = {}'.format(pc))
+            body.append('    cpu.jump_flag = False')
+            body.append('    return {}'.format(count))
+        elif name in _conditions:
+            tail.append('if {}:'.format(_conditions[name].format(**fields)))
+            tail.append('    cpu.pc = {}'.format((pc + decoded.imm) & 0xffffffff))
+            tail.append('    cpu.jump_flag = True')
+            tail.append('else:')
+            tail.append('    cpu.pc = {}'.format(pc))
+            tail.append('    cpu.jump_flag = False')
+        elif name == 'jal':
+            body.append('{} = {}'.format(target, (pc + 4) & 0xffffffff))
+            tail.append('cpu.pc = {}'.format((pc + decoded.imm) & 0xffffffff))
+            tail.append('cpu.jump_flag = True')
+        elif name == 'jalr':
+            body.append('address = ({} + {}) & 0xfffffffe'.format(a, decoded.imm))  # rs1 is read before rd is written
+            body.append('{} = {}'.format(target, (pc + 4) & 0xffffffff))
+            tail.append('cpu.pc = address')
+            tail.append('cpu.jump_flag = True')
+        elif name == 'ecall':
+            # The syscall layer works on the register list, so it must be up to date
+            body.append('at = {}'.format(pc))
+            body.extend(writeback)
+            body.append('cpu.pc = {}'.format(pc))
+            body.append('cpu.ecall()')
+            tail.append('cpu.pc = {}'.format(pc))
+            tail.append('cpu.jump_flag = False')
+        if name not in _terminators:
+            last_pc = pc
+    if not tail:
+        # Block ended without a jump: leave pc on the last instruction so the caller steps past it
+        tail = ['cpu.pc = {}'.format(last_pc), 'cpu.jump_flag = False']
+
+    lines = [_header]
+    lines.extend('    x{} = regs[{}]'.format(reg, reg) for reg in sorted(used))
+    lines.append('    at = {}'.format(instructions[0][0]))
+    lines.append('    try:')
+    lines.extend('        ' + line for line in body or ['pass'])  # A lone branch has no body
+    lines.append('    except BaseException:')
+    # Leave the registers and pc at the instruction that raised, e.g. a fault or the exit syscall
+    lines.extend('        ' + line for line in writeback or ['pass'])
+    lines.append('        cpu.pc = at')
+    lines.append('        raise')
+    if name != 'ecall':
+        lines.extend('    ' + line for line in writeback)
+    lines.extend('    ' + line for line in tail)
+    lines.append('    return {}'.format(len(instructions)))
+    return '\n'.join(lines) + '\n'
+
+
+class TranslatingCPU(FastCPU):
+    """
+        FastCPU that runs whole basic blocks as compiled Python functions.
+        Each call to fetch() runs one block (or one instruction, if the block at pc can not be translated)
+        and leaves pc and jump_flag the way FastCPU.fetch() leaves them after the last instruction of the block.
+    """
+    def __init__(self, ram: Memory, trace: int = tracing.TRACE_OFF):
+        FastCPU.__init__(self, ram, trace)
+        self.blocks = dict()  # entry pc -> compiled block, or None if pc can not be translated
+        self.block_lengths = dict()  # entry pc -> number of instructions in the block
+        self.block_code = dict()  # entry pc -> code object of the block, for codecache.py
+        self.split_pcs = set()  # pcs that must start a block, so run() can stop on them
+        # False while every instruction has to go through fetch(), for a trace or the profiler
+        self.translate_enabled = trace == tracing.TRACE_OFF
+        # For each word of the text section, the entry pcs of the blocks that contain it
+        self.block_owners = [None] * ((_add_text_limit - _add_text_base) >> 2)
+        self.fusion_enabled = True  # Fuse the pairs of _fusion_patterns in the blocks translated from now on
+        self.count_fusions = False  # Count the fused pairs run, in fused, in the blocks translated from now on
+        self.fusions = [0] * len(_fusion_patterns)  # Pairs fused in the translated blocks, per pattern
+        self.fused = [0] * len(_fusion_patterns)    # Fused pairs run, per pattern, while count_fusions
+        self._namespace = {
+            'cpu': self, 'regs': self.regs,
+            '_div': _div, '_divu': _divu, '_rem': _rem, '_remu': _remu, '_fused': self.fused,
+        }
+        if trace != tracing.TRACE_OFF:
+            # A trace shows every instruction, so run them one at a time on the interpreter
+            self.fetch = tracing.traced(self, partial(FastCPU.fetch, self), trace)
+
+    def fetch(self):
+        pc = self.pc
+        block = self.blocks.get(pc, False)
+        if block is False:
+            block = self.translate(pc)
+        if block is None:
+            FastCPU.fetch(self)  # Fall back to the interpreter
+            return 1
+        self.regs[0] = 0
+        return block()
+
+    def run(self, max_steps: int = None, until_pc: int = None) -> RunResult:
+        """
+        Same as CPU.run(), running whole blocks. A block that would retire more than max_steps
+        runs one instruction at a time on the interpreter instead, so the limit is exact.
+        """
+        if not self.translate_enabled:
+            return FastCPU.run(self, max_steps, until_pc)
+        stops = self.breakpoints if until_pc is None else self.breakpoints | {until_pc}
+        for stop in stops - self.split_pcs:
+            # Make each pc to stop on the start of a block, so no block runs past it
+            self.split_pcs.add(stop)
+            self.invalidate(stop, 4)
+        blocks = self.blocks
+        block_lengths = self.block_lengths
+        regs = self.regs
+        retired = 0
+        exit_code = None
+        fault_address = None
+        start = time.perf_counter()
+        try:
+            while True:
+                pc = self.pc
+                if pc in stops:
+                    reason = STOP_UNTIL_PC if pc == until_pc else STOP_BREAKPOINT
+                    break
+                if not _add_text_base <= pc < _add_text_limit:
+                    reason = STOP_PC_OUT_OF_RANGE
+                    break
+                if retired == max_steps:
+                    reason = STOP_STEP_LIMIT
+                    break
+                block = blocks.get(pc, False)
+                if block is False:
+                    block = self.translate(pc)
+                if block is None or (max_steps is not None and retired + block_lengths[pc] > max_steps):
+                    FastCPU.fetch(self)
+                    retired += 1
+                else:
+                    regs[0] = 0
+                    retired += block()
+                if not self.jump_flag:
+                    self.pc += 4
+        except Exception as signal:
+            # A block leaves pc on the instruction that raised, count the ones before it
+            retired += (self.pc - pc) >> 2
+            reason, exit_code, fault_address, completed = stopReason(self, signal)
+            retired += completed
+        return RunResult(reason, exit_code, retired, time.perf_counter() - start, self.pc, fault_address)
+
+    def translate(self, entry: int):
+        """
+        Translate the basic block starting at entry and cache it.
+        Returns: the compiled block, or None if the first instruction can not be translated
+        """
+        instructions = []
+        pc = entry
+        while _add_text_base <= pc < _add_text_limit and len(instructions) < _max_block_length:
+            decoded = self.lookup(pc)
+            if not translatable(decoded.name):
+                break
+            instructions.append((pc, decoded))
+            if decoded.name in _terminators or pc + 4 in self.split_pcs:
+                break
+            pc += 4
+        block = None
+        if instructions:
+            fusions = findFusions(instructions) if self.fusion_enabled else None
+            for pattern in (fusions or dict()).values():
+                self.fusions[pattern] += 1
+            block = self.compileBlock(entry, generateBlock(instructions, fusions, self.count_fusions))
+        self._addBlock(entry, block, len(instructions))
+        return block
+
+    def _addBlock(self, entry: int, block, length: int):
+        if _add_text_base <= entry < _add_text_limit:
+            self.blocks[entry] = block
+            self.block_lengths[entry] = length
+            last = entry + 4 * (length - 1) if length else entry  # The instructions of a block follow each other
+            for index in range((entry - _add_text_base) >> 2, ((last - _add_text_base) >> 2) + 1):
+                if self.block_owners[index] is None:
+                    self.block_owners[index] = []
+                self.block_owners[index].append(entry)
+
+    def loadBlock(self, entry: int, length: int, code):
+        """
+        Install a block translated before, by this CPU or an earlier run (see codecache.py)
+        Args:
+            length: instructions in the block
+            code: its code object, as compileBlock() made it
+        """
+        self.block_code[entry] = code
+        self._addBlock(entry, self.bindBlock(code), length)
+
+    def fusionReport(self) -> str:
+        lines = ['Fused pairs:', '  {:<12} {:>10} {:>14}'.format('pattern', 'translated', 'run')]
+        for pattern, name in enumerate(_fusion_patterns):
+            lines.append('  {:<12} {:>10} {:>14}'.format(
+                name, self.fusions[pattern], self.fused[pattern] if self.count_fusions else '-'))
+        return '\n'.join(lines) + '\n'
+
+    def compileBlock(self, entry: int, source: str):
+        code = compile(source, '<block {}>'.format(hex(entry)), 'exec')
+        self.block_code[entry] = code
+        return self.bindBlock(code)
+
+    def bindBlock(self, code):
+        ram = self.ram
+        # The memory methods are taken when the block is compiled, watchpoints replace them (see mem.py)
+        namespace = dict(self._namespace, _read_byte=ram.readAsInt, _read_halfword=ram.readHalfWordAsInt,
+                         _read_word=ram.readWordAsInt, _write_byte=ram.writeByte, _write_halfword=ram.writeHalfWord,
+                         _write_word=ram.writeWord)
+        exec(code, namespace)
+        return namespace['block']
+
+    def invalidate(self, address: int, width: int = 1):
+        """
+        Drop the cached decodes and every block containing address .. address+width-1.
+        """
+        FastCPU.invalidate(self, address, width)
+        first = max(address, _add_text_base)
+        last = min(address + width - 1, _add_text_limit - 1)
+        for index in range((first - _add_text_base) >> 2, ((last - _add_text_base) >> 2) + 1):
+            owners = self.block_owners[index]
+            if owners:
+                for entry in owners:
+                    self.blocks.pop(entry, None)
+                    self.block_code.pop(entry, None)
+                self.block_owners[index] = None